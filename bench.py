@@ -0,0 +1,441 @@
+import ast
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import GeneratorType
+from compiler import astnodes
+from compiler.compiler import Compiler
+from compiler.parser import Parser, ParseError
+from compiler.typechecker import TypeChecker
+from compiler.binary import encode, decode, CONSTRUCTOR_ARGS
+from compiler.arena import Arena
+from compiler.schema import FIELDS, NODE, LIST, MAYBE
+from compiler.types import ClassValueType, ListValueType, FuncType
+
+def generate_program(n: int) -> str:
+    # a well-typed program with n classes, functions and globals
+    decls = []
+    stmts = []
+    for i in range(n):
+        decls.append(F"""class A{i}(object):
+    x: int = {i}
+    name: str = "a{i}"
+    def __init__(self: "A{i}"):
+        self.x = self.x + {i}
+    def get(self: "A{i}", y: int) -> int:
+        return self.x * y - (y // 3) % 5
+
+def f{i}(a: int, b: [int]) -> int:
+    c: int = 0
+    s: str = ""
+    for c in b:
+        a = a + c * 2 - (c // 3) % 5
+        s = s + "x"
+    if a > 10 and not (a == 3 or len(s) < 2):
+        return a
+    elif a < -10:
+        return -a
+    else:
+        return A{i}().get(len(b)) + len([1, 2, 3] + b)
+
+x{i}: int = {i}
+""")
+        stmts.append(F"x{i} = f{i}(x{i}, [1, 2, x{i}])\nprint(x{i} if x{i} > 0 else -x{i})\n")
+    return "\n".join(decls) + "\n" + "".join(stmts)
+
+def best_time(fn, repeat: int = 5) -> float:
+    # best wall time of several runs, in seconds
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def report(name: str, seconds: float, baseline: float = None):
+    line = "  {:<40} {:>10.2f} ms".format(name, seconds * 1000)
+    if baseline is not None:
+        line += "  ({:.2f}x)".format(baseline / seconds)
+    print(line)
+
+# BINARY AST FORMAT
+
+def type_from_json(d):
+    if d["kind"] == "ClassValueType":
+        return ClassValueType(d["className"])
+    if d["kind"] == "ListValueType":
+        return ListValueType(type_from_json(d["elementType"]))
+    return FuncType([type_from_json(p) for p in d["parameters"]], type_from_json(d["returnType"]))
+
+def node_from_json(d):
+    # rebuild AST nodes from their JSON, for comparison with the binary loader
+    values = {}
+    for key, attr, shape in FIELDS[d["kind"]]:
+        v = d.get(key)
+        if shape == NODE or (shape == MAYBE and v is not None):
+            v = node_from_json(v)
+        elif shape == LIST:
+            v = [node_from_json(c) for c in v]
+        values[attr] = v
+    node = getattr(astnodes, d["kind"])(d["location"][:2], *[values[a] for a in CONSTRUCTOR_ARGS[d["kind"]]])
+    node.errorMsg = d.get("errorMsg")
+    if "inferredType" in d:
+        node.inferredType = type_from_json(d["inferredType"])
+    return node
+
+def run_binary_bench():
+    print("Binary AST format vs JSON\n")
+    compiler = Compiler()
+    tree = compiler.compile(generate_program(500))[0]
+    text = json.dumps(tree.toJSON())
+    data = encode(tree)
+    print("  {:<40} {:>10d} bytes".format("JSON size", len(text)))
+    print("  {:<40} {:>10d} bytes  ({:.1f}x smaller)".format("binary size", len(data), len(text) / len(data)))
+    dump_json = best_time(lambda: json.dumps(tree.toJSON()))
+    report("serialize JSON (toJSON + dumps)", dump_json)
+    report("serialize binary", best_time(lambda: encode(tree)), dump_json)
+    load_json = best_time(lambda: node_from_json(json.loads(text)))
+    report("load JSON to nodes", load_json)
+    report("load JSON to dicts only (json.loads)", best_time(lambda: json.loads(text)))
+    report("load binary to nodes", best_time(lambda: decode(data)), load_json)
+    print()
+
+# LOWERING DISPATCH
+
+class NameLookup:
+    # stands in for a Parser's dispatch table, looking the handler up by name
+    # on every call, for the expression children lowerExpression dispatches
+    def __init__(self, cls):
+        self.cls = cls
+
+    def get(self, nodeType, default):
+        return getattr(self.cls, "visit_" + nodeType.__name__, default)
+
+class NameDispatchParser(Parser):
+    # the Parser as it was before its dispatch table: NodeVisitor.visit looks
+    # up 'visit_' + class name on every node
+    def visit(self, node):
+        try:
+            result = ast.NodeVisitor.visit(self, node)
+        except ParseError as e:
+            self.errors.append(e)
+            return
+        if isinstance(result, GeneratorType):
+            return self.lowerExpression(result, node)
+        if isinstance(result, astnodes.Node) and result.endLocation is None and hasattr(node, "end_lineno"):
+            result.endLocation = self.getEndLocation(node)
+        return result
+
+# (set after the class is created, which builds it a dispatch table)
+NameDispatchParser.handlers = NameLookup(NameDispatchParser)
+
+def run_lower_bench():
+    print("Lowering: dispatch table vs NodeVisitor name lookup\n")
+    for n in [100, 1000]:
+        tree = ast.parse(generate_program(n))
+        by_name = best_time(lambda: NameDispatchParser().visit(tree))
+        report("{:d} declarations, name lookup".format(n * 3), by_name)
+        report("{:d} declarations, dispatch table".format(n * 3), best_time(lambda: Parser().visit(tree)), by_name)
+    print()
+
+# NATIVE PARSER
+
+def run_parse_bench():
+    print("Parsing: ast.parse + Parser vs native parser\n")
+    for n in [100, 1000]:
+        source = generate_program(n)
+        python = best_time(lambda: Compiler().parseSource(source, Parser()))
+        report("{:d} declarations, ast.parse + lower".format(n * 3), python)
+        native = best_time(lambda: Compiler(native=True).parseSource(source, Parser()))
+        report("{:d} declarations, native".format(n * 3), native, python)
+    print()
+
+# DEEP EXPRESSIONS
+
+def run_depth_bench():
+    print("Deeply nested expressions: parse and typecheck time by depth\n")
+    for native, depths in [(False, [250, 500, 1000]), (True, [25000, 50000, 100000])]:
+        compiler = Compiler(native=native)
+        for depth in depths:
+            source = "x: int = 0\nx = " + " + ".join(["1"] * depth) + "\n"
+            seconds = best_time(lambda: compiler.compile(source), repeat=3)
+            name = "{:d} chained +, {}".format(depth, "native" if native else "ast.parse + lower")
+            print("  {:<40} {:>10.2f} ms  ({:.2f} us per level)".format(name, seconds * 1000, seconds * 1e6 / depth))
+    print()
+
+# PEAK MEMORY
+
+# parse and lower one file in a fresh interpreter, printing the peak memory
+# allocated while doing so in KiB; traced in the child, since its peak RSS can
+# be inherited from the parent that started it
+MEMORY_SCRIPT = """
+import sys, tracemalloc
+from compiler.compiler import Compiler
+from compiler.parser import Parser
+compiler = Compiler(lowMemory=sys.argv[2] == "1")
+tracemalloc.start()
+tree = compiler.parse(sys.argv[1], Parser())
+print(tracemalloc.get_traced_memory()[1] // 1024)
+"""
+
+def peak_memory(path: str, low_memory: bool) -> int:
+    # KiB of peak memory allocated by parsing path
+    out = subprocess.run([sys.executable, "-c", MEMORY_SCRIPT, path, "1" if low_memory else "0"],
+                         cwd=os.path.dirname(os.path.abspath(__file__)),
+                         capture_output=True, text=True, check=True).stdout
+    return int(out)
+
+def run_memory_bench():
+    print("Peak memory: parse and lower, holding both ASTs vs --low-memory\n")
+    for n in [1000, 4000]:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "program.py")
+            with open(path, "w") as f:
+                f.write(generate_program(n))
+            size = os.path.getsize(path) / 1024 ** 2
+            full = peak_memory(path, False)
+            low = peak_memory(path, True)
+        name = "{:d} declarations ({:.1f} MB)".format(n * 3, size)
+        print("  {:<40} {:>8.1f} MB -> {:>7.1f} MB  ({:.0f}% less)".format(
+            name, full / 1024, low / 1024, 100 * (full - low) / full if full > 0 else 0.0))
+    print()
+
+# NODE SIZE
+
+def unslotted_layout():
+    # for each node kind, a plain class laid out the way AST nodes were
+    # before __slots__: attributes in a per-instance __dict__
+    return {kind: type(kind, (), {}) for kind in FIELDS}
+
+def unslotted(tree: astnodes.Node, layout: dict) -> object:
+    # copy of a tree in the unslotted layout, with list locations; child
+    # lists are copied too, like the originals they stand in for
+    copies = {}
+    order = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        for _, attr, shape in FIELDS[node.kind]:
+            value = getattr(node, attr)
+            if shape == LIST:
+                stack.extend(value)
+            elif shape == NODE or (shape == MAYBE and value is not None):
+                stack.append(value)
+    for node in reversed(order):
+        copy = layout[node.kind]()
+        for cls in type(node).__mro__:
+            for attr in getattr(cls, "__slots__", ()):
+                value = getattr(node, attr)
+                if attr in ("location", "endLocation") and value is not None:
+                    value = list(value)
+                elif isinstance(value, list) and value and isinstance(value[0], astnodes.Node):
+                    value = [copies[id(v)] for v in value]
+                elif isinstance(value, astnodes.Node):
+                    value = copies[id(value)]
+                setattr(copy, attr, value)
+        copies[id(node)] = copy
+    return copies[id(tree)], len(order)
+
+def traced_bytes(fn):
+    # bytes allocated by fn that are still live when it returns, and its result
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        return tracemalloc.get_traced_memory()[0] - before, result
+    finally:
+        tracemalloc.stop()
+
+def run_node_memory_bench():
+    print("AST memory per node: a __dict__ per node vs slotted nodes with tuple locations vs an arena\n")
+    layout = unslotted_layout()
+    for n in [100, 1000]:
+        source = generate_program(n)
+        module = ast.parse(source)
+        astparser = Parser()
+        astparser.setSource(source)
+        slotted, tree = traced_bytes(lambda: astparser.visit(module))
+        TypeChecker().visit(tree)
+        plain, (_, count) = traced_bytes(lambda: unslotted(tree, layout))
+        arena = Arena()
+        stored, _ = traced_bytes(lambda: arena.add(tree))
+        name = "{:d} declarations ({:d} nodes)".format(n * 3, count)
+        print("  {:<40} {:>6.1f} B/node -> {:>6.1f} B/node -> {:>5.1f} B/node".format(
+            name, plain / count, slotted / count, stored / count))
+    print()
+
+# SCOPES
+
+class StackScopeTypeChecker(TypeChecker):
+    # the TypeChecker as it was before SymbolTable: a stack of per-scope
+    # tables, copied and scanned from the innermost scope out on every lookup
+    def __init__(self):
+        super().__init__()
+        self.symbolTable = [{name: stack[0][1] for name, stack in self.symbolTable.bindings.items()}]
+
+    def enterScope(self):
+        self.symbolTable.append({})
+
+    def exitScope(self):
+        self.symbolTable.pop()
+
+    def getType(self, var: str):
+        for table in self.symbolTable[::-1]:
+            if var in table:
+                return table[var]
+        return None
+
+    def getLocalType(self, var: str):
+        for table in self.symbolTable[1:][::-1]:
+            if var in table:
+                return table[var]
+        return None
+
+    def getNonLocalType(self, var: str):
+        for table in self.symbolTable[1:-1][::-1]:
+            if var in table:
+                return table[var]
+        return None
+
+    def getGlobal(self, var: str):
+        return self.symbolTable[0].get(var)
+
+    def addType(self, var: str, t):
+        self.symbolTable[-1][var] = t
+
+    def defInCurrentScope(self, var: str) -> bool:
+        return self.symbolTable[-1].get(var) is not None
+
+def generate_nested(depth: int, width: int) -> str:
+    # functions nested depth levels deep, each with width locals, reading a
+    # global and a variable of every enclosing scope once per local
+    lines = ["g: int = 1"]
+    for i in range(depth):
+        pad = "    " * i
+        lines.append(F"{pad}def f{i}(a{i}: int) -> int:")
+        for j in range(width):
+            lines.append(F"{pad}    v{i}_{j}: int = {j}")
+    for i in reversed(range(depth)):
+        pad = "    " * i
+        for j in range(width):
+            lines.append(F"{pad}    g")
+            lines.extend(F"{pad}    v{k}_{j}" for k in range(i + 1))
+        if i + 1 < depth:
+            lines.append(F"{pad}    return f{i + 1}(v{i}_0)")
+        else:
+            lines.append(F"{pad}    return a{i}")
+    lines.append("g = f0(g)")
+    return "\n".join(lines) + "\n"
+
+def run_scope_bench():
+    print("Typechecking deeply nested functions: stack of scope tables vs SymbolTable\n")
+    compiler = Compiler()
+    for depth, width in [(30, 20), (90, 20)]:
+        tree = compiler.compile(generate_nested(depth, width), typecheck=False)[0]
+        stack = best_time(lambda: StackScopeTypeChecker().visit(tree), repeat=3)
+        report("depth {:d}, stack of tables".format(depth), stack)
+        report("depth {:d}, SymbolTable".format(depth), best_time(lambda: TypeChecker().visit(tree), repeat=3), stack)
+    print()
+
+# SUBTYPING
+
+class WalkingTypeChecker(TypeChecker):
+    # the TypeChecker as it was before numbering the class tree: subclass
+    # checks walk up the superclass chain
+    def isSubClass(self, a: str, b: str) -> bool:
+        curr = a
+        while curr is not None:
+            if curr == b:
+                return True
+            curr = self.superclasses[curr]
+        return False
+
+def generate_hierarchy(n: int, depth: int) -> str:
+    # n classes in chains depth classes long under one root class, and a
+    # function taking the root class called with an instance of each class
+    lines = ["class R(object):\n    pass"]
+    for i in range(n):
+        superclass = "R" if i % depth == 0 else F"K{i - 1}"
+        lines.append(F"class K{i}({superclass}):\n    pass")
+    lines.append("def f(r: R) -> R:\n    return r")
+    lines.append("r: R = None")
+    for i in range(n):
+        lines.append(F"r = f(K{i}())")
+    return "\n".join(lines) + "\n"
+
+def run_subtype_bench():
+    print("Typechecking class hierarchies: walking superclasses vs numbered class tree\n")
+    compiler = Compiler()
+    for n, depth in [(2000, 20), (2000, 500), (5000, 5000)]:
+        tree = compiler.compile(generate_hierarchy(n, depth), typecheck=False)[0]
+        walking = best_time(lambda: WalkingTypeChecker().visit(tree), repeat=3)
+        name = "{:d} classes, depth {:d}".format(n, depth)
+        report(name + ", walking", walking)
+        report(name + ", intervals", best_time(lambda: TypeChecker().visit(tree), repeat=3), walking)
+    print()
+
+# JOINS
+
+class AncestorListTypeChecker(TypeChecker):
+    # the TypeChecker as join meant to work before binary lifting: compare the
+    # lists of superclasses of both classes from the root down
+    def commonSuperclass(self, a: str, b: str) -> str:
+        aAncestors = []
+        bAncestors = []
+        while a is not None:
+            aAncestors.append(a)
+            a = self.superclasses[a]
+        while b is not None:
+            bAncestors.append(b)
+            b = self.superclasses[b]
+        common = "object"
+        for x, y in zip(aAncestors[::-1], bAncestors[::-1]):
+            if x != y:
+                break
+            common = x
+        return common
+
+def generate_comb(depth: int, lists: int) -> str:
+    # a chain of classes K0 <- K1 <- ... with a leaf class L{i} under each,
+    # and list literals of the leaves from the deepest up, whose element
+    # type rises one level with every element
+    lines = ["class K0(object):\n    pass", "class L0(object):\n    pass"]
+    for i in range(1, depth):
+        lines.append(F"class K{i}(K{i - 1}):\n    pass\nclass L{i}(K{i - 1}):\n    pass")
+    elements = ", ".join(F"L{i}()" for i in reversed(range(1, depth)))
+    lines.extend(F"print([{elements}])" for _ in range(lists))
+    return "\n".join(lines) + "\n"
+
+def run_join_bench():
+    print("Joining class types in list literals: ancestor lists vs binary lifting\n")
+    compiler = Compiler()
+    for depth, lists in [(100, 20), (1000, 5), (4000, 2)]:
+        tree = compiler.compile(generate_comb(depth, lists), typecheck=False)[0]
+        ancestors = best_time(lambda: AncestorListTypeChecker().visit(tree), repeat=3)
+        name = "depth {:d}, {:d} elements".format(depth, (depth - 1) * lists)
+        report(name + ", ancestor lists", ancestors)
+        report(name + ", binary lifting", best_time(lambda: TypeChecker().visit(tree), repeat=3), ancestors)
+    print()
+
+BENCHMARKS = {
+    "binary": run_binary_bench,
+    "lower": run_lower_bench,
+    "parse": run_parse_bench,
+    "depth": run_depth_bench,
+    "memory": run_memory_bench,
+    "nodes": run_node_memory_bench,
+    "scopes": run_scope_bench,
+    "subtype": run_subtype_bench,
+    "join": run_join_bench,
+}
+
+def run_benchmarks(names: [str]):
+    for name in names:
+        BENCHMARKS[name]()
@@ -0,0 +1,98 @@
+import json
+import os
+import socket
+import sys
+
+# Thin client for the compile server started with `main.py --serve`.
+# This deliberately avoids importing the compiler package (and argparse),
+# so that a client invocation only pays for interpreter startup.
+
+USAGE = """usage: client.py [-t] [-o] [--socket PATH] infile [outfile]
+
+  -t             do not typecheck the AST
+  -o             output AST to stdout instead of to a JSON file
+  --socket PATH  socket of the compile server"""
+
+
+def defaultSocketPath() -> str:
+    # keep in sync with compiler/server.py
+    base = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(base, "chocopy-{:d}.sock".format(os.getuid()))
+
+
+class CompileClient:
+    # a connection to the compile server, which can be reused for many requests
+
+    def __init__(self, path: str = None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path if path is not None else defaultSocketPath())
+        self.rfile = self.sock.makefile("rb")
+
+    def compile(self, source: str, typecheck: bool = True, fname: str = "<unknown>") -> dict:
+        # returns {"ast": AST JSON or None, "errors": [str]}
+        # fname is the file name that syntax errors mention
+        request = json.dumps({"source": source, "typecheck": typecheck, "fname": fname})
+        self.sock.sendall(request.encode() + b"\n")
+        response = json.loads(self.rfile.readline())
+        if "error" in response:
+            raise Exception("Compile server error: " + response["error"])
+        return response
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+
+def main(argv):
+    typecheck = True
+    output = True
+    path = None
+    files = []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg == "-t":
+            typecheck = False
+        elif arg == "-o":
+            output = False
+        elif arg == "--socket" and i + 1 < len(argv):
+            i += 1
+            path = argv[i]
+        elif arg in ["-h", "--help"] or arg.startswith("-"):
+            print(USAGE)
+            return
+        else:
+            files.append(arg)
+        i += 1
+    if len(files) == 0 or len(files) > 2:
+        print("Error: must specify input file")
+        print(USAGE)
+        return
+    infile = files[0]
+    if len(files) == 2:
+        outfile = files[1]
+    elif typecheck:
+        outfile = infile + ".ast.typed"
+    else:
+        outfile = infile + ".ast"
+
+    with open(infile, "r") as f:
+        source = f.read()
+    client = CompileClient(path)
+    try:
+        response = client.compile(source, typecheck, os.path.basename(infile))
+    finally:
+        client.close()
+
+    for e in response["errors"]:
+        print(e)
+    if response["ast"] is not None:
+        if output:
+            with open(outfile, "w") as f:
+                json.dump(response["ast"], f)
+        else:
+            print(json.dumps(response["ast"]))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1 +1 @@
-pass
\ No newline at end of file
+__version__ = "0.3.0"
@@ -0,0 +1,331 @@
+from array import array
+from . import astnodes
+from .astnodes import Node
+from .binary import KINDS, KIND_CODES, CONSTRUCTOR_ARGS
+from .schema import FIELDS, NODE, LIST, MAYBE
+
+# Struct-of-arrays storage for large numbers of ASTs.
+#
+# An Arena holds nodes as integer handles into parallel array-module columns
+# instead of as objects: a kind code, the start and end location, an inferred
+# type ID and an offset into the links column. Locations and type IDs are kept
+# in 2-byte columns until some value doesn't fit, and then widened to 4 bytes.
+# Every kind has a fixed number of links, so offsets only take a byte: each is
+# relative to the start of its block of BLOCK nodes. Starting there, each
+# node has one link per schema field (see schema.py): the handle of a child
+# (-1 for a missing MAYBE child), the position in the lists column of a child
+# list (its length followed by the handles), or the index of a scalar value.
+# Types and scalar values are interned in tables, and error messages, which
+# few nodes have, are kept in a dict.
+#
+# Nodes are stored in post-order, so the subtree of a node is the contiguous
+# run of handles that ends with it, and whole trees can be scanned with plain
+# loops over the columns. NodeRef exposes the astnodes attributes of a stored
+# node without rebuilding it (writeJSON works on it directly), and
+# Arena.node rebuilds real astnodes objects, e.g. for the TypeChecker.
+
+NO_TYPE = -1
+NO_CHILD = -1
+NARROW = 0xffff  # largest location value the narrow columns hold
+BLOCK_BITS = 5
+BLOCK = 1 << BLOCK_BITS  # nodes per block of link offsets
+
+
+class Arena:
+
+    def __init__(self):
+        self.kinds = array("B")
+        self.narrow = True  # whether the location columns are still 2 bytes
+        self.lines = array("H")
+        self.cols = array("H")
+        self.endSpans = array("H")  # end line - start line + 1; 0 if the node has no end location
+        self.endCols = array("H")
+        self.typeIds = array("h")
+        self.offsets = array("B")  # start of each node's links, from its block's
+        self.blockOffsets = array("I")  # start of the links of each block
+        self.links = array("i")
+        self.lists = array("i")
+        self.types = []  # inferred types by ID
+        self.typeIndex = {}
+        self.values = []  # scalar values by index
+        self.valueIndex = {}  # (class, value) -> index, since True == 1
+        self.errors = {}  # handle -> errorMsg
+        self.starts = {}  # root handle of each added tree -> its first handle
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def typeId(self, t) -> int:
+        if t is None:
+            return NO_TYPE
+        i = self.typeIndex.get(t)
+        if i is None:
+            i = self.typeIndex[t] = len(self.types)
+            self.types.append(t)
+            if i == 0x8000 and self.typeIds.typecode == "h":
+                self.typeIds = array("i", self.typeIds)
+        return i
+
+    def widen(self):
+        # switch the location columns to 4 bytes
+        self.narrow = False
+        self.lines = array("I", self.lines)
+        self.cols = array("I", self.cols)
+        self.endSpans = array("I", self.endSpans)
+        self.endCols = array("I", self.endCols)
+
+    def valueId(self, v) -> int:
+        key = (v.__class__, v)
+        i = self.valueIndex.get(key)
+        if i is None:
+            i = self.valueIndex[key] = len(self.values)
+            self.values.append(v)
+        return i
+
+    def add(self, root: Node) -> int:
+        # store a tree, returning the handle of its root; walked in
+        # post-order with an explicit stack, like binary.Encoder.encode
+        start = len(self.kinds)
+        handles = []  # handles of stored nodes whose parent isn't stored yet
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                handles.append(self.record(node, handles))
+                continue
+            stack.append((node, True))
+            children = []
+            for _, attr, shape in FIELDS[node.kind]:
+                value = getattr(node, attr)
+                if shape == NODE or (shape == MAYBE and value is not None):
+                    children.append(value)
+                elif shape == LIST:
+                    children.extend(value)
+            for child in reversed(children):
+                stack.append((child, False))
+        handle = handles[0]
+        self.starts[handle] = start
+        return handle
+
+    def record(self, node: Node, handles: [int]) -> int:
+        # append one node whose children are the last handles, popping them
+        handle = len(self.kinds)
+        fields = FIELDS[node.kind]
+        nChildren = 0
+        for _, attr, shape in fields:
+            value = getattr(node, attr)
+            if shape == LIST:
+                nChildren += len(value)
+            elif shape == NODE or (shape == MAYBE and value is not None):
+                nChildren += 1
+        children = handles[len(handles) - nChildren:]
+        del handles[len(handles) - nChildren:]
+        line, col = node.location
+        end = node.endLocation
+        span, endCol = (0, 0) if end is None else (end[0] - line + 1, end[1])
+        if self.narrow and (line > NARROW or col > NARROW or span > NARROW or endCol > NARROW):
+            self.widen()
+        self.kinds.append(KIND_CODES[node.kind])
+        self.lines.append(line)
+        self.cols.append(col)
+        self.endSpans.append(span)
+        self.endCols.append(endCol)
+        self.typeIds.append(self.typeId(getattr(node, "inferredType", None)))
+        if handle & (BLOCK - 1) == 0:
+            self.blockOffsets.append(len(self.links))
+        self.offsets.append(len(self.links) - self.blockOffsets[-1])
+        if node.errorMsg is not None:
+            self.errors[handle] = node.errorMsg
+        links = self.links
+        i = 0
+        for _, attr, shape in fields:
+            if shape == NODE:
+                links.append(children[i])
+                i += 1
+            elif shape == MAYBE:
+                if getattr(node, attr) is None:
+                    links.append(NO_CHILD)
+                else:
+                    links.append(children[i])
+                    i += 1
+            elif shape == LIST:
+                n = len(getattr(node, attr))
+                links.append(len(self.lists))
+                self.lists.append(n)
+                self.lists.extend(children[i:i + n])
+                i += n
+            else:
+                links.append(self.valueId(getattr(node, attr)))
+        return handle
+
+    # reading nodes
+
+    def kind(self, handle: int) -> str:
+        return KINDS[self.kinds[handle]]
+
+    def location(self, handle: int) -> (int, int):
+        return (self.lines[handle], self.cols[handle])
+
+    def endLocation(self, handle: int) -> (int, int):
+        span = self.endSpans[handle]
+        if span == 0:
+            return None
+        return (self.lines[handle] + span - 1, self.endCols[handle])
+
+    def offset(self, handle: int) -> int:
+        # position of a node's first link
+        return self.blockOffsets[handle >> BLOCK_BITS] + self.offsets[handle]
+
+    def inferredType(self, handle: int):
+        i = self.typeIds[handle]
+        return None if i == NO_TYPE else self.types[i]
+
+    def setInferredType(self, handle: int, t):
+        self.typeIds[handle] = self.typeId(t)
+
+    def field(self, handle: int, attr: str):
+        # a schema field: a child handle (or None), a list of child handles,
+        # or a scalar value
+        index, shape = FIELD_INDEX[self.kinds[handle]][attr]
+        link = self.links[self.offset(handle) + index]
+        if shape == NODE:
+            return link
+        if shape == MAYBE:
+            return None if link == NO_CHILD else link
+        if shape == LIST:
+            n = self.lists[link]
+            return self.lists[link + 1:link + 1 + n].tolist()
+        return self.values[link]
+
+    def children(self, handle: int) -> [int]:
+        # child handles in schema order
+        result = []
+        offset = self.offset(handle)
+        for i, shape in enumerate(SHAPES[self.kinds[handle]]):
+            link = self.links[offset + i]
+            if shape == NODE or (shape == MAYBE and link != NO_CHILD):
+                result.append(link)
+            elif shape == LIST:
+                n = self.lists[link]
+                result.extend(self.lists[link + 1:link + 1 + n])
+        return result
+
+    def subtree(self, handle: int) -> range:
+        # handles of the subtree rooted at handle, in post-order; it starts
+        # at the subtree of the first child, all the way down
+        start = self.starts.get(handle)
+        if start is None:
+            start = handle
+            children = self.children(handle)
+            while children:
+                start = children[0]
+                children = self.children(start)
+        return range(start, handle + 1)
+
+    def count(self, kind: str, handle: int = None) -> int:
+        # number of nodes of a kind in a subtree (or the whole arena)
+        code = KIND_CODES[kind]
+        if handle is None:
+            return self.kinds.count(code)
+        r = self.subtree(handle)
+        return self.kinds[r.start:r.stop].count(code)
+
+    def ref(self, handle: int) -> "NodeRef":
+        return NodeRef(self, handle)
+
+    def node(self, handle: int) -> Node:
+        # rebuild the astnodes subtree rooted at handle, children first
+        r = self.subtree(handle)
+        built = [None] * len(r)
+        start = r.start
+        for h in r:
+            code = self.kinds[h]
+            kind = KINDS[code]
+            offset = self.offset(h)
+            values = {}
+            for i, (_, attr, shape) in enumerate(FIELDS[kind]):
+                link = self.links[offset + i]
+                if shape == NODE:
+                    values[attr] = built[link - start]
+                elif shape == MAYBE:
+                    values[attr] = None if link == NO_CHILD else built[link - start]
+                elif shape == LIST:
+                    n = self.lists[link]
+                    values[attr] = [built[c - start] for c in self.lists[link + 1:link + 1 + n]]
+                else:
+                    values[attr] = self.values[link]
+            node = CLASSES[code](self.location(h), *[values[a] for a in CONSTRUCTOR_ARGS[kind]])
+            node.endLocation = self.endLocation(h)
+            node.errorMsg = self.errors.get(h)
+            if self.typeIds[h] != NO_TYPE:
+                node.inferredType = self.types[self.typeIds[h]]
+            built[h - start] = node
+        return built[-1]
+
+
+# per kind code: node class, field shapes, and attr -> (link index, shape)
+CLASSES = [getattr(astnodes, kind) for kind in KINDS]
+SHAPES = [[shape for _, _, shape in FIELDS[kind]] for kind in KINDS]
+FIELD_INDEX = [{attr: (i, shape) for i, (_, attr, shape) in enumerate(FIELDS[kind])} for kind in KINDS]
+# the links of a whole block must fit the byte offsets
+assert (BLOCK - 1) * max(len(fields) for fields in FIELDS.values()) <= 0xff
+
+
+class NodeRef:
+    # read-only view of a stored node with the attributes of its astnodes
+    # class; children are NodeRefs too
+
+    __slots__ = ("arena", "handle")
+
+    def __init__(self, arena: Arena, handle: int):
+        self.arena = arena
+        self.handle = handle
+
+    @property
+    def kind(self) -> str:
+        return self.arena.kind(self.handle)
+
+    @property
+    def location(self) -> (int, int):
+        return self.arena.location(self.handle)
+
+    @property
+    def endLocation(self) -> (int, int):
+        return self.arena.endLocation(self.handle)
+
+    @property
+    def errorMsg(self) -> str:
+        return self.arena.errors.get(self.handle)
+
+    @property
+    def inferredType(self):
+        return self.arena.inferredType(self.handle)
+
+    def __getattr__(self, attr: str):
+        arena = self.arena
+        fields = FIELD_INDEX[arena.kinds[self.handle]]
+        if attr not in fields:
+            raise AttributeError("{} has no attribute {}".format(self.kind, attr))
+        shape = fields[attr][1]
+        value = arena.field(self.handle, attr)
+        if shape == LIST:
+            return [NodeRef(arena, h) for h in value]
+        if shape == NODE or (shape == MAYBE and value is not None):
+            return NodeRef(arena, value)
+        return value
+
+    def __eq__(self, other):
+        return isinstance(other, NodeRef) and self.arena is other.arena and self.handle == other.handle
+
+    def __hash__(self):
+        return hash(self.handle)
+
+    def getIdentifier(self):
+        if self.kind in ("GlobalDecl", "NonLocalDecl"):
+            return self.variable
+        if self.kind == "VarDef":
+            return self.var.identifier
+        return self.name
+
+    def toJSON(self):
+        return self.arena.node(self.handle).toJSON()
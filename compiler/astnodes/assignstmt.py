@@ -2,8 +2,9 @@ from .stmt import Stmt
 from .expr import Expr
 
 class AssignStmt(Stmt):
+    __slots__ = ("targets", "value")
 
-    def __init__(self, location:[int], targets:[Expr], value:Expr):
+    def __init__(self, location:(int, int), targets:[Expr], value:Expr):
         super().__init__(location, "AssignStmt")
         self.targets = targets
         self.value = value
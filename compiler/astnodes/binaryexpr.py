@@ -1,16 +1,18 @@
 from .expr import Expr
 
 class BinaryExpr(Expr):
+    __slots__ = ("left", "right", "operator")
 
-    def __init__(self, location:[int], left:Expr, operator:str, right:Expr):
+    def __init__(self, location:(int, int), left:Expr, operator:str, right:Expr):
         super().__init__(location, "BinaryExpr")
         self.left = left
         self.right = right
         self.operator = operator
 
-    def visit(self, typechecker):
-        typechecker.visit(self.left)
-        typechecker.visit(self.right)
+    def subexpressions(self) -> [Expr]:
+        return [self.left, self.right]
+
+    def check(self, typechecker):
         return typechecker.BinaryExpr(self)
 
     def toJSON(self):
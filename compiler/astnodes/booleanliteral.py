@@ -1,12 +1,13 @@
 from .literal import Literal
 
 class BooleanLiteral(Literal):
+    __slots__ = ()
 
-    def __init__(self, location:[int], value:bool):
+    def __init__(self, location:(int, int), value:bool):
         super().__init__(location, "BooleanLiteral")
         self.value = value
 
-    def visit(self, typechecker):
+    def check(self, typechecker):
         return typechecker.BooleanLiteral(self)
 
 
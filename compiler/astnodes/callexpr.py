@@ -2,15 +2,17 @@ from .expr import Expr
 from .identifier import Identifier
 
 class CallExpr(Expr):
+    __slots__ = ("function", "args")
 
-    def __init__(self, location:[int], function:Identifier, args:[Expr]):
+    def __init__(self, location:(int, int), function:Identifier, args:[Expr]):
         super().__init__(location, "CallExpr")
         self.function = function
         self.args = args
 
-    def visit(self, typechecker):
-        for a in self.args:
-            typechecker.visit(a)
+    def subexpressions(self) -> [Expr]:
+        return self.args
+
+    def check(self, typechecker):
         return typechecker.CallExpr(self)
 
     def toJSON(self):
@@ -4,8 +4,9 @@ from .vardef import VarDef
 from .funcdef import FuncDef
 
 class ClassDef(Declaration):
+    __slots__ = ("name", "superclass", "declarations", "summary")
 
-    def __init__(self, location:[int], name:Identifier, superclass:Identifier, declarations:[Declaration]):
+    def __init__(self, location:(int, int), name:Identifier, superclass:Identifier, declarations:[Declaration]):
         super().__init__(location, "ClassDef")
         self.name = name
         self.superclass = superclass
@@ -15,6 +16,7 @@ class ClassDef(Declaration):
             if isinstance(d, FuncDef):
                 d.isMethod = True
         self.declarations = declarations
+        self.summary = None  # declaration summary from the parser, see summary.py
 
     def visit(self, typechecker):
         typechecker.ClassDef(self)
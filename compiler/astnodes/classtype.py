@@ -1,8 +1,9 @@
 from .typeannotation import TypeAnnotation
 
 class ClassType(TypeAnnotation):
+    __slots__ = ("className",)
 
-    def __init__(self, location:[int], className:str):
+    def __init__(self, location:(int, int), className:str):
         super().__init__(location, "ClassType")
         self.className = className
 
@@ -1,6 +1,7 @@
 from .node import Node
 
 class Declaration(Node):
+    __slots__ = ()
 
-    def __init__(self, location:[int], kind:str):
+    def __init__(self, location:(int, int), kind:str):
         super().__init__(location, kind)
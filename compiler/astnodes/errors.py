@@ -2,8 +2,9 @@ from .node import Node
 from .compilererror import CompilerError
 
 class Errors(Node):
+    __slots__ = ("errors",)
 
-    def __init__(self, location:[int], errors:[CompilerError]):
+    def __init__(self, location:(int, int), errors:[CompilerError]):
         super().__init__(location, "Errors")
         self.errors = errors
 
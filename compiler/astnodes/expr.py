@@ -1,11 +1,38 @@
 from .node import Node
 
 class Expr(Node):
+    __slots__ = ("inferredType",)
 
-    def __init__(self, location:[int], kind:str):
+    def __init__(self, location:(int, int), kind:str):
         super().__init__(location, kind)
         self.inferredType = None
 
+    def subexpressions(self) -> ["Expr"]:
+        # the children that are typechecked before this node, in order
+        return ()
+
+    def check(self, typechecker):
+        # typecheck this node, once its subexpressions have been checked
+        raise Exception('operation not supported')
+
+    def visit(self, typechecker):
+        # check every node after its subexpressions without recursing, so
+        # deeply nested expressions don't hit the recursion limit: a pre-order
+        # walk that takes children right to left, reversed, is a post-order
+        # walk that takes them left to right
+        children = self.subexpressions()
+        if not children:
+            return self.check(typechecker)
+        order = [self]
+        stack = list(children)
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(node.subexpressions())
+        for i in range(len(order) - 1, 0, -1):
+            order[i].check(typechecker)
+        return self.check(typechecker)
+
     def toJSON(self):
         d = super().toJSON()
         if self.inferredType is not None:
@@ -2,8 +2,9 @@ from .stmt import Stmt
 from .expr import Expr
 
 class ExprStmt(Stmt):
+    __slots__ = ("expr",)
 
-    def __init__(self, location:[int], expr:Expr):
+    def __init__(self, location:(int, int), expr:Expr):
         super().__init__(location, "ExprStmt")
         self.expr = expr
 
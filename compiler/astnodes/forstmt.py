@@ -3,8 +3,9 @@ from .expr import Expr
 from .identifier import Identifier
 
 class ForStmt(Stmt):
+    __slots__ = ("identifier", "iterable", "body")
 
-    def __init__(self, location:[int], identifier:Identifier, iterable:Expr, body:[Stmt]):
+    def __init__(self, location:(int, int), identifier:Identifier, iterable:Expr, body:[Stmt]):
         super().__init__(location, "ForStmt")
         self.identifier = identifier
         self.iterable = iterable
@@ -5,13 +5,14 @@ from .typeannotation import TypeAnnotation
 from .stmt import Stmt
 
 class FuncDef(Declaration):
+    __slots__ = ("name", "params", "returnType", "declarations", "statements", "isMethod", "summary")
 
     # The AST for
     #     def NAME(PARAMS) -> RETURNTYPE:
     #         DECLARATIONS
     #         STATEMENTS
 
-    def __init__(self, location:[int], name:Identifier, params:[TypedVar], returnType:TypeAnnotation, 
+    def __init__(self, location:(int, int), name:Identifier, params:[TypedVar], returnType:TypeAnnotation, 
         declarations:[Declaration], statements:[Stmt], isMethod:bool = False):
         super().__init__(location, "FuncDef")
         self.name = name
@@ -20,6 +21,7 @@ class FuncDef(Declaration):
         self.declarations = declarations
         self.statements = [s for s in statements if s is not None]
         self.isMethod = isMethod
+        self.summary = None  # declaration summary from the parser, see summary.py
 
     def visit(self, typechecker):
         return typechecker.FuncDef(self)
@@ -2,8 +2,9 @@ from .declaration import Declaration
 from .identifier import Identifier
 
 class GlobalDecl(Declaration):
+    __slots__ = ("variable",)
 
-    def __init__(self, location:[int], variable:Identifier):
+    def __init__(self, location:(int, int), variable:Identifier):
         super().__init__(location, "GlobalDecl")
         self.variable = variable
 
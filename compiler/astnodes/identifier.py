@@ -1,12 +1,13 @@
 from .expr import Expr
 
 class Identifier(Expr):
+    __slots__ = ("name",)
 
-    def __init__(self, location:[int], name:str):
+    def __init__(self, location:(int, int), name:str):
         super().__init__(location, "Identifier")
         self.name = name
 
-    def visit(self, typechecker):
+    def check(self, typechecker):
         return typechecker.Identifier(self)
 
     def toJSON(self):
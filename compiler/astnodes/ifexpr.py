@@ -1,17 +1,18 @@
 from .expr import Expr
 
 class IfExpr(Expr):
+    __slots__ = ("condition", "thenExpr", "elseExpr")
 
-    def __init__(self, location:[int], condition:Expr, thenExpr:Expr, elseExpr:Expr):
+    def __init__(self, location:(int, int), condition:Expr, thenExpr:Expr, elseExpr:Expr):
         super().__init__(location, "IfExpr")
         self.condition = condition
         self.thenExpr = thenExpr
         self.elseExpr = elseExpr
 
-    def visit(self, typechecker):
-        typechecker.visit(self.condition)
-        typechecker.visit(self.thenExpr)
-        typechecker.visit(self.elseExpr)
+    def subexpressions(self) -> [Expr]:
+        return [self.condition, self.thenExpr, self.elseExpr]
+
+    def check(self, typechecker):
         return typechecker.IfExpr(self)
 
     def toJSON(self):
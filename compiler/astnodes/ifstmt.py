@@ -2,8 +2,9 @@ from .stmt import Stmt
 from .expr import Expr
 
 class IfStmt(Stmt):
+    __slots__ = ("condition", "thenBody", "elseBody")
 
-    def __init__(self, location:[int], condition:Expr, thenBody:[Stmt], elseBody:[Stmt]):
+    def __init__(self, location:(int, int), condition:Expr, thenBody:[Stmt], elseBody:[Stmt]):
         super().__init__(location, "IfStmt")
         self.condition = condition
         self.thenBody = [s for s in thenBody if s is not None]
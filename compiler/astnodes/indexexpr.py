@@ -1,15 +1,17 @@
 from .expr import Expr
 
 class IndexExpr(Expr):
+    __slots__ = ("list", "index")
 
-    def __init__(self, location:[int], lst:Expr, index:Expr):
+    def __init__(self, location:(int, int), lst:Expr, index:Expr):
         super().__init__(location, "IndexExpr")
         self.list = lst
         self.index = index
 
-    def visit(self, typechecker):
-        typechecker.visit(self.list)
-        typechecker.visit(self.index)
+    def subexpressions(self) -> [Expr]:
+        return [self.list, self.index]
+
+    def check(self, typechecker):
         return typechecker.IndexExpr(self)
 
     def toJSON(self):
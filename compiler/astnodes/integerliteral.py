@@ -1,10 +1,11 @@
 from .literal import Literal
 
 class IntegerLiteral(Literal):
+    __slots__ = ()
 
-    def __init__(self, location:[int], value:int):
+    def __init__(self, location:(int, int), value:int):
         super().__init__(location, "IntegerLiteral")
         self.value = value
 
-    def visit(self, typechecker):
+    def check(self, typechecker):
         return typechecker.IntegerLiteral(self)
@@ -1,14 +1,16 @@
 from .expr import Expr
 
 class ListExpr(Expr):
+    __slots__ = ("elements",)
 
-    def __init__(self, location:[int], elements:[Expr]):
+    def __init__(self, location:(int, int), elements:[Expr]):
         super().__init__(location, "ListExpr")
         self.elements = elements
 
-    def visit(self, typechecker):
-        for e in self.elements:
-            typechecker.visit(e)
+    def subexpressions(self) -> [Expr]:
+        return self.elements
+
+    def check(self, typechecker):
         return typechecker.ListExpr(self)
 
     def toJSON(self):
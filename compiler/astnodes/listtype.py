@@ -1,8 +1,9 @@
 from .typeannotation import TypeAnnotation
 
 class ListType(TypeAnnotation):
+    __slots__ = ("elementType",)
 
-    def __init__(self, location:[int], elementType:TypeAnnotation):
+    def __init__(self, location:(int, int), elementType:TypeAnnotation):
         super().__init__(location, "ListType")
         self.elementType = elementType
 
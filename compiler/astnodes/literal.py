@@ -1,8 +1,9 @@
 from .expr import Expr
 
 class Literal(Expr):
+    __slots__ = ("value",)
 
-    def __init__(self, location:[int], kind:str):
+    def __init__(self, location:(int, int), kind:str):
         super().__init__(location, kind)
         self.value = None
 
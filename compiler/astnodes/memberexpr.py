@@ -1,14 +1,17 @@
 from .expr import Expr
 
 class MemberExpr(Expr):
+    __slots__ = ("object", "member")
 
-    def __init__(self, location:[int], obj:Expr, member:Expr):
+    def __init__(self, location:(int, int), obj:Expr, member:Expr):
         super().__init__(location, "MemberExpr")
         self.object = obj
         self.member = member
 
-    def visit(self, typechecker):
-        typechecker.visit(self.object)
+    def subexpressions(self) -> [Expr]:
+        return [self.object]
+
+    def check(self, typechecker):
         return typechecker.MemberExpr(self)
 
     def toJSON(self):
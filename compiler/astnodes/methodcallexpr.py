@@ -2,15 +2,17 @@ from .expr import Expr
 from .memberexpr import MemberExpr
 
 class MethodCallExpr(Expr):
+    __slots__ = ("method", "args")
 
-    def __init__(self, location:[int], method:MemberExpr, args:[Expr]):
+    def __init__(self, location:(int, int), method:MemberExpr, args:[Expr]):
         super().__init__(location, "MethodCallExpr")
         self.method = method
         self.args = args
 
-    def visit(self, typechecker):
-        for a in self.args:
-            typechecker.visit(a)
+    def subexpressions(self) -> [Expr]:
+        return self.args + [self.method.object]
+
+    def check(self, typechecker):
         return typechecker.MethodCallExpr(self)
 
     def toJSON(self):
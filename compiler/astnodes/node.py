@@ -1,11 +1,17 @@
 
+# AST nodes are slotted: every class lists the attributes it adds in
+# __slots__, so nodes have no per-instance __dict__. Locations are immutable
+# (line, col) tuples, which nodes can share.
 class Node:
+    __slots__ = ("kind", "location", "endLocation", "errorMsg")
 
-    def __init__(self, location:[int], kind:str):
+    def __init__(self, location:(int, int), kind:str):
         if len(location) != 2:
             raise Exception('location must be length 2')
         self.kind = kind
-        self.location = location
+        self.location = tuple(location)
+        # (line, col) of the last character of the node, when the parser knows it
+        self.endLocation = None
         self.errorMsg = None
 
     def visit(self, typechecker):
@@ -14,7 +20,10 @@ class Node:
     def toJSON(self):
         d = {}
         d['kind'] = self.kind
-        d['location'] = self.location + self.location
+        if self.endLocation is None:
+            d['location'] = list(self.location + self.location)
+        else:
+            d['location'] = list(self.location + self.endLocation)
         if self.errorMsg is not None:
             d['errorMsg'] = self.errorMsg
         return d
@@ -1,10 +1,11 @@
 from .literal import Literal
 
 class NoneLiteral(Literal):
+    __slots__ = ()
 
-    def __init__(self, location:[int]):
+    def __init__(self, location:(int, int)):
         super().__init__(location, "NoneLiteral")
         self.value = None
 
-    def visit(self, typechecker):
+    def check(self, typechecker):
         return typechecker.NoneLiteral(self)
@@ -5,12 +5,16 @@ from .errors import Errors
 
 # root AST for source file
 class Program(Node):
+    __slots__ = ("declarations", "statements", "errors", "summary", "damaged")
 
-    def __init__(self, location:[int], declarations:[Declaration], statements:[Stmt], errors:Errors):
+    def __init__(self, location:(int, int), declarations:[Declaration], statements:[Stmt], errors:Errors):
         super().__init__(location, "Program")
         self.declarations = [d for d in declarations if d is not None]
         self.statements = [s for s in statements if s is not None]
         self.errors = errors
+        self.summary = None  # declaration summary from the parser, see summary.py
+        # declarations and statements with parse errors, when the parser recovered from them
+        self.damaged = []
 
     def visit(self, typechecker):
         return typechecker.Program(self)
@@ -2,8 +2,9 @@ from .stmt import Stmt
 from .expr import Expr
 
 class ReturnStmt(Stmt):
+    __slots__ = ("value",)
 
-    def __init__(self, location:[int], value:Expr):
+    def __init__(self, location:(int, int), value:Expr):
         super().__init__(location, "ReturnStmt")
         self.value = value
         self.isReturn = True
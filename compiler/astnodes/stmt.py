@@ -1,8 +1,9 @@
 from .node import Node
 
 class Stmt(Node):
+    __slots__ = ("isReturn",)
 
-    def __init__(self, location:[int], kind:str):
+    def __init__(self, location:(int, int), kind:str):
         super().__init__(location, kind)
         self.isReturn = False
 
@@ -1,10 +1,11 @@
 from .literal import Literal
 
 class StringLiteral(Literal):
+    __slots__ = ()
 
-    def __init__(self, location:[int], value:str):
+    def __init__(self, location:(int, int), value:str):
         super().__init__(location, "StringLiteral")
         self.value = value
 
-    def visit(self, typechecker):
-        typechecker.StringLiteral(self)
+    def check(self, typechecker):
+        return typechecker.StringLiteral(self)
@@ -1,7 +1,8 @@
 from .node import Node
 
 class TypeAnnotation(Node):
+    __slots__ = ()
 
-    def __init__(self, location:[int], kind:str):
+    def __init__(self, location:(int, int), kind:str):
         super().__init__(location, kind)
 
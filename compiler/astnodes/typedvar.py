@@ -3,8 +3,9 @@ from .identifier import Identifier
 from .typeannotation import TypeAnnotation
 
 class TypedVar(Node):
+    __slots__ = ("identifier", "type")
 
-    def __init__(self, location:[int], identifier:Identifier, typ:TypeAnnotation):
+    def __init__(self, location:(int, int), identifier:Identifier, typ:TypeAnnotation):
         super().__init__(location, "TypedVar")
         self.identifier = identifier
         self.type = typ
@@ -1,14 +1,17 @@
 from .expr import Expr
 
 class UnaryExpr(Expr):
+    __slots__ = ("operand", "operator")
 
-    def __init__(self, location:[int], operator:str, operand:Expr):
+    def __init__(self, location:(int, int), operator:str, operand:Expr):
         super().__init__(location, "UnaryExpr")
         self.operand = operand
         self.operator = operator
 
-    def visit(self, typechecker):
-        typechecker.visit(self.operand)
+    def subexpressions(self) -> [Expr]:
+        return [self.operand]
+
+    def check(self, typechecker):
         return typechecker.UnaryExpr(self)
 
     def toJSON(self):
@@ -3,8 +3,9 @@ from .expr import Expr
 from .typedvar import TypedVar
 
 class VarDef(Declaration):
+    __slots__ = ("var", "value", "isAttr")
 
-    def __init__(self, location:[int], var:[TypedVar], value:Expr, isAttr:bool=False):
+    def __init__(self, location:(int, int), var:[TypedVar], value:Expr, isAttr:bool=False):
         super().__init__(location, "VarDef")
         self.var = var
         self.value = value
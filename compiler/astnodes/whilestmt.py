@@ -2,8 +2,9 @@ from .stmt import Stmt
 from .expr import Expr
 
 class WhileStmt(Stmt):
+    __slots__ = ("condition", "body")
 
-    def __init__(self, location:[int], condition:Expr, body:[Stmt]):
+    def __init__(self, location:(int, int), condition:Expr, body:[Stmt]):
         super().__init__(location, "WhileStmt")
         self.condition = condition
         self.body = [s for s in body if s is not None]
@@ -0,0 +1,86 @@
+import os
+from contextlib import nullcontext
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+from .cache import ASTCache, compileCached, writeAST
+from .compiler import Compiler
+from .profiler import Profiler
+from .tracer import Tracer
+
+# compiler shared by every file handled in a worker process,
+# created once by the pool initializer
+_compiler = None
+
+
+def initWorker(profile: bool = False, trace: bool = False, native: bool = False,
+        lowMemory: bool = False, recover: bool = False):
+    global _compiler
+    _compiler = Compiler(Profiler() if profile else None, Tracer() if trace else None, native, lowMemory,
+                         recover)
+
+
+def getOutfile(infile: str, typecheck: bool) -> str:
+    if typecheck:
+        return infile + ".ast.typed"
+    return infile + ".ast"
+
+
+def compileFile(infile: str, typecheck: bool = True, cache: ASTCache = None):
+    # parse (and optionally typecheck) a single file, writing the AST JSON
+    # next to it; returns the input file, the errors that were reported,
+    # the file's profile (in Profiler.toJSON form) if profiling, and its
+    # trace events if tracing
+    if _compiler is None:
+        initWorker()
+    if _compiler.profiler is not None:
+        _compiler.profiler = Profiler()
+    tracer = _compiler.tracer
+    if tracer is not None:
+        tracer.events = []
+    errors = []
+    try:
+        with (tracer.span(infile, "file") if tracer is not None else nullcontext()):
+            ast, errors = compileCached(_compiler, infile, typecheck, cache)
+            if ast is not None:
+                with open(getOutfile(infile, typecheck), "w") as f:
+                    with _compiler.phase("serialize"):
+                        writeAST(ast, f)
+    except Exception as e:
+        # one bad submission should not take down the whole batch
+        errors.append("Internal error: {}".format(repr(e)))
+    profile = None
+    if _compiler.profiler is not None:
+        profile = _compiler.profiler.toJSON()
+    events = None
+    if tracer is not None:
+        events = tracer.events
+    return infile, errors, profile, events
+
+
+def collectFiles(directory) -> [str]:
+    return sorted(str(p) for p in Path(directory).rglob("*.py"))
+
+
+def compileBatch(directory, typecheck: bool = True, workers: int = None,
+        cache: ASTCache = None, profile: bool = False, trace: bool = False,
+        native: bool = False, lowMemory: bool = False, recover: bool = False):
+    # compile every .py file under a directory, fanning the files out
+    # across a pool of worker processes; yields the (infile, errors, profile,
+    # trace events) results of compileFile in completion order
+    files = collectFiles(directory)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    work = partial(compileFile, typecheck=typecheck, cache=cache)
+    if workers <= 1 or len(files) <= 1:
+        initWorker(profile, trace, native, lowMemory, recover)
+        for infile in files:
+            yield work(infile)
+        return
+    # large chunks amortize IPC for many small files, but keep enough
+    # chunks around that slow files don't leave workers idle at the end
+    chunksize = max(1, min(64, len(files) // (workers * 4)))
+    with Pool(processes=workers, initializer=initWorker,
+              initargs=(profile, trace, native, lowMemory, recover)) as pool:
+        for result in pool.imap_unordered(work, files, chunksize):
+            yield result
@@ -0,0 +1,335 @@
+from . import astnodes
+from .astnodes import Node, Expr
+from .types import ClassValueType, ListValueType, FuncType
+from .schema import FIELDS, NODE, LIST, VALUE, MAYBE, OPTIONAL
+
+# Compact binary encoding of AST nodes, for passing trees between tools
+# without going through the reference-compatible JSON.
+#
+# Layout:
+#   MAGIC, FORMAT_VERSION
+#   string table: count, then (byte length, utf-8 bytes) per string
+#   type table: count, then one entry per type (see encodeType)
+#   node records in post-order, so the root is the last record
+#
+# Every integer is an unsigned LEB128 varint (signed values are zigzagged).
+# A node record is: kind code, flags, line, col, [end line, end col], [errorMsg string],
+# [inferredType], then per schema field: nothing for a child node (children
+# precede their parent), a count for a list, a present byte for an optional
+# child, or a tagged scalar. Decoding is a stack machine: each record pops
+# its children off the value stack and pushes the rebuilt node.
+
+MAGIC = b"CHOCOAST"
+FORMAT_VERSION = 2
+
+KINDS = list(FIELDS)
+KIND_CODES = {kind: i for i, kind in enumerate(KINDS)}
+
+# record flags
+HAS_ERROR = 1
+HAS_TYPE = 2
+HAS_END = 4
+
+# scalar tags
+TAG_NONE = 0
+TAG_FALSE = 1
+TAG_TRUE = 2
+TAG_INT = 3
+TAG_STR = 4
+
+# type table tags
+TYPE_CLASS = 0
+TYPE_LIST = 1
+TYPE_FUNC = 2
+
+# constructor arguments of each node kind, after the location
+CONSTRUCTOR_ARGS = {
+    "Program": ["declarations", "statements", "errors"],
+    "Errors": ["errors"],
+    "CompilerError": ["message"],
+    "ClassDef": ["name", "superclass", "declarations"],
+    "FuncDef": ["name", "params", "returnType", "declarations", "statements"],
+    "VarDef": ["var", "value"],
+    "TypedVar": ["identifier", "type"],
+    "GlobalDecl": ["variable"],
+    "NonLocalDecl": ["variable"],
+    "ClassType": ["className"],
+    "ListType": ["elementType"],
+    "AssignStmt": ["targets", "value"],
+    "ExprStmt": ["expr"],
+    "IfStmt": ["condition", "thenBody", "elseBody"],
+    "WhileStmt": ["condition", "body"],
+    "ForStmt": ["identifier", "iterable", "body"],
+    "ReturnStmt": ["value"],
+    "BinaryExpr": ["left", "operator", "right"],
+    "UnaryExpr": ["operator", "operand"],
+    "IfExpr": ["condition", "thenExpr", "elseExpr"],
+    "CallExpr": ["function", "args"],
+    "MethodCallExpr": ["method", "args"],
+    "MemberExpr": ["object", "member"],
+    "IndexExpr": ["list", "index"],
+    "ListExpr": ["elements"],
+    "Identifier": ["name"],
+    "BooleanLiteral": ["value"],
+    "IntegerLiteral": ["value"],
+    "StringLiteral": ["value"],
+    "NoneLiteral": [],
+}
+
+
+class BinaryFormatError(Exception):
+    pass
+
+
+def writeVarint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def zigzag(n: int) -> int:
+    return n * 2 if n >= 0 else -n * 2 - 1
+
+
+def unzigzag(n: int) -> int:
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+
+class Encoder:
+
+    def __init__(self):
+        self.strings = {}  # string -> index
+        self.types = {}  # type -> index
+        self.typeTable = bytearray()
+        self.records = bytearray()
+
+    def string(self, s: str) -> int:
+        i = self.strings.get(s)
+        if i is None:
+            i = self.strings[s] = len(self.strings)
+        return i
+
+    def encodeType(self, t) -> int:
+        # types are interned, and component types get lower indices
+        # so the loader can resolve them in a single pass
+        i = self.types.get(t)
+        if i is not None:
+            return i
+        out = self.typeTable
+        if isinstance(t, ClassValueType):
+            out.append(TYPE_CLASS)
+            writeVarint(out, self.string(t.className))
+        elif isinstance(t, ListValueType):
+            element = self.encodeType(t.elementType)
+            out.append(TYPE_LIST)
+            writeVarint(out, element)
+        elif isinstance(t, FuncType):
+            params = [self.encodeType(p) for p in t.parameters]
+            returnType = self.encodeType(t.returnType)
+            out.append(TYPE_FUNC)
+            writeVarint(out, len(params))
+            for p in params:
+                writeVarint(out, p)
+            writeVarint(out, returnType)
+        else:
+            raise BinaryFormatError("Cannot encode type {}".format(t))
+        i = self.types[t] = len(self.types)
+        return i
+
+    def scalar(self, v):
+        out = self.records
+        if v is None:
+            out.append(TAG_NONE)
+        elif v is True:
+            out.append(TAG_TRUE)
+        elif v is False:
+            out.append(TAG_FALSE)
+        elif isinstance(v, str):
+            out.append(TAG_STR)
+            writeVarint(out, self.string(v))
+        else:
+            out.append(TAG_INT)
+            writeVarint(out, zigzag(v))
+
+    def record(self, node: Node):
+        out = self.records
+        flags = 0
+        if node.errorMsg is not None:
+            flags |= HAS_ERROR
+        inferredType = node.inferredType if isinstance(node, Expr) else None
+        if inferredType is not None:
+            flags |= HAS_TYPE
+        if node.endLocation is not None:
+            flags |= HAS_END
+        out.append(KIND_CODES[node.kind])
+        out.append(flags)
+        writeVarint(out, node.location[0])
+        writeVarint(out, node.location[1])
+        if flags & HAS_END:
+            writeVarint(out, node.endLocation[0])
+            writeVarint(out, node.endLocation[1])
+        if flags & HAS_ERROR:
+            writeVarint(out, self.string(node.errorMsg))
+        if flags & HAS_TYPE:
+            writeVarint(out, self.encodeType(inferredType))
+        for _, attr, shape in FIELDS[node.kind]:
+            value = getattr(node, attr)
+            if shape == LIST:
+                writeVarint(out, len(value))
+            elif shape == MAYBE:
+                out.append(0 if value is None else 1)
+            elif shape == VALUE or shape == OPTIONAL:
+                self.scalar(value)
+
+    def encode(self, root: Node) -> bytes:
+        # post-order walk with an explicit stack, so deep trees are fine
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                self.record(node)
+                continue
+            stack.append((node, True))
+            children = []
+            for _, attr, shape in FIELDS[node.kind]:
+                value = getattr(node, attr)
+                if shape == NODE or (shape == MAYBE and value is not None):
+                    children.append(value)
+                elif shape == LIST:
+                    children.extend(value)
+            for child in reversed(children):
+                stack.append((child, False))
+        out = bytearray(MAGIC)
+        out.append(FORMAT_VERSION)
+        writeVarint(out, len(self.strings))
+        for s in self.strings:
+            b = s.encode("utf-8")
+            writeVarint(out, len(b))
+            out += b
+        writeVarint(out, len(self.types))
+        out += self.typeTable
+        out += self.records
+        return bytes(out)
+
+
+def encode(node: Node) -> bytes:
+    return Encoder().encode(node)
+
+
+def decode(data: bytes) -> Node:
+    # truncated or corrupt input runs off the end of the data or one of its
+    # tables, fails to decode as UTF-8, or hands a node fields (or a type) it
+    # can't have; report it as a format error
+    try:
+        return decodeRecords(data)
+    except (IndexError, ValueError, TypeError, AttributeError) as e:
+        raise BinaryFormatError("Malformed binary AST") from e
+
+
+def decodeRecords(data: bytes) -> Node:
+    if data[:len(MAGIC)] != MAGIC:
+        raise BinaryFormatError("Not a binary AST")
+    pos = len(MAGIC)
+    if data[pos] != FORMAT_VERSION:
+        raise BinaryFormatError("Unsupported binary AST version {:d}".format(data[pos]))
+    pos += 1
+
+    def varint():
+        nonlocal pos
+        b = data[pos]
+        pos += 1
+        if b < 0x80:
+            return b
+        n = b & 0x7f
+        shift = 7
+        while True:
+            b = data[pos]
+            pos += 1
+            n |= (b & 0x7f) << shift
+            if b < 0x80:
+                return n
+            shift += 7
+
+    strings = []
+    for _ in range(varint()):
+        n = varint()
+        strings.append(data[pos:pos + n].decode("utf-8"))
+        pos += n
+
+    types = []
+    for _ in range(varint()):
+        tag = data[pos]
+        pos += 1
+        if tag == TYPE_CLASS:
+            types.append(ClassValueType(strings[varint()]))
+        elif tag == TYPE_LIST:
+            types.append(ListValueType(types[varint()]))
+        elif tag == TYPE_FUNC:
+            params = [types[varint()] for _ in range(varint())]
+            types.append(FuncType(params, types[varint()]))
+        else:
+            raise BinaryFormatError("Bad type tag {:d}".format(tag))
+
+    # per kind code: node class, schema, constructor argument names
+    specs = [(getattr(astnodes, kind), FIELDS[kind], CONSTRUCTOR_ARGS[kind]) for kind in KINDS]
+    stack = []
+    end = len(data)
+    while pos < end:
+        cls, fields, args = specs[data[pos]]
+        flags = data[pos + 1]
+        pos += 2
+        location = (varint(), varint())
+        endLocation = (varint(), varint()) if flags & HAS_END else None
+        errorMsg = strings[varint()] if flags & HAS_ERROR else None
+        inferredType = types[varint()] if flags & HAS_TYPE else None
+        # read the record's own fields first, noting where children go
+        values = {}
+        pending = []  # (attr, number of children, is a list)
+        nChildren = 0
+        for _, attr, shape in fields:
+            if shape == NODE:
+                pending.append((attr, 1, False))
+                nChildren += 1
+            elif shape == LIST:
+                n = varint()
+                pending.append((attr, n, True))
+                nChildren += n
+            elif shape == MAYBE:
+                present = data[pos]
+                pos += 1
+                if present:
+                    pending.append((attr, 1, False))
+                    nChildren += 1
+                else:
+                    values[attr] = None
+            else:
+                tag = data[pos]
+                pos += 1
+                if tag == TAG_STR:
+                    values[attr] = strings[varint()]
+                elif tag == TAG_INT:
+                    values[attr] = unzigzag(varint())
+                else:
+                    values[attr] = (None, False, True)[tag]
+        if nChildren > len(stack):
+            raise BinaryFormatError("Malformed binary AST")
+        if pending:
+            children = stack[len(stack) - nChildren:]
+            del stack[len(stack) - nChildren:]
+            i = 0
+            for attr, n, isList in pending:
+                if isList:
+                    values[attr] = children[i:i + n]
+                else:
+                    values[attr] = children[i]
+                i += n
+        node = cls(location, *[values[a] for a in args])
+        node.endLocation = endLocation
+        node.errorMsg = errorMsg
+        if inferredType is not None:
+            node.inferredType = inferredType
+        stack.append(node)
+    if len(stack) != 1:
+        raise BinaryFormatError("Malformed binary AST")
+    return stack[0]
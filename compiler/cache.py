@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from . import __version__
+from .astnodes import Node
+from .jsonwriter import writeJSON
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def defaultCacheDir() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "chocopy")
+
+
+class ASTCache:
+    # content-addressed on-disk cache of serialized ASTs
+    # entries are keyed by the source bytes, the file name (which error messages
+    # include), the phase, the parser (and whether it recovers from errors) and the
+    # compiler version, and evicted least-recently-used first once the cache grows
+    # past maxBytes (file mtimes double as the recency information)
+    # the total size is kept in a ledger file, so that runs which only add a few
+    # entries don't have to stat the whole cache; it is approximate (concurrent
+    # runs race on it), and is corrected whenever the cache is rescanned
+
+    def __init__(self, cacheDir: str = None, maxBytes: int = DEFAULT_MAX_BYTES):
+        self.cacheDir = Path(cacheDir if cacheDir is not None else defaultCacheDir())
+        self.maxBytes = maxBytes
+        self.written = 0  # bytes added by this process since the last evict
+
+    def key(self, source: bytes, typecheck: bool, native: bool = False, recover: bool = False,
+            fname: str = "<unknown>") -> str:
+        h = hashlib.sha256()
+        h.update(__version__.encode())
+        h.update(b"\0" + fname.encode("utf-8", "surrogateescape") + b"\0")
+        h.update(b"\0typed\0" if typecheck else b"\0parsed\0")
+        if native:
+            # the parsers report errors differently, so their ASTs can differ
+            h.update(b"native\0")
+        if recover:
+            h.update(b"recover\0")
+        h.update(source)
+        return h.hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.cacheDir / key[:2] / key[2:]
+
+    def get(self, key: str):
+        # returns (CacheEntry or None if there is no AST, [error messages]),
+        # or None on a miss
+        p = self.path(key)
+        try:
+            with p.open("r") as f:
+                errors = json.loads(f.readline())
+                offset = f.tell()
+                empty = f.read(1) == ""
+            os.utime(p)  # mark as recently used
+        except (OSError, ValueError):
+            return None
+        return (None if empty else CacheEntry(p, offset)), errors
+
+    def put(self, key: str, tree: Node, errors: [str]):
+        # store the AST (streamed straight into the entry) and its errors
+        # returns the new entry, or None if it could not be written
+        p = self.path(key)
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            # write to a temporary file first so concurrent readers
+            # (e.g. batch workers) never see a partial entry
+            fd, tmp = tempfile.mkstemp(dir=str(p.parent))
+            with os.fdopen(fd, "w") as f:
+                f.write(json.dumps(errors))
+                f.write("\n")
+                offset = f.tell()
+                if tree is not None:
+                    writeJSON(tree, f)
+                size = f.tell()
+            os.replace(tmp, str(p))
+        except OSError:
+            return None  # the cache is best-effort
+        self.written += size
+        return CacheEntry(p, offset)
+
+    def sizePath(self) -> Path:
+        return self.cacheDir / "size"
+
+    def readSize(self) -> int:
+        try:
+            return int(self.sizePath().read_text())
+        except (OSError, ValueError):
+            return 0
+
+    def writeSize(self, total: int):
+        try:
+            self.cacheDir.mkdir(parents=True, exist_ok=True)
+            self.sizePath().write_text(str(total))
+        except OSError:
+            pass
+
+    def evict(self, rescan: bool = False):
+        # drop least-recently-used entries until the cache fits in maxBytes,
+        # leaving some headroom so that every run doesn't have to evict
+        # the cache is only scanned once the ledger says it has grown past
+        # maxBytes, or if rescan is set (e.g. after other processes added entries)
+        written = self.written
+        self.written = 0
+        if not rescan:
+            if written == 0:
+                return
+            total = self.readSize() + written
+            if total <= self.maxBytes:
+                self.writeSize(total)
+                return
+        entries = []
+        total = 0
+        for p in self.cacheDir.glob("*/*"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+            total += st.st_size
+        if total <= self.maxBytes:
+            self.writeSize(total)
+            return
+        entries.sort(key=lambda e: e[0])
+        target = self.maxBytes * 9 // 10
+        for _, size, p in entries:
+            if total <= target:
+                break
+            try:
+                p.unlink()
+                total -= size
+            except OSError:
+                pass
+        self.writeSize(total)
+
+    def clear(self):
+        for p in self.cacheDir.glob("*/*"):
+            p.unlink()
+        self.writeSize(0)
+
+
+class CacheEntry:
+    # the AST JSON stored in a cache entry, after the line of errors
+
+    def __init__(self, path: Path, offset: int):
+        self.path = path
+        self.offset = offset
+
+    def writeTo(self, f):
+        with self.path.open("r") as entry:
+            entry.seek(self.offset)
+            shutil.copyfileobj(entry, f)
+
+
+def writeAST(ast, f):
+    # write an AST returned by compileCached as JSON to a text file object
+    if isinstance(ast, CacheEntry):
+        ast.writeTo(f)
+    elif ast is not None:
+        writeJSON(ast, f)
+
+
+def compileCached(compiler, infile, typecheck: bool = True, cache: ASTCache = None):
+    # parse (and optionally typecheck) a file, returning the AST (a Program,
+    # a CacheEntry holding its JSON, or None if the file could not be parsed)
+    # and the errors that were reported; use writeAST to output the AST
+    with compiler.phase("read"):
+        with open(infile, "rb") as f:
+            source = f.read()
+    fname = Path(infile).name
+    key = None
+    if cache is not None:
+        key = cache.key(source, typecheck, compiler.native, compiler.recover, fname)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    tree, parseErrors, tcErrors = compiler.compile(source, typecheck, fname)
+    errors = [str(e) for e in parseErrors] + tcErrors
+    if cache is not None:
+        # serialize once, into the cache, and copy it from there
+        entry = cache.put(key, tree, errors)
+        if entry is not None and tree is not None:
+            return entry, errors
+    return tree, errors
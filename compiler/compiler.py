@@ -2,32 +2,121 @@ from .astnodes import *
 from .types import *
 from .typechecker import TypeChecker
 from .parser import Parser, ParseError
+from .nativeparser import NativeParser
 import ast
+from contextlib import ExitStack, nullcontext
 from pathlib import Path
+from time import perf_counter
 
 class Compiler:
+    def __init__(self, profiler=None, tracer=None, native: bool = False, lowMemory: bool = False,
+            recover: bool = False):
+        # optional profiler.Profiler that collects timings for each phase
+        self.profiler = profiler
+        # optional tracer.Tracer that records a timeline of spans
+        self.tracer = tracer
+        # parse with nativeparser.NativeParser instead of ast.parse + Parser
+        self.native = native
+        # parse and lower in chunks, freeing the Python AST as it goes (see Parser.lowerChunks)
+        self.lowMemory = lowMemory
+        # report every parse error and typecheck what they don't affect (see Parser.recover)
+        self.recover = recover
+
+    def phase(self, name: str):
+        # context manager timing one phase of compilation when profiling or tracing
+        if self.tracer is None:
+            if self.profiler is None:
+                return nullcontext()
+            return self.profiler.phase(name)
+        if self.profiler is None:
+            return self.tracer.phase(name)
+        phases = ExitStack()
+        phases.enter_context(self.tracer.phase(name))
+        phases.enter_context(self.profiler.phase(name))
+        return phases
+
     def parse(self, infile, astparser: Parser) -> Node:
         # given an input file, parse it into an AST object
         lines = None
         fname = infile
-        if isinstance(infile, Path):
-            fname = infile.name
-            with infile.open("r") as f:
-                lines = "".join([line for line in f])
-        else:
-            with open(infile, "r") as f:
-                lines = "".join([line for line in f])
+        with self.phase("read"):
+            if isinstance(infile, Path):
+                fname = infile.name
+                with infile.open("r") as f:
+                    lines = f.read()
+            else:
+                with open(infile, "r") as f:
+                    lines = f.read()
+        return self.parseSource(lines, astparser, fname)
+
+    def parseSource(self, source, astparser: Parser, fname="<unknown>") -> Node:
+        # given source text (str or bytes), parse it into an AST object
+        if self.native:
+            nativeparser = NativeParser()
+            nativeparser.summarize = True
+            with self.phase("parse"):
+                tree = nativeparser.parse(source)
+            astparser.errors.extend(nativeparser.errors)
+            return tree
+        if self.tracer is not None:
+            astparser.tracer = self.tracer
+        if isinstance(source, str) and source.startswith("\ufeff"):
+            source = source[1:]  # ast.parse only skips a byte order mark in bytes
+        astparser.setSource(source)
+        astparser.summarize = True
+        astparser.recover = self.recover
         try:
-            tree = ast.parse(lines)
-            return astparser.visit(tree)
+            if self.lowMemory:
+                # ast.parse and lowering alternate, one run of statements at a time
+                with self.phase("parse"):
+                    return astparser.lowerChunks()
+            with self.phase("ast.parse"):
+                tree = ast.parse(source)
+            with self.phase("lower"):
+                return astparser.visit(tree)
         except SyntaxError as e:
             e.filename = fname
             message = "Syntax Error: {}. Line {:d} Col {:d}".format(str(e), e.lineno, e.offset)
             astparser.errors.append(ParseError(message))
             return None
-
+        except (RecursionError, MemoryError):
+            # CPython's parser gives up on very deeply nested code this way;
+            # --native handles much deeper nesting
+            astparser.errors.append(ParseError("Program is nested too deeply"))
+            return None
 
     def visit(self, ast: Node, tc: TypeChecker):
         # given an AST object, typecheck it
         # typechecking mutates the AST, adding types and errors
-        ast.visit(tc)
+        if self.profiler is not None:
+            self.profiler.instrument(tc)
+        if self.tracer is not None:
+            self.tracer.instrument(tc)
+        with self.phase("typecheck"):
+            ast.visit(tc)
+
+    def compile(self, source, typecheck: bool = True, fname="<unknown>", timings: dict = None):
+        # parse and typecheck source text (str or bytes) without touching the filesystem
+        # returns (AST, parse errors, typecheck errors); the AST is None if the
+        # source has parse errors (unless recovering), and it is only typechecked if it parsed
+        # cleanly or, when recovering, if it parsed at all
+        # if given, timings gets the "parse" and "typecheck" times in ms
+        start = perf_counter()
+        astparser = Parser()
+        tree = self.parseSource(source, astparser, fname)
+        if len(astparser.errors) > 0 and not self.recover:
+            # lowering leaves holes where it rejected something; return no
+            # tree at all rather than a partial one
+            tree = None
+        parsed = perf_counter()
+        tcErrors = []
+        if (len(astparser.errors) == 0 or (self.recover and tree is not None)) and typecheck:
+            tc = TypeChecker()
+            self.visit(tree, tc)
+            tcErrors = tc.errors
+        if timings is not None:
+            timings["parse"] = (parsed - start) * 1000
+            timings["typecheck"] = (perf_counter() - parsed) * 1000
+        if self.profiler is not None and tree is not None:
+            self.profiler.countNodes(tree)
+        return tree, astparser.errors, tcErrors
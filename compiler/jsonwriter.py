@@ -0,0 +1,80 @@
+import json
+from json.encoder import encode_basestring_ascii
+from .astnodes import Node
+from .schema import FIELDS, NODE, LIST, VALUE, MAYBE
+
+# Incremental JSON serializer for AST nodes.
+# The output is byte-for-byte the same as json.dump(node.toJSON(), f), but
+# the tree is walked with an explicit stack of per-node generators and the
+# text is written out in chunks, so memory is bounded by the depth of the
+# tree rather than its size (and deep trees don't hit the recursion limit).
+
+
+def scalarJSON(v) -> str:
+    if v is None:
+        return "null"
+    if v is True:
+        return "true"
+    if v is False:
+        return "false"
+    if isinstance(v, str):
+        return encode_basestring_ascii(v)
+    return int.__repr__(v)
+
+
+def nodeTokens(node: Node):
+    # yields the JSON text of a node in pieces, yielding child nodes
+    # in place of their text so the caller can expand them
+    location = node.location + (node.location if node.endLocation is None else node.endLocation)
+    yield '{"kind": ' + encode_basestring_ascii(node.kind)
+    yield ', "location": [' + ", ".join([int.__repr__(l) for l in location]) + "]"
+    if node.errorMsg is not None:
+        yield ', "errorMsg": ' + encode_basestring_ascii(node.errorMsg)
+    # (only expressions have inferredType; getattr also covers arena.NodeRef views)
+    inferredType = getattr(node, "inferredType", None)
+    if inferredType is not None:
+        yield ', "inferredType": ' + json.dumps(inferredType.toJSON())
+    for key, attr, shape in FIELDS.get(node.kind, ()):
+        value = getattr(node, attr)
+        if shape == NODE:
+            yield ", " + encode_basestring_ascii(key) + ": "
+            yield value
+        elif shape == LIST:
+            yield ", " + encode_basestring_ascii(key) + ": ["
+            first = True
+            for child in value:
+                if not first:
+                    yield ", "
+                first = False
+                yield child
+            yield "]"
+        elif shape == MAYBE:
+            yield ", " + encode_basestring_ascii(key) + ": "
+            yield "null" if value is None else value
+        elif shape == VALUE or value is not None:
+            yield ", " + encode_basestring_ascii(key) + ": " + scalarJSON(value)
+    yield "}"
+
+
+_DONE = object()
+
+
+def writeJSON(node: Node, f, chunkSize: int = 1 << 16):
+    # write the JSON for an AST to a text file object
+    buf = []
+    size = 0
+    stack = [nodeTokens(node)]
+    while stack:
+        item = next(stack[-1], _DONE)
+        if item is _DONE:
+            stack.pop()
+        elif isinstance(item, str):
+            buf.append(item)
+            size += len(item)
+            if size >= chunkSize:
+                f.write("".join(buf))
+                buf = []
+                size = 0
+        else:
+            stack.append(nodeTokens(item))
+    f.write("".join(buf))
@@ -0,0 +1,170 @@
+import re
+from .parser import ParseError
+
+# Tokenizer for ChocoPy source, used by nativeparser.NativeParser.
+#
+# Produces Python-style logical lines: NEWLINE ends each logical line, and
+# INDENT/DEDENT mark changes of indentation (tabs advance to the next multiple
+# of 8 columns). Blank and comment-only lines are skipped, and line breaks
+# inside brackets or after a backslash don't end the logical line.
+# Token positions are 1-based, and the end position is the last character
+# (for NEWLINE, the line break itself).
+
+KEYWORDS = frozenset([
+    "False", "None", "True", "and", "as", "assert", "async", "await", "break",
+    "class", "continue", "def", "del", "elif", "else", "except", "finally",
+    "for", "from", "global", "if", "import", "in", "is", "lambda", "nonlocal",
+    "not", "or", "pass", "raise", "return", "try", "while", "with", "yield",
+])
+
+MAX_INT = 2147483647
+
+NEWLINES = re.compile(r"\r\n|\r|\n")
+TOKEN = re.compile(r"""
+    (?P<space>[ \t\f]+)
+  | (?P<comment>\#.*)
+  | (?P<name>[A-Za-z_][A-Za-z_0-9]*)
+  | (?P<number>[0-9][A-Za-z_0-9.]*)
+  | (?P<string>"(?:[^"\\]|\\.)*")
+  | (?P<op>->|\*\*=?|//=?|<<=?|>>=?|[-+*/%&|^@<>=!]=|[-+*/%<>=()\[\]{}:,.;@&|^~])
+  | (?P<continuation>\\$)
+""", re.VERBOSE)
+ESCAPES = {"n": "\n", "t": "\t", '"': '"', "\\": "\\"}
+BRACKETS = {"(": 1, "[": 1, "{": 1, ")": -1, "]": -1, "}": -1}
+
+
+class Token:
+    __slots__ = ("kind", "value", "line", "col", "endLine", "endCol")
+
+    def __init__(self, kind: str, value, line: int, col: int, endLine: int, endCol: int):
+        # kind is "ID", "INT", "STRING", "NEWLINE", "INDENT", "DEDENT", "EOF",
+        # or the text of a keyword or operator
+        self.kind = kind
+        self.value = value
+        self.line = line
+        self.col = col
+        self.endLine = endLine
+        self.endCol = endCol
+
+    # positions in the form ParseError expects from Python AST nodes
+    @property
+    def lineno(self) -> int:
+        return self.line
+
+    @property
+    def col_offset(self) -> int:
+        return self.col - 1
+
+    def __repr__(self):
+        return "Token({}, {!r}, {:d}:{:d})".format(self.kind, self.value, self.line, self.col)
+
+
+def decodeString(text: str, token: Token) -> str:
+    # contents of a string literal, with its escape sequences replaced
+    if "\\" not in text:
+        return text[1:-1]
+    chars = []
+    i = 1
+    while i < len(text) - 1:
+        c = text[i]
+        if c == "\\":
+            i += 1
+            if text[i] not in ESCAPES:
+                raise ParseError("Unsupported escape sequence \\" + text[i], token)
+            c = ESCAPES[text[i]]
+        chars.append(c)
+        i += 1
+    return "".join(chars)
+
+
+def dedent(tokens: [Token], indents: [int], width: int, lineno: int, pos: int):
+    # close indentation levels deeper than width. The first DEDENT sits on the
+    # preceding NEWLINE and the rest just before the next token, so a block
+    # ending in a nested block extends up to the following line.
+    newline = tokens[-1]
+    tokens.append(Token("DEDENT", None, newline.line, newline.col, newline.endLine, newline.endCol))
+    indents.pop()
+    while width < indents[-1]:
+        indents.pop()
+        tokens.append(Token("DEDENT", None, lineno, pos + 1, lineno, pos))
+
+
+def tokenize(source: str) -> [Token]:
+    tokens = []
+    indents = [0]
+    depth = 0  # bracket nesting
+    continued = False  # the previous line ended with a backslash
+    lineno = 0
+    for line in NEWLINES.split(source):
+        lineno += 1
+        pos = 0
+        end = len(line)
+        if depth == 0 and not continued:
+            width = 0
+            while pos < end and line[pos] in " \t\f":
+                if line[pos] == " ":
+                    width += 1
+                elif line[pos] == "\t":
+                    width = (width // 8 + 1) * 8
+                else:
+                    width = 0
+                pos += 1
+            if pos == end or line[pos] == "#":
+                continue
+            if width > indents[-1]:
+                indents.append(width)
+                tokens.append(Token("INDENT", None, lineno, pos + 1, lineno, pos))
+            elif width < indents[-1]:
+                dedent(tokens, indents, width, lineno, pos)
+                if width != indents[-1]:
+                    raise ParseError("Unindent does not match any outer indentation level",
+                                     Token("DEDENT", None, lineno, pos + 1, lineno, pos))
+        continued = False
+        while pos < end:
+            m = TOKEN.match(line, pos)
+            if m is None:
+                token = Token("ERROR", line[pos], lineno, pos + 1, lineno, pos + 1)
+                if line[pos] == '"':
+                    raise ParseError("Unterminated string literal", token)
+                if line[pos] == "'":
+                    raise ParseError("Strings must be enclosed in double quotes", token)
+                raise ParseError("Unexpected character " + repr(line[pos]), token)
+            group = m.lastgroup
+            text = m.group()
+            start = pos
+            pos = m.end()
+            if group == "space" or group == "comment":
+                continue
+            if group == "name":
+                kind = text if text in KEYWORDS else "ID"
+                tokens.append(Token(kind, text, lineno, start + 1, lineno, pos))
+            elif group == "op":
+                depth += BRACKETS.get(text, 0)
+                if depth < 0:
+                    depth = 0
+                tokens.append(Token(text, text, lineno, start + 1, lineno, pos))
+            elif group == "string":
+                token = Token("STRING", None, lineno, start + 1, lineno, pos)
+                token.value = decodeString(text, token)
+                tokens.append(token)
+            elif group == "number":
+                token = Token("INT", None, lineno, start + 1, lineno, pos)
+                if not text.isdigit():
+                    raise ParseError("Only integers are supported", token)
+                if len(text) > 1 and text[0] == "0":
+                    raise ParseError("Invalid integer literal " + text, token)
+                token.value = int(text)
+                if token.value > MAX_INT:
+                    raise ParseError("Integer literal is too large", token)
+                tokens.append(token)
+            else:
+                continued = True
+        if depth == 0 and not continued and tokens and tokens[-1].kind != "NEWLINE":
+            tokens.append(Token("NEWLINE", None, lineno, end + 1, lineno, end + 1))
+    lineno = max(lineno, 1)
+    if tokens and tokens[-1].kind != "NEWLINE":
+        tokens.append(Token("NEWLINE", None, lineno, 1, lineno, 0))
+    if len(indents) > 1:
+        dedent(tokens, indents, 0, lineno, 0)
+    tokens.append(Token("EOF", None, lineno, 1, lineno, 0))
+    return tokens
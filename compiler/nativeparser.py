@@ -0,0 +1,576 @@
+from .astnodes import *
+from .lexer import Token, tokenize
+from .parser import ParseError
+from .summary import Summary
+
+# Parser for ChocoPy that builds compiler.astnodes directly from source text,
+# without going through Python's ast module: recursive descent for statements
+# and operator precedence for expressions. It accepts the same programs and
+# reports the same kinds of errors as ast.parse + Parser, but every node also
+# gets its end location.
+#
+# Parsing stops at the first error.
+
+COMPARISONS = frozenset(["==", "!=", "<", "<=", ">", ">=", "is"])
+UNSUPPORTED = frozenset([
+    "as", "assert", "async", "await", "break", "continue", "del", "except",
+    "finally", "from", "import", "lambda", "raise", "try", "with", "yield",
+])
+AUGMENTED = frozenset(["+=", "-=", "*=", "/=", "//=", "%=", "**=", "@=", "&=", "|=", "^=", "<<=", ">>="])
+# expression frames, see NativeParser.expression: (kind, level, first token, ...)
+PAREN, LIST, CALL, INDEX, CONDITION, ORELSE, BINARY, UNARY = range(8)
+# binding levels; pending operators at or above an operator's level are
+# reduced before it, and bracket frames (NONE) are only closed explicitly
+NONE = -1
+ORELSE_LEVEL = 0
+NOT_LEVEL = 3
+COMPARE_LEVEL = 4
+NEGATE_LEVEL = 7
+LEVELS = {
+    "if": 1, "or": 1, "and": 2,
+    "==": COMPARE_LEVEL, "!=": COMPARE_LEVEL, "<": COMPARE_LEVEL, "<=": COMPARE_LEVEL,
+    ">": COMPARE_LEVEL, ">=": COMPARE_LEVEL, "is": COMPARE_LEVEL,
+    "+": 5, "-": 5, "*": 6, "//": 6, "%": 6,
+}
+DESCRIPTIONS = {
+    "NEWLINE": "end of line",
+    "INDENT": "indent",
+    "DEDENT": "unindent",
+    "EOF": "end of file",
+}
+
+
+def describe(token: Token) -> str:
+    if token.kind in DESCRIPTIONS:
+        return DESCRIPTIONS[token.kind]
+    if token.kind == "STRING":
+        return "string"
+    return repr(str(token.value))
+
+
+class NativeParser:
+    def __init__(self):
+        self.errors = []
+        self.tokens = []
+        self.pos = 0
+        self.last = None  # last token consumed, other than layout tokens
+        self.lastLine = None  # last token consumed, including NEWLINE and DEDENT
+        # record a Summary of each scope's declarations for the TypeChecker
+        self.summarize = False
+
+    def parse(self, source) -> Program:
+        # returns None if the source has errors
+        if isinstance(source, bytes):
+            source = source.decode("utf-8")
+        if source.startswith("\ufeff"):
+            source = source[1:]
+        try:
+            self.tokens = tokenize(source)
+            self.pos = 0
+            return self.program()
+        except ParseError as e:
+            self.errors.append(e)
+        except RecursionError:
+            self.errors.append(ParseError("Program is nested too deeply", self.peek()))
+        return None
+
+    # TOKENS
+
+    def peek(self, offset: int = 0) -> Token:
+        # only look past the current token when it isn't EOF
+        return self.tokens[self.pos + offset]
+
+    def at(self, kind: str) -> bool:
+        return self.tokens[self.pos].kind == kind
+
+    def advance(self) -> Token:
+        token = self.tokens[self.pos]
+        if token.kind != "EOF":
+            self.pos += 1
+        if token.kind not in DESCRIPTIONS:
+            self.last = token
+        if token.kind != "INDENT" and token.kind != "EOF":
+            self.lastLine = token
+        return token
+
+    def accept(self, kind: str) -> Token:
+        if self.tokens[self.pos].kind == kind:
+            return self.advance()
+        return None
+
+    def expect(self, kind: str) -> Token:
+        if self.tokens[self.pos].kind != kind:
+            expected = DESCRIPTIONS.get(kind, repr(kind))
+            raise ParseError("Expected {} but found {}".format(expected, describe(self.peek())), self.peek())
+        return self.advance()
+
+    def unexpected(self, token: Token = None) -> ParseError:
+        token = token or self.peek()
+        return ParseError("Unexpected " + describe(token), token)
+
+    def finish(self, node: Node) -> Node:
+        # the node ends with the last token consumed
+        node.endLocation = (self.last.endLine, self.last.endCol)
+        return node
+
+    def finishBlock(self, node: Node) -> Node:
+        # compound nodes also take in the NEWLINE or DEDENT ending their body
+        node.endLocation = (self.lastLine.endLine, self.lastLine.endCol)
+        return node
+
+    # DECLARATIONS
+
+    def atDeclaration(self) -> bool:
+        kind = self.tokens[self.pos].kind
+        if kind == "def" or kind == "class" or kind == "global" or kind == "nonlocal":
+            return True
+        return kind == "ID" and self.peek(1).kind == ":"
+
+    def program(self) -> Program:
+        declarations = []
+        statements = []
+        summary = Summary() if self.summarize else None
+        decl = True
+        while not self.at("EOF"):
+            start = self.peek()
+            if self.atDeclaration():
+                d = self.declaration()
+                if isinstance(d, GlobalDecl) or isinstance(d, NonLocalDecl):
+                    raise ParseError("Expected function, class, or variable declaration", start)
+                if not decl:
+                    raise ParseError("All declarations must come before statements", start)
+                declarations.append(d)
+                if summary is not None:
+                    summary.add(d)
+            elif self.at("INDENT"):
+                raise self.unexpected()
+            else:
+                statements.append(self.statement())
+                decl = False
+        # the program starts where its first declaration or statement does
+        first = declarations or [s for s in statements if s is not None]
+        location = first[0].location if first else (1, 1)
+        program = Program(location, declarations, statements, Errors((0, 0), []))
+        program.summary = summary
+        if self.last is not None:
+            self.finishBlock(program)
+        return program
+
+    def declaration(self) -> Declaration:
+        kind = self.peek().kind
+        if kind == "def":
+            return self.funcDef()
+        if kind == "class":
+            return self.classDef()
+        if kind == "global" or kind == "nonlocal":
+            return self.scopeDecl()
+        d = self.varDef()
+        self.expect("NEWLINE")
+        return d
+
+    def identifier(self) -> Identifier:
+        token = self.expect("ID")
+        return self.finish(Identifier((token.line, token.col), token.value))
+
+    def typeAnnotation(self) -> TypeAnnotation:
+        token = self.peek()
+        if token.kind == "ID" or token.kind == "STRING":
+            self.advance()
+            return self.finish(ClassType((token.line, token.col), token.value))
+        if token.kind == "[":
+            self.advance()
+            elementType = self.typeAnnotation()
+            if self.at(","):
+                raise ParseError("Unsupported List type annotation", token)
+            self.expect("]")
+            return self.finish(ListType((token.line, token.col), elementType))
+        raise ParseError("Unsupported type annotation", token)
+
+    def typedVar(self) -> TypedVar:
+        start = self.peek()
+        identifier = self.identifier()
+        if not self.accept(":"):
+            raise ParseError("Missing type annotation", start)
+        annotation = self.typeAnnotation()
+        return self.finish(TypedVar((start.line, start.col), identifier, annotation))
+
+    def varDef(self) -> VarDef:
+        start = self.peek()
+        var = self.typedVar()
+        if not self.accept("="):
+            raise ParseError("Expected initializing value", start)
+        valueStart = self.peek()
+        value = self.expression()
+        if not isinstance(value, Literal):
+            raise ParseError("Expected literal value", valueStart)
+        return self.finish(VarDef((start.line, start.col), var, value))
+
+    def scopeDecl(self) -> Declaration:
+        start = self.advance()
+        identifier = self.identifier()
+        if self.at(","):
+            raise ParseError("Only one identifier is allowed per {} declaration".format(start.kind), start)
+        self.expect("NEWLINE")
+        if start.kind == "global":
+            return self.finish(GlobalDecl((start.line, start.col), identifier))
+        return self.finish(NonLocalDecl((start.line, start.col), identifier))
+
+    def funcDef(self) -> FuncDef:
+        start = self.expect("def")
+        identifier = self.identifier()
+        self.expect("(")
+        params = []
+        while not self.at(")"):
+            if self.at("*") or self.at("**"):
+                raise ParseError("Unsupported vararg", self.peek())
+            params.append(self.typedVar())
+            if self.at("="):
+                raise ParseError("Default arguments are unsupported", self.peek())
+            if not self.accept(","):
+                break
+        self.expect(")")
+        if self.accept("->"):
+            if identifier.name == "__init__":
+                raise ParseError("__init__ cannot have a return type", start)
+            returnType = self.typeAnnotation()
+        else:
+            returnType = ClassType((start.line, start.col), "<None>")
+        self.expect(":")
+        declarations = []
+        statements = []
+        summary = Summary() if self.summarize else None
+        decl = True
+        for token, b in self.block():
+            if isinstance(b, Declaration):
+                if isinstance(b, ClassDef):
+                    raise ParseError("Inner classes are unsupported", token)
+                if not decl:
+                    raise ParseError("All declarations must come before statements", token)
+                declarations.append(b)
+                if summary is not None:
+                    summary.add(b)
+            else:
+                statements.append(b)
+                decl = False
+        funcDef = FuncDef((start.line, start.col), identifier, params, returnType,
+                          declarations, statements)
+        funcDef.summary = summary
+        return self.finishBlock(funcDef)
+
+    def classDef(self) -> ClassDef:
+        start = self.expect("class")
+        identifier = self.identifier()
+        superclass = None
+        if self.accept("("):
+            if not self.at(")"):
+                superclass = self.identifier()
+                if self.at("="):
+                    raise ParseError("Unsupported keywords", self.peek())
+                if self.accept(",") and not self.at(")"):
+                    # at the second superclass, like the ast path
+                    raise ParseError("Multiple inheritance is unsupported", self.peek())
+            self.expect(")")
+        if superclass is None:
+            superclass = self.finish(Identifier((self.last.endLine, self.last.endCol + 1), "object"))
+        self.expect(":")
+        body = self.block()
+        # allow class bodies that only contain a single pass
+        if len(body) == 1 and body[0][1] is None:
+            body = []
+        summary = Summary() if self.summarize else None
+        for token, b in body:
+            if not isinstance(b, Declaration):
+                raise ParseError("Expected declaration", token)
+            if isinstance(b, ClassDef) or isinstance(b, GlobalDecl) or isinstance(b, NonLocalDecl):
+                raise ParseError("Expected attribute or method declaration", token)
+            if summary is not None:
+                summary.add(b)
+        classDef = ClassDef((start.line, start.col), identifier, superclass, [b for _, b in body])
+        classDef.summary = summary
+        return self.finishBlock(classDef)
+
+    def block(self) -> list:
+        # the body of a compound statement, after the colon, as a list of
+        # (first token, declaration or statement) pairs; pass gives None
+        if not self.accept("NEWLINE"):
+            # a single simple statement on the same line
+            return [(self.peek(), self.simpleStatement())]
+        if not self.at("INDENT"):
+            raise ParseError("Expected an indented block", self.peek())
+        self.advance()
+        body = []
+        while not self.accept("DEDENT"):
+            token = self.peek()
+            if self.atDeclaration():
+                body.append((token, self.declaration()))
+            else:
+                body.append((token, self.statement()))
+        return body
+
+    # STATEMENTS
+
+    def statements(self, start: Token) -> [Stmt]:
+        # body of an if, while or for statement
+        body = []
+        for _, b in self.block():
+            if isinstance(b, Declaration):
+                raise ParseError("Illegal declaration", start)
+            body.append(b)
+        return body
+
+    def statement(self) -> Stmt:
+        kind = self.peek().kind
+        if kind == "if":
+            return self.ifStmt()
+        if kind == "while":
+            start = self.advance()
+            condition = self.expression()
+            self.expect(":")
+            body = self.statements(start)
+            if self.at("else"):
+                raise ParseError("Cannot have else in while", start)
+            return self.finishBlock(WhileStmt((start.line, start.col), condition, body))
+        if kind == "for":
+            start = self.advance()
+            identifier = self.identifier()
+            self.expect("in")
+            iterable = self.expression()
+            self.expect(":")
+            body = self.statements(start)
+            if self.at("else"):
+                raise ParseError("Cannot have else in for", start)
+            return self.finishBlock(ForStmt((start.line, start.col), identifier, iterable, body))
+        if kind == "INDENT":
+            raise self.unexpected()
+        return self.simpleStatement()
+
+    def ifStmt(self) -> IfStmt:
+        start = self.advance()  # if or elif
+        condition = self.expression()
+        self.expect(":")
+        thenBody = self.statements(start)
+        elseBody = []
+        if self.at("elif"):
+            elseBody = [self.ifStmt()]
+        elif self.at("else"):
+            token = self.advance()
+            self.expect(":")
+            elseBody = self.statements(token)
+        return self.finishBlock(IfStmt((start.line, start.col), condition, thenBody, elseBody))
+
+    def simpleStatement(self) -> Stmt:
+        # a statement that ends with a newline; returns None for pass
+        start = self.peek()
+        kind = start.kind
+        if kind == "pass":
+            self.advance()
+            node = None
+        elif kind == "return":
+            self.advance()
+            value = None
+            if not self.at("NEWLINE"):
+                value = self.expression()
+            node = self.finish(ReturnStmt((start.line, start.col), value))
+        elif kind in UNSUPPORTED or kind == "global" or kind == "nonlocal":
+            raise ParseError("Unsupported", start)
+        else:
+            expr = self.expression()
+            if self.at("="):
+                targets = [expr]
+                while self.accept("="):
+                    targets.append(self.expression())
+                value = targets.pop()
+                for t in targets:
+                    if not (isinstance(t, Identifier) or isinstance(t, MemberExpr) or isinstance(t, IndexExpr)):
+                        raise ParseError("Invalid assignment target", start)
+                node = self.finish(AssignStmt((start.line, start.col), targets, value))
+            elif self.at(":"):
+                raise ParseError("Expected variable", start)
+            elif self.peek().kind in AUGMENTED:
+                raise ParseError("Unsupported", start)
+            else:
+                node = self.finish(ExprStmt((start.line, start.col), expr))
+        if not self.at("NEWLINE"):
+            raise self.unexpected()
+        self.advance()
+        return node
+
+    # EXPRESSIONS
+    #
+    # Expressions are parsed by operator precedence with an explicit stack of
+    # frames for the operators and brackets still waiting for an operand, so
+    # that nesting depth is not limited by the recursion limit. Each operand is
+    # carried along with its first token, which gives the start location of
+    # the nodes built around it.
+
+    def expression(self) -> Expr:
+        frames = []
+        expr, start = self.operand(frames)
+        while True:
+            expr = self.postfix(expr, start, frames)
+            if expr is None:
+                # opened a call or an index
+                expr, start = self.operand(frames)
+                continue
+            token = self.peek()
+            kind = token.kind
+            level = LEVELS.get(kind)
+            if level is not None:
+                expr, start = self.reduce(frames, level, expr, start, kind)
+                if kind == "if" and frames and frames[-1][0] == CONDITION:
+                    self.expect("else")
+                self.advance()
+                if kind == "if":
+                    frames.append((CONDITION, NONE, start, expr))
+                else:
+                    if kind == "is" and self.at("not"):
+                        raise ParseError("Unsupported", token)
+                    frames.append((BINARY, level, start, expr, kind))
+                expr, start = self.operand(frames)
+                continue
+            if kind == "/" or kind == "@" or kind == "**" or kind == "in" or (kind == "not" and self.peek(1).kind == "in"):
+                raise ParseError("Unsupported", token)
+            expr, start = self.reduce(frames, ORELSE_LEVEL, expr, start, None)
+            if not frames:
+                return expr
+            frame = frames.pop()
+            what = frame[0]
+            if what == CONDITION:
+                self.expect("else")
+                frames.append((ORELSE, ORELSE_LEVEL, frame[2], frame[3], expr))
+                expr, start = self.operand(frames)
+            elif what == PAREN:
+                if self.at(","):
+                    raise ParseError("Unsupported tuple", frame[2])
+                self.expect(")")
+                start = frame[2]
+            elif what == LIST:
+                elements = frame[3]
+                elements.append(expr)
+                if self.accept(",") and not self.at("]"):
+                    frames.append(frame)
+                    expr, start = self.operand(frames)
+                    continue
+                self.expect("]")
+                start = frame[2]
+                expr = self.finish(ListExpr((start.line, start.col), elements))
+            elif what == CALL:
+                args = frame[4]
+                args.append(expr)
+                if self.accept(",") and not self.at(")"):
+                    frames.append(frame)
+                    self.checkArgument(frame[2])
+                    expr, start = self.operand(frames)
+                    continue
+                self.expect(")")
+                start = frame[2]
+                expr = self.call(frame[3], args, start)
+            else:  # INDEX
+                if self.at(":"):
+                    # at the start of the slice, like the ast path
+                    raise ParseError("Unsupported slice", start)
+                self.expect("]")
+                start = frame[2]
+                expr = self.finish(IndexExpr((start.line, start.col), frame[3], expr))
+
+    def operand(self, frames: list):
+        # prefix operators and opening brackets up to the next atom, which is
+        # returned along with its first token
+        while True:
+            token = self.advance()
+            kind = token.kind
+            if kind == "not":
+                if frames and frames[-1][1] > NOT_LEVEL:
+                    raise self.unexpected(token)
+                frames.append((UNARY, NOT_LEVEL, token, None, "not"))
+            elif kind == "-":
+                frames.append((UNARY, NEGATE_LEVEL, token, None, "-"))
+            elif kind == "+" or kind == "~":
+                raise ParseError("Unsupported", token)
+            elif kind == "(":
+                if self.at(")"):
+                    raise ParseError("Unsupported tuple", token)
+                frames.append((PAREN, NONE, token))
+            elif kind == "[" and not self.at("]"):
+                frames.append((LIST, NONE, token, []))
+            else:
+                return self.atom(token), token
+
+    def postfix(self, expr: Expr, start: Token, frames: list) -> Expr:
+        # member accesses, calls and indexing applied to expr; returns None
+        # after pushing a frame for a call or index whose contents follow
+        location = (start.line, start.col)
+        while True:
+            kind = self.peek().kind
+            if kind == ".":
+                self.advance()
+                member = self.identifier()
+                expr = self.finish(MemberExpr(location, expr, member))
+            elif kind == "[":
+                self.advance()
+                if self.at(":"):
+                    raise ParseError("Unsupported slice", self.peek())
+                frames.append((INDEX, NONE, start, expr))
+                return None
+            elif kind == "(":
+                self.advance()
+                if self.accept(")"):
+                    expr = self.call(expr, [], start)
+                    continue
+                self.checkArgument(start)
+                frames.append((CALL, NONE, start, expr, []))
+                return None
+            else:
+                return expr
+
+    def checkArgument(self, start: Token):
+        if self.at("ID") and self.peek(1).kind == "=":
+            raise ParseError("Keyword args are not supported", start)
+
+    def call(self, function: Expr, args: [Expr], start: Token) -> Expr:
+        location = (start.line, start.col)
+        if isinstance(function, MemberExpr):
+            return self.finish(MethodCallExpr(location, function, args))
+        if isinstance(function, Identifier):
+            return self.finish(CallExpr(location, function, args))
+        raise ParseError("Invalid receiver of call", start)
+
+    def reduce(self, frames: list, level: int, expr: Expr, start: Token, kind: str):
+        # build the nodes for pending operators that bind at least as tightly
+        # as level, with expr as the rightmost operand; returns the result and
+        # its first token
+        while frames and frames[-1][1] >= level:
+            frame = frames.pop()
+            what = frame[0]
+            start = frame[2]
+            location = (start.line, start.col)
+            if what == BINARY:
+                if frame[1] == COMPARE_LEVEL and kind in COMPARISONS:
+                    raise ParseError("Unsupported compare between > 2 things", frame[2])
+                expr = self.finish(BinaryExpr(location, frame[3], frame[4], expr))
+            elif what == UNARY:
+                expr = self.finish(UnaryExpr(location, frame[4], expr))
+            else:  # ORELSE
+                expr = self.finish(IfExpr(location, frame[4], frame[3], expr))
+        return expr, start
+
+    def atom(self, token: Token) -> Expr:
+        kind = token.kind
+        location = (token.line, token.col)
+        if kind == "ID":
+            return self.finish(Identifier(location, token.value))
+        if kind == "INT":
+            return self.finish(IntegerLiteral(location, token.value))
+        if kind == "STRING":
+            return self.finish(StringLiteral(location, token.value))
+        if kind == "True" or kind == "False":
+            return self.finish(BooleanLiteral(location, kind == "True"))
+        if kind == "None":
+            return self.finish(NoneLiteral(location))
+        if kind == "[":
+            # empty list; others are parsed by expression()
+            self.expect("]")
+            return self.finish(ListExpr(location, []))
+        if kind in UNSUPPORTED or kind == "{":
+            raise ParseError("Unsupported", token)
+        raise self.unexpected(token)
@@ -0,0 +1,51 @@
+import io
+import json
+import time
+from .compiler import Compiler
+from .jsonwriter import writeJSON
+
+# Newline-delimited JSON pipeline: each input line is a JSON object
+# {"id": any, "source": str, "typecheck": bool (default true)} and each
+# output line is {"id": ..., "ast": AST JSON or null, "errors": [str],
+# "timings": {"parse": ms, "typecheck": ms, "serialize": ms}}.
+# Lines that can't be handled get {"id": ..., "error": str} instead.
+
+
+def compileLine(compiler: Compiler, request: dict, out):
+    timings = {}
+    tree, parseErrors, tcErrors = compiler.compile(request["source"], request.get("typecheck", True),
+                                                   timings=timings)
+    errors = [str(e) for e in parseErrors] + tcErrors
+    start = time.perf_counter()
+    out.write('{"id": ' + json.dumps(request.get("id")) + ', "ast": ')
+    if tree is None:
+        out.write("null")
+    else:
+        with compiler.phase("serialize"):
+            writeJSON(tree, out)
+    timings["serialize"] = (time.perf_counter() - start) * 1000
+    out.write(', "errors": ' + json.dumps(errors) + ', "timings": ' + json.dumps(timings) + "}\n")
+
+
+def runPipeline(compiler: Compiler, infile, outfile):
+    # compile each program read from infile, writing one result line per input line
+    for line in infile:
+        if not line.strip():
+            continue
+        request = None
+        try:
+            request = json.loads(line)
+            # build the line separately so a failure never leaves half a line behind
+            out = io.StringIO()
+            if compiler.tracer is None:
+                compileLine(compiler, request, out)
+            else:
+                with compiler.tracer.span(str(request.get("id")), "program"):
+                    compileLine(compiler, request, out)
+            result = out.getvalue()
+        except Exception as e:
+            rid = request.get("id") if isinstance(request, dict) else None
+            result = json.dumps({"id": rid, "error": repr(e)}) + "\n"
+        outfile.write(result)
+        outfile.flush()
+
@@ -1,155 +1,609 @@
+import ast
+import re
 from ast import *
+from types import GeneratorType
 from .astnodes import *
+from .summary import Summary
 
 
 class ParseError(Exception):
     # for AST structures that are legal in Python 3 but not in Chocopy
-    def __init__(self, message, node=None):
+    # columns in messages are 1-based, like node locations; col overrides the
+    # one derived from the node's col_offset (a UTF-8 byte offset for Python
+    # AST nodes, see Parser.error)
+    def __init__(self, message, node=None, col: int = None):
+        self.line = None  # line of the construct, if known
         if node is not None:
             if hasattr(node, "lineno"):
+                if col is None:
+                    col = node.col_offset + 1
                 super().__init__(
-                    message + ". Line {:d} Col {:d}".format(node.lineno, node.col_offset))
+                    message + ". Line {:d} Col {:d}".format(node.lineno, col))
+                self.line = node.lineno
                 return
         super().__init__(message + ".")
 
 
+LINE_BREAK = re.compile(r"\r\n|\r|\n")
+# for splitting sources into runs of top-level statements, see Parser.topLevelChunks
+CHUNK_LINES = 1000
+CONTINUING = re.compile(r"(elif|else|except|finally)\b")
+NOT_STATEMENT_START = ("", " ", "\t", "\f", "#")
+SKIPPED = re.compile(r""""(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|#.*""")
+OPEN_BRACKET = re.compile(r"[(\[{]")
+CLOSE_BRACKET = re.compile(r"[)\]}]")
+# statements that end with an indented block, see Parser.blockEnd
+COMPOUND = (If, While, For, FunctionDef, ClassDef)
+
+
+def dispatchTable(cls) -> dict:
+    # map every Python AST node type to the unbound visit_ method of cls that
+    # handles it, so visiting doesn't look the method up by name for each node
+    table = {}
+    stack = [ast.AST]
+    while stack:
+        nodeType = stack.pop()
+        stack.extend(nodeType.__subclasses__())
+        handler = getattr(cls, "visit_" + nodeType.__name__, None)
+        if handler is not None:
+            table[nodeType] = handler
+    return table
+
+
 class Parser(NodeVisitor):
+    # Python AST node type -> handler, built once per class (see dispatchTable)
+    handlers = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.handlers = dispatchTable(cls)
+
     def __init__(self):
         self.errors = []
+        self.tracer = None  # optional tracer.Tracer, set by the Compiler
+        # source lines, set by the Compiler (see setSource); without them
+        # identifier columns are guessed and compound statements get no end
+        self.lines = None
+        self.ascii = None  # whether each line is pure ASCII
+        # record a Summary of each scope's declarations for the TypeChecker
+        self.summarize = False
+        # release each top-level Python statement once it is lowered (see lowerReleasing)
+        self.release = False
+        # carry on past rejected constructs instead of dropping what contains
+        # them (see reject and placeholder)
+        self.recover = False
+
+    def setSource(self, source):
+        # (a byte order mark isn't part of the first line, as for ast.parse)
+        if isinstance(source, bytes):
+            source = source.decode("utf-8-sig", "replace")
+        if source.startswith("\ufeff"):
+            source = source[1:]
+        self.lines = LINE_BREAK.split(source)
+        self.ascii = [line.isascii() for line in self.lines]
 
     # reduce a list of >2 expressions separated by a
     # left-associative operator into a BinaryExpr tree
-    def binaryReduce(self, op: str, values: [Expr]) -> Expr:
-        current = BinaryExpr(values[0].location, values[0], op, values[1])
-        for v in values[2:]:
-            current = BinaryExpr(values[0].location, current, op, v)
+    def binaryReduce(self, op: str, values: [Expr], node) -> Expr:
+        location = self.getLocation(node)
+        current = values[0]
+        for v in values[1:]:
+            # each operation but the last ends just before the next operator
+            current.endLocation = current.endLocation or self.endBefore(v.location, op)
+            current = BinaryExpr(location, current, op, v)
+        current.endLocation = self.getEndLocation(node)
         return current
 
-    def getLocation(self, node) -> [int]:
+    def getLocation(self, node) -> (int, int):
         # input is Python AST node
-        # get 2 item list corresponding to AST node starting location
+        # get (line, col) tuple of the AST node's starting location
         # make columns 1-indexed
-        return [node.lineno, node.col_offset + 1]
+        return (node.lineno, self.column(node.lineno, node.col_offset))
+
+    def getEndLocation(self, node) -> (int, int):
+        # (line, col) of the last character of a Python AST node
+        return (node.end_lineno, self.column(node.end_lineno, node.end_col_offset) - 1)
+
+    def column(self, lineno: int, offset: int) -> int:
+        # Python AST columns are UTF-8 byte offsets; make them 1-indexed characters
+        if self.lines is None or self.ascii[lineno - 1]:
+            return offset + 1
+        return len(self.lines[lineno - 1].encode("utf-8")[:offset].decode("utf-8", "replace")) + 1
+
+    def error(self, message: str, node=None) -> ParseError:
+        # a ParseError at a Python AST node, with its column in characters
+        if node is None or not hasattr(node, "lineno"):
+            return ParseError(message, node)
+        return ParseError(message, node, self.column(node.lineno, node.col_offset))
+
+    def endBefore(self, location: (int, int), keyword: str) -> (int, int):
+        # the last character before a keyword that precedes location
+        if self.lines is None:
+            return None
+        line, col = location[0], location[1] - 1
+        skipped = False
+        while True:
+            # (the operand may be in parentheses)
+            text = self.lines[line - 1][:col].rstrip() if skipped else self.lines[line - 1][:col].rstrip(" \t\f(")
+            if text:
+                if skipped:
+                    return (line, len(text))
+                text = text[:-len(keyword)].rstrip()
+                skipped = True
+                if text:
+                    return (line, len(text))
+            line -= 1
+            col = len(self.lines[line - 1])
+
+    def nameAfter(self, node, keyword: str, name: str) -> Identifier:
+        # the identifier following a keyword at the start of a statement
+        location = self.getLocation(node)
+        if self.lines is None:
+            # assume a single space after the keyword
+            return Identifier((location[0], location[1] + len(keyword) + 1), name)
+        line = self.lines[location[0] - 1]
+        col = location[1] - 1 + len(keyword)
+        while line[col] in " \t\f":
+            col += 1
+        identifier = Identifier((location[0], col + 1), name)
+        identifier.endLocation = (location[0], col + len(name))
+        return identifier
+
+    # ENDS OF COMPOUND STATEMENTS
+    # These follow the native parser (see nativeparser.py): a compound
+    # statement or definition takes in the NEWLINE token ending its body, or,
+    # when its body ends with a nested indented block, the DEDENT token just
+    # before the next token after it.
+
+    def lastBlock(self, node) -> list:
+        if isinstance(node, (If, While, For)):
+            return node.orelse or node.body
+        return node.body
+
+    def isElif(self, node) -> bool:
+        # whether an If node's else branch is an elif
+        if len(node.orelse) != 1 or not isinstance(node.orelse[0], If):
+            return False
+        e = node.orelse[0]
+        return self.lines[e.lineno - 1].startswith("elif", e.col_offset)
+
+    def isIndented(self, block: list) -> bool:
+        # whether a block starts on a line of its own, rather than after the colon
+        first = block[0]
+        return self.lines[first.lineno - 1][:first.col_offset].strip() == ""
+
+    def endsWithBlock(self, node) -> bool:
+        # whether a statement ends with an indented block
+        if not isinstance(node, COMPOUND):
+            return False
+        if isinstance(node, If) and self.isElif(node):
+            return self.endsWithBlock(node.orelse[0])
+        return self.isIndented(self.lastBlock(node))
+
+    def lineEnd(self, lineno: int) -> (int, int):
+        # position of the NEWLINE token ending a line
+        return (lineno, len(self.lines[lineno - 1]) + 1)
+
+    def blockEnd(self, node) -> (int, int):
+        # end location of a compound statement
+        if isinstance(node, If) and self.isElif(node):
+            return self.blockEnd(node.orelse[0])
+        block = self.lastBlock(node)
+        if self.isIndented(block) and self.endsWithBlock(block[-1]):
+            # just before the next token, or at the end of the file
+            for lineno in range(node.end_lineno + 1, len(self.lines) + 1):
+                line = self.lines[lineno - 1]
+                text = line.lstrip()
+                if text and not text.startswith("#"):
+                    return (lineno, len(line) - len(text))
+            return (len(self.lines), 0)
+        return self.lineEnd(block[-1].end_lineno)
+
+    def statementEnd(self, node) -> (int, int):
+        # where a statement ends, counting the NEWLINE after simple statements
+        if isinstance(node, COMPOUND):
+            return self.blockEnd(node)
+        return self.lineEnd(node.end_lineno)
 
     def visit(self, node):
+        # same as NodeVisitor.visit, with the handler found by node type
         try:
-            return super().visit(node)
+            result = self.handlers.get(node.__class__, NodeVisitor.generic_visit)(self, node)
         except ParseError as e:
+            if self.recover:
+                return self.placeholder(node, e)
             self.errors.append(e)
             return
+        if isinstance(result, GeneratorType):
+            return self.lowerExpression(result, node)
+        if isinstance(result, Node) and result.endLocation is None and hasattr(node, "end_lineno"):
+            result.endLocation = self.getEndLocation(node)
+        return result
+
+    def lowerExpression(self, handler, node) -> Expr:
+        # expression handlers are generators that yield each Python AST child
+        # they need and are sent back its lowered node; running them off an
+        # explicit stack keeps deeply nested expressions within the recursion
+        # limit. Errors are handled as in visit: the node that raised lowers to None.
+        # Python AST nodes that lower to Nodes give them their end locations
+        handlers = self.handlers
+        stack = [handler]
+        nodes = [node]
+        value = None
+        while stack:
+            try:
+                child = stack[-1].send(value)
+            except StopIteration as done:
+                stack.pop()
+                value = done.value
+                node = nodes.pop()
+                if isinstance(value, Node) and value.endLocation is None:
+                    value.endLocation = self.getEndLocation(node)
+                continue
+            except ParseError as e:
+                stack.pop()
+                node = nodes.pop()
+                if self.recover:
+                    value = self.placeholder(node, e)
+                    continue
+                self.errors.append(e)
+                value = None
+                continue
+            try:
+                value = handlers.get(child.__class__, NodeVisitor.generic_visit)(self, child)
+            except ParseError as e:
+                if self.recover:
+                    value = self.placeholder(child, e)
+                    continue
+                self.errors.append(e)
+                value = None
+                continue
+            if value.__class__ is GeneratorType:
+                stack.append(value)
+                nodes.append(child)
+                value = None
+            elif isinstance(value, Node) and value.endLocation is None:
+                value.endLocation = self.getEndLocation(child)
+        return value
 
     # process python AST nodes into chocopy type annotations
     def getTypeAnnotation(self, node) -> TypeAnnotation:
         location = self.getLocation(node)
-        if isinstance(node, List):
-            if len(node.elts) > 1:
-                raise ParseError("Unsupported List type annotation", node)
-            return ListType(location, self.getTypeAnnotation(node.elts[0]))
+        if isinstance(node, List) and len(node.elts) <= 1:
+            annotation = ListType(location, self.getTypeAnnotation(node.elts[0]))
         elif isinstance(node, Name):
-            return ClassType(location, node.id)
+            annotation = ClassType(location, node.id)
         elif isinstance(node, Str):
-            return ClassType(location, node.s)
+            annotation = ClassType(location, node.s)
+        else:
+            if isinstance(node, List):
+                self.reject("Unsupported List type annotation", node)
+            else:
+                self.reject("Unsupported type annotation", node)
+            annotation = ClassType(location, "object")
+            annotation.errorMsg = str(self.errors[-1])
+        annotation.endLocation = self.getEndLocation(node)
+        return annotation
+
+    # ERROR RECOVERY
+    # By default, the node whose lowering raised a ParseError lowers to None
+    # (or its whole enclosing statement does), and the Compiler doesn't
+    # typecheck a program with parse errors. In recovery
+    # mode every error is reported and the tree is kept whole: rejected
+    # expressions are replaced by placeholders, and rejected parts of
+    # declarations and statements are left out. Placeholders are None
+    # literals and object type annotations carrying the parse error as their
+    # errorMsg. Top-level declarations and statements with errors are listed
+    # in Program.damaged, so the TypeChecker can skip them and check the rest.
+
+    def reject(self, message: str, node=None):
+        # raise a ParseError, or in recovery mode record it and let the caller
+        # carry on without the rejected construct
+        error = self.error(message, node)
+        if not self.recover:
+            raise error
+        self.errors.append(error)
+
+    def placeholder(self, node, error: ParseError) -> Node:
+        # record an error raised while lowering node, in recovery mode, and
+        # return what stands in for node
+        if isinstance(node, (ast.operator, ast.unaryop, ast.boolop, ast.cmpop)):
+            # unsupported operators replace the expression using them
+            raise error
+        if error.line is None and hasattr(node, "lineno"):
+            error.line = node.lineno
+        self.errors.append(error)
+        if isinstance(node, ast.expr):
+            result = NoneLiteral(self.getLocation(node))
+        elif isinstance(node, ast.arg):
+            location = self.getLocation(node)
+            result = TypedVar(location, Identifier(location, node.arg), ClassType(location, "object"))
         else:
-            raise ParseError("Unsupported type annotation", node)
+            return None  # statements are left out
+        result.errorMsg = str(error)
+        result.endLocation = self.getEndLocation(node)
+        return result
+
+    def statementsOnly(self, body: [Stmt], node) -> [Stmt]:
+        # the body of a compound statement, which can't contain declarations
+        for s in body:
+            if isinstance(s, Declaration):
+                self.reject("Illegal declaration", node)
+                return [s for s in body if not isinstance(s, Declaration)]
+        return body
+
+    def itemsWithErrors(self, pyBody: [ast.stmt], last: int = None) -> set:
+        # indices of the statements in a body that errors were reported in;
+        # each one spans the lines up to the next one, and the last one up
+        # to line last (or the end of the source)
+        lines = sorted(e.line for e in self.errors if e.line is not None)
+        items = set()
+        i = 0
+        for j in range(len(pyBody)):
+            while i < len(lines) and lines[i] < pyBody[j].lineno:
+                i += 1
+            if i == len(lines):
+                break
+            if j + 1 < len(pyBody):
+                if lines[i] < pyBody[j + 1].lineno:
+                    items.add(j)
+            elif last is None or lines[i] <= last:
+                items.add(j)
+        return items
 
     # see https://greentreesnakes.readthedocs.io/en/latest/nodes.html
     # and https://docs.python.org/3/library/ast.html
 
     def visit_Module(self, node):
-        location = [1, 1]
         if hasattr(node, "type_ignores") and node.type_ignores:
-            raise ParseError("Cannot ignore type", node)
-        body = [self.visit(b) for b in node.body]
+            raise self.error("Cannot ignore type", node)
+        # (compound statements end just before whatever follows them, so
+        # this needs the last statement itself)
+        end = None
+        if self.lines is not None and node.body:
+            end = self.statementEnd(node.body[-1])
+        if self.release:
+            body = self.lowerReleasing(node)
+        elif self.tracer is None:
+            body = [self.visit(b) for b in node.body]
+        else:
+            body = []
+            for b in node.body:
+                with self.tracer.lowerSpan(b):
+                    body.append(self.visit(b))
+        return self.program(node.body, body, end)
+
+    def program(self, pyBody: [ast.stmt], body: [Node], end: (int, int)) -> Program:
+        # sort the lowered top-level statements of pyBody into a Program
+        location = (1, 1)
         declarations = []
         statements = []
+        summary = Summary() if self.summarize else None
+        # (when recovering, statements left out for their errors don't count
+        # as statements that declarations must come before)
+        dropped = self.itemsWithErrors(pyBody) if self.recover else ()
         decl = True
         for i in range(len(body)):
             b = body[i]
             if isinstance(b, Declaration):
                 if isinstance(b, VarDef):
                     if not isinstance(b.value, Literal):
-                        raise ParseError(
-                            "Global variables can only be initialized with literals", node.body[i])
+                        self.reject(
+                            "Global variables can only be initialized with literals", pyBody[i])
                 if (isinstance(body[i], GlobalDecl) or isinstance(body[i], NonLocalDecl)):
-                    raise ParseError(
-                        "Expected function, class, or variable declaration", node.body[i])
+                    self.reject(
+                        "Expected function, class, or variable declaration", pyBody[i])
+                    continue
                 if decl == False:
-                    raise ParseError(
-                        "All declarations must come before statements", node.body[i])
+                    self.reject(
+                        "All declarations must come before statements", pyBody[i])
                 declarations.append(b)
+                if summary is not None:
+                    summary.add(b)
+            elif b is None and i in dropped:
+                continue
             elif b is None or isinstance(b, Stmt):
                 statements.append(b)
                 decl = False
             else:
-                raise ParseError(
-                    "Expected declaration or statement", node.body[i])
-        if declarations:
-            location = declarations[0].location
-        return Program(location, declarations, statements, Errors([0, 0], []))
+                self.reject(
+                    "Expected declaration or statement", pyBody[i])
+        # the program starts where its first declaration or statement does
+        first = declarations or [s for s in statements if s is not None]
+        if first:
+            location = first[0].location
+        program = Program(location, declarations, statements, Errors((0, 0), []))
+        program.summary = summary
+        program.endLocation = end
+        if self.recover:
+            damaged = {id(body[i]) for i in self.itemsWithErrors(pyBody) if body[i] is not None}
+            program.damaged = [b for b in declarations + statements if id(b) in damaged]
+        return program
+
+    def lowerReleasing(self, node: Module) -> list:
+        # lower the top-level statements one at a time, replacing each one in
+        # the module with a bare Pass at the same position as soon as it is
+        # lowered, so its Python subtree is freed while the rest is lowered
+        # and both ASTs are never held in full at once
+        body = []
+        statements = node.body
+        for i in range(len(statements)):
+            b = statements[i]
+            if self.tracer is None:
+                body.append(self.visit(b))
+            else:
+                with self.tracer.lowerSpan(b):
+                    body.append(self.visit(b))
+            statements[i] = Pass(lineno=b.lineno, col_offset=b.col_offset)
+        return body
+
+    def lowerChunks(self) -> Program:
+        # parse and lower the source (from setSource) a run of top-level
+        # statements at a time, so only one run's Python AST exists at once;
+        # the result is the same as visiting ast.parse of the whole source
+        chunks = self.topLevelChunks()
+        if chunks is None:
+            return self.lowerWhole()
+        errors = len(self.errors)
+        positions = []  # a bare Pass at the position of each statement
+        body = []
+        end = None
+        for first, last in chunks:
+            try:
+                chunk = ast.parse("\n".join(self.lines[first - 1:last]))
+            except SyntaxError:
+                # report it (or whatever split the run wrongly) for the whole source
+                del self.errors[errors:]
+                return self.lowerWhole()
+            ast.increment_lineno(chunk, first - 1)
+            statements = chunk.body
+            if statements:
+                end = self.statementEnd(statements[-1])
+            for i in range(len(statements)):
+                b = statements[i]
+                if self.tracer is None:
+                    body.append(self.visit(b))
+                else:
+                    with self.tracer.lowerSpan(b):
+                        body.append(self.visit(b))
+                positions.append(Pass(lineno=b.lineno, col_offset=b.col_offset))
+                statements[i] = None
+        try:
+            return self.program(positions, body, end)
+        except ParseError as e:
+            self.errors.append(e)
+
+    def lowerWhole(self) -> Program:
+        release = self.release
+        self.release = True
+        try:
+            return self.visit(ast.parse("\n".join(self.lines)))
+        finally:
+            self.release = release
+
+    def topLevelChunks(self) -> list:
+        # (first line, last line) of runs of at least CHUNK_LINES lines that
+        # each hold whole top-level statements, found by following brackets,
+        # strings and line continuations; None for sources with triple-quoted
+        # strings, which this doesn't follow
+        chunks = []
+        start = 1
+        depth = 0
+        continued = False
+        lineno = 0
+        for line in self.lines:
+            lineno += 1
+            if (depth == 0 and not continued and lineno - start >= CHUNK_LINES
+                    and line[:1] not in NOT_STATEMENT_START and CONTINUING.match(line) is None):
+                # a new top-level statement
+                chunks.append((start, lineno - 1))
+                start = lineno
+            if '"' in line or "'" in line or "#" in line:
+                if '"""' in line or "'''" in line:
+                    return None
+                line = SKIPPED.sub("", line)
+            opened = line.count("(") + line.count("[") + line.count("{")
+            if opened or depth:
+                depth = max(0, depth + opened - line.count(")") - line.count("]") - line.count("}"))
+            continued = line.endswith("\\")
+        chunks.append((start, len(self.lines)))
+        return chunks
 
     def visit_FunctionDef(self, node):
         if node.decorator_list:
-            raise ParseError("Unsupported decorator list",
-                             node.decorator_list[0])
+            self.reject("Unsupported decorator list",
+                        node.decorator_list[0])
         location = self.getLocation(node)
-        identifier = Identifier([location[0], location[1] + 4], node.name)
+        identifier = self.nameAfter(node, "def", node.name)
         arguments = self.visit(node.args)
         body = [self.visit(b) for b in node.body]
         declarations = []
         statements = []
+        summary = Summary() if self.summarize else None
+        dropped = self.itemsWithErrors(node.body, node.end_lineno) if self.recover else ()
         decl = True
         for i in range(len(body)):
             b = body[i]
             if isinstance(b, Declaration):
                 if isinstance(b, ClassDef):
-                    raise ParseError(
+                    self.reject(
                         "Inner classes are unsupported", node.body[i])
+                    continue
                 if decl == False:
-                    raise ParseError(
+                    self.reject(
                         "All declarations must come before statements", node.body[i])
                 declarations.append(b)
+                if summary is not None:
+                    summary.add(b)
+            elif b is None and i in dropped:
+                continue
             elif b is None or isinstance(b, Stmt):
                 statements.append(b)
                 decl = False
             else:
-                raise ParseError(
+                self.reject(
                     "Expected declaration or statement", node.body[i])
         returns = None
         if node.name == "__init__" and node.returns is not None:
-            raise ParseError("__init__ cannot have a return type", node)
+            self.reject("__init__ cannot have a return type", node)
+            node.returns = None
         if node.returns is None:
             returns = ClassType(location, "<None>")
         else:
             returns = self.getTypeAnnotation(node.returns)
-        return FuncDef(location, identifier, arguments, returns, declarations, statements)
+        funcDef = FuncDef(location, identifier, arguments, returns, declarations, statements)
+        funcDef.summary = summary
+        if self.lines is not None:
+            funcDef.endLocation = self.blockEnd(node)
+        return funcDef
 
     def visit_ClassDef(self, node):
         location = self.getLocation(node)
-        identifier = Identifier([location[0], location[1] + 6], node.name)
+        identifier = self.nameAfter(node, "class", node.name)
         if len(node.bases) > 1:
-            raise ParseError("Multiple inheritance is unsupported", node.bases[1])
+            self.reject("Multiple inheritance is unsupported", node.bases[1])
         base = None
         if len(node.bases) == 0:
-            base = ClassType([location[0], location[1] + 7 + len(node.name)], "object")
+            # implicitly object, as an empty range just after the class name
+            end = identifier.endLocation or (location[0], location[1] + 5 + len(node.name))
+            base = Identifier((end[0], end[1] + 1), "object")
+            base.endLocation = end
         else:
             base = self.visit(node.bases[0])
+            if self.recover and not isinstance(base, Identifier):
+                self.reject("Expected superclass name", node.bases[0])
+                base = Identifier(self.getLocation(node.bases[0]), "object")
         if node.keywords:
-            raise ParseError("Unsupported keywords", node.keywords[0])
+            self.reject("Unsupported keywords", node.keywords[0])
         if node.decorator_list:
-            raise ParseError("Unsupported decorator list",
-                             node.decorator_list[0])
+            self.reject("Unsupported decorator list",
+                        node.decorator_list[0])
         body = [self.visit(b) for b in node.body]
+        summary = Summary() if self.summarize else None
+        dropped = self.itemsWithErrors(node.body, node.end_lineno) if self.recover else ()
         # allow class bodies that only contain a single pass
         if len(body) == 1 and body[0] == None:
             body = []
         else:
+            members = []
             for i in range(len(body)):
                 if not isinstance(body[i], Declaration):
-                    raise ParseError("Expected declaration", node.body[i])
+                    if body[i] is not None or i not in dropped:
+                        self.reject("Expected declaration", node.body[i])
+                    continue
                 if (isinstance(body[i], ClassDef) or isinstance(body[i], GlobalDecl) or isinstance(body[i], NonLocalDecl)):
-                    raise ParseError(
+                    self.reject(
                         "Expected attribute or method declaration", node.body[i])
-        return ClassDef(location, identifier, base, body)
+                    continue
+                members.append(body[i])
+                if summary is not None:
+                    summary.add(body[i])
+            body = members
+        classDef = ClassDef(location, identifier, base, body)
+        classDef.summary = summary
+        if self.lines is not None:
+            classDef.endLocation = self.blockEnd(node)
+        return classDef
 
     def visit_Return(self, node):
         location = self.getLocation(node)
@@ -164,42 +618,50 @@ class Parser(NodeVisitor):
         return AssignStmt(location, targets, self.visit(node.value))
 
     def visit_AnnAssign(self, node):
-        if not node.value:
-            raise ParseError("Expected initializing value", node)
         if not hasattr(node, "annotation") or not node.annotation:
-            raise ParseError("Missing type annotation", node)
+            raise self.error("Missing type annotation", node)
         if not node.simple:
-            raise ParseError("Expected variable", node.target)
+            # when recovering, the declaration is left out
+            self.reject("Expected variable", node.target)
+            return None
         location = self.getLocation(node)
         var = TypedVar(self.getLocation(node.target),
                        self.visit(node.target), self.getTypeAnnotation(node.annotation))
-        value = self.visit(node.value)
-        if not isinstance(value, Literal):
-            raise ParseError("Expected literal value", node.value)
+        var.endLocation = var.type.endLocation
+        if not node.value:
+            self.reject("Expected initializing value", node)
+            value = self.placeholder(node.annotation, self.errors.pop())
+        else:
+            value = self.visit(node.value)
+            if not isinstance(value, Literal):
+                self.reject("Expected literal value", node.value)
+                value = self.placeholder(node.value, self.errors.pop())
         return VarDef(location, var, value)
 
     def visit_While(self, node):
         location = self.getLocation(node)
         if node.orelse:
-            raise ParseError("Cannot have else in while", node)
+            self.reject("Cannot have else in while", node)
         condition = self.visit(node.test)
         body = [self.visit(b) for b in node.body]
-        for s in body:
-            if isinstance(s, Declaration):
-                raise ParseError("Illegal declaration", node)
-        return WhileStmt(location, condition, body)
+        body = self.statementsOnly(body, node)
+        whileStmt = WhileStmt(location, condition, body)
+        if self.lines is not None:
+            whileStmt.endLocation = self.blockEnd(node)
+        return whileStmt
 
     def visit_For(self, node):
         location = self.getLocation(node)
         if node.orelse:
-            raise ParseError("Cannot have else in for", node)
+            self.reject("Cannot have else in for", node)
         identifier = self.visit(node.target)
         iterable = self.visit(node.iter)
         body = [self.visit(b) for b in node.body]
-        for s in body:
-            if isinstance(s, Declaration):
-                raise ParseError("Illegal declaration", node)
-        return ForStmt(location, identifier, iterable, body)
+        body = self.statementsOnly(body, node)
+        forStmt = ForStmt(location, identifier, iterable, body)
+        if self.lines is not None:
+            forStmt.endLocation = self.blockEnd(node)
+        return forStmt
 
     def visit_If(self, node):
         location = self.getLocation(node)
@@ -208,29 +670,27 @@ class Parser(NodeVisitor):
         if not node.orelse:
             node.orelse = []
         else_body = [self.visit(o) for o in node.orelse]
-        for s in then_body + else_body:
-            if isinstance(s, Declaration):
-                raise ParseError("Illegal declaration", node)
-        return IfStmt(location, condition, then_body, else_body)
+        then_body = self.statementsOnly(then_body, node)
+        else_body = self.statementsOnly(else_body, node)
+        ifStmt = IfStmt(location, condition, then_body, else_body)
+        if self.lines is not None:
+            ifStmt.endLocation = self.blockEnd(node)
+        return ifStmt
 
     def visit_Global(self, node):
         location = self.getLocation(node)
         if len(node.names) != 1:
-            raise ParseError(
+            self.reject(
                 "Only one identifier is allowed per global declaration", node)
-        # the ID starts 7 characters to the right
-        idLoc = [location[0], location[1] + 7]
-        identifier = Identifier(idLoc, node.names[0])
+        identifier = self.nameAfter(node, "global", node.names[0])
         return GlobalDecl(location, identifier)
 
     def visit_Nonlocal(self, node):
         location = self.getLocation(node)
         if len(node.names) != 1:
-            raise ParseError(
+            self.reject(
                 "Only one identifier is allowed per nonlocal declaration", node)
-        # the ID starts 7 characters to the right
-        idLoc = [location[0], location[1] + 7]
-        identifier = Identifier(idLoc, node.names[0])
+        identifier = self.nameAfter(node, "nonlocal", node.names[0])
         return NonLocalDecl(location, identifier)
 
     def visit_Expr(self, node):
@@ -244,39 +704,43 @@ class Parser(NodeVisitor):
         return None
 
     def visit_BoolOp(self, node):
-        values = [self.visit(v) for v in node.values]
+        values = []
+        for v in node.values:
+            values.append((yield v))
         op = self.visit(node.op)
-        return self.binaryReduce(op, values)
+        return self.binaryReduce(op, values, node)
 
     def visit_BinOp(self, node):
-        left = self.visit(node.left)
-        right = self.visit(node.right)
+        left = yield node.left
+        right = yield node.right
         location = self.getLocation(node)
         return BinaryExpr(location, left, self.visit(node.op), right)
 
     def visit_UnaryOp(self, node):
-        operand = self.visit(node.operand)
+        operand = yield node.operand
         location = self.getLocation(node)
         return UnaryExpr(location, self.visit(node.op), operand)
 
     def visit_IfExp(self, node):
         location = self.getLocation(node)
-        condition = self.visit(node.test)
-        then_body = self.visit(node.body)
-        else_body = self.visit(node.orelse)
+        condition = yield node.test
+        then_body = yield node.body
+        else_body = yield node.orelse
         return IfExpr(location, condition, then_body, else_body)
 
     def visit_Call(self, node):
         location = self.getLocation(node)
-        function = self.visit(node.func)
+        function = yield node.func
         if node.keywords:
-            raise ParseError("Keyword args are not supported", node)
-        arguments = [self.visit(a) for a in node.args]
+            self.reject("Keyword args are not supported", node)
+        arguments = []
+        for a in node.args:
+            arguments.append((yield a))
         if isinstance(function, MemberExpr):
             return MethodCallExpr(location, function, arguments)
         if isinstance(function, Identifier):
             return CallExpr(location, function, arguments)
-        raise ParseError("Invalid receiver of call", node.func)
+        raise self.error("Invalid receiver of call", node.func)
 
     def visit_Constant(self, node):
         # support for Python 3.8
@@ -289,27 +753,34 @@ class Parser(NodeVisitor):
             return StringLiteral(location, node.value)
         elif node.value is None:
             return NoneLiteral(location)
+        elif isinstance(node.value, (float, complex)):
+            raise self.error("Only integers are supported", node)
         else:
-            raise ParseError("Unsupported constant", node)
+            raise self.error("Unsupported constant", node)
 
     def visit_Compare(self, node):
         if len(node.ops) > 1 or len(node.comparators) > 1:
-            raise ParseError("Unsupported compare between > 2 things", node)
+            raise self.error("Unsupported compare between > 2 things", node)
         location = self.getLocation(node)
-        left = self.visit(node.left)
+        left = yield node.left
         operator = self.visit(node.ops[0])
-        right = self.visit(node.comparators[0])
+        right = yield node.comparators[0]
         return BinaryExpr(location, left, operator, right)
 
     def visit_Attribute(self, node):
         location = self.getLocation(node)
-        obj = self.visit(node.value)
-        member = Identifier(location, node.attr)
+        obj = yield node.value
+        # the attribute name is the last thing in the node
+        end = self.getEndLocation(node)
+        member = Identifier((end[0], end[1] - len(node.attr) + 1), node.attr)
+        member.endLocation = end
         return MemberExpr(location, obj, member)
 
     def visit_Subscript(self, node):
         location = self.getLocation(node)
-        return IndexExpr(location, self.visit(node.value), self.visit(node.slice))
+        lst = yield node.value
+        index = yield node.slice
+        return IndexExpr(location, lst, index)
 
     def visit_Name(self, node):
         location = self.getLocation(node)
@@ -318,7 +789,7 @@ class Parser(NodeVisitor):
     def visit_Num(self, node):
         location = self.getLocation(node)
         if not isinstance(node.n, int):
-            raise ParseError("Only integers are supported", node)
+            raise self.error("Only integers are supported", node)
         return IntegerLiteral(location, node.n)
 
     def visit_Str(self, node):
@@ -327,7 +798,9 @@ class Parser(NodeVisitor):
 
     def visit_List(self, node):
         location = self.getLocation(node)
-        elements = [self.visit(e) for e in node.elts]
+        elements = []
+        for e in node.elts:
+            elements.append((yield e))
         return ListExpr(location, elements)
 
     def visit_NameConstant(self, node):
@@ -337,18 +810,18 @@ class Parser(NodeVisitor):
         elif isinstance(node.value, bool):
             return BooleanLiteral(location, node.value)
         else:
-            raise ParseError("Unsupported name constant", node)
+            raise self.error("Unsupported name constant", node)
 
     def visit_Index(self, node):
-        return self.visit(node.value)
+        return (yield node.value)
 
     def visit_arguments(self, node):
         if node.vararg:
-            raise ParseError("Unsupported vararg", node.vararg)
+            self.reject("Unsupported vararg", node.vararg)
         if node.kwarg:
-            raise ParseError("Unsupported kwarg", node.kwarg)
+            self.reject("Unsupported kwarg", node.kwarg)
         if node.defaults or node.kw_defaults:
-            raise ParseError("Default arguments are unsupported", node)
+            self.reject("Default arguments are unsupported", node)
         args = []
         if hasattr(node, "posonlyargs"):
             args = node.posonlyargs
@@ -359,9 +832,10 @@ class Parser(NodeVisitor):
     def visit_arg(self, node):
         # type annotation is either Str(s) or Name(id)
         if not hasattr(node, "annotation") or not node.annotation:
-            raise ParseError("Missing type annotation", node)
+            raise self.error("Missing type annotation", node)
         location = self.getLocation(node)
         identifier = Identifier(location, node.arg)
+        identifier.endLocation = (location[0], location[1] + len(node.arg) - 1)
         annotation = self.getTypeAnnotation(node.annotation)
         return TypedVar(location, identifier, annotation)
 
@@ -418,175 +892,175 @@ class Parser(NodeVisitor):
     # Unsupported node: TODO improve error messages
 
     def visit_Expression(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_AsyncFunctionDef(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Delete(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_AsyncFor(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_AugAssign(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_With(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_AsyncWith(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Raise(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Try(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Assert(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Import(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_ImportFrom(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Break(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Continue(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Lambda(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Dict(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Set(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Bytes(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Ellipses(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_ListComp(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_SetComp(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_DictComp(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_GeneratorExp(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Await(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Yield(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_YieldFrom(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_FormattedValue(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_JoinedStr(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Starred(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Tuple(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_AugLoad(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_AugStore(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_MatMult(self, node):
-        raise ParseError("Unsupported operator: @")
+        raise self.error("Unsupported operator: @")
 
     def visit_Div(self, node):
-        raise ParseError("Unsupported operator: /")
+        raise self.error("Unsupported operator: /")
 
     def visit_Slice(self, node):
-        raise ParseError("Unsupported slice")
+        raise self.error("Unsupported slice", node)
 
     def visit_ExtSlice(self, node):
-        raise ParseError("Unsupported slice")
+        raise self.error("Unsupported slice")
 
     def visit_Pow(self, node):
-        raise ParseError("Unsupported operator: **")
+        raise self.error("Unsupported operator: **")
 
     def visit_LShift(self, node):
-        raise ParseError("Unsupported operator: <<")
+        raise self.error("Unsupported operator: <<")
 
     def visit_RShift(self, node):
-        raise ParseError("Unsupported operator: >>")
+        raise self.error("Unsupported operator: >>")
 
     def visit_BitOr(self, node):
-        raise ParseError("Unsupported operator: |")
+        raise self.error("Unsupported operator: |")
 
     def visit_BitXor(self, node):
-        raise ParseError("Unsupported operator: ^")
+        raise self.error("Unsupported operator: ^")
 
     def visit_BitAnd(self, node):
-        raise ParseError("Unsupported operator: &")
+        raise self.error("Unsupported operator: &")
 
     def visit_UAdd(self, node):
-        raise ParseError("Unsupported operator: unary +")
+        raise self.error("Unsupported operator: unary +")
 
     def visit_Invert(self, node):
-        raise ParseError("Unsupported operator: ~")
+        raise self.error("Unsupported operator: ~")
 
     def visit_IsNot(self, node):
-        raise ParseError("Unsupported operator: is not")
+        raise self.error("Unsupported operator: is not")
 
     def visit_In(self, node):
-        raise ParseError("Unsupported operator: in")
+        raise self.error("Unsupported operator: in")
 
     def visit_NotIn(self, node):
-        raise ParseError("Unsupported operator: not in")
+        raise self.error("Unsupported operator: not in")
 
     def visit_ExceptHandlerattributes(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_TypeIgnore(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_FunctionType(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Suite(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_Interactive(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_alias(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_keyword(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_comprehension(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_withitem(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     def visit_NamedExpr(self, node):
-        raise ParseError("Unsupported", node)
+        raise self.error("Unsupported", node)
 
     # expression contexts - do nothing
 
@@ -601,3 +1075,6 @@ class Parser(NodeVisitor):
 
     def visit_Param(self, node):
         pass
+
+
+Parser.handlers = dispatchTable(Parser)
@@ -0,0 +1,141 @@
+import time
+import tracemalloc
+from contextlib import contextmanager
+from .astnodes import Node
+from .schema import FIELDS, NODE, LIST, MAYBE
+
+
+class Profiler:
+    # collects per-phase wall time and allocations, AST node counts by kind,
+    # call counts and cumulative time for each TypeChecker method, and hits
+    # and misses of the TypeChecker's canAssign and join caches
+    # pass one to Compiler(profiler=...); results from several runs
+    # (e.g. batch workers) can be combined with merge(other.toJSON())
+
+    def __init__(self, traceMemory: bool = True):
+        self.traceMemory = traceMemory
+        self.phases = {}  # name -> [calls, seconds, allocated bytes, peak bytes]
+        self.nodeCounts = {}  # kind -> count
+        self.methods = {}  # name -> [calls, cumulative seconds]
+        self.caches = {}  # name -> [hits, misses]
+
+    @contextmanager
+    def phase(self, name: str):
+        # allocations are traced only while a phase runs, so that the tracing
+        # overhead doesn't slow down whatever runs between phases (the phase's
+        # own time still includes it; use traceMemory=False for clean times)
+        # "allocated" is the memory allocated in the phase and still live at its
+        # end; a phase run while tracing is already on (e.g. nested in another)
+        # measures the change in traced memory, which can't go below 0 either
+        stats = self.phases.setdefault(name, [0, 0.0, 0, 0])
+        tracing = self.traceMemory
+        nested = tracing and tracemalloc.is_tracing()
+        if nested:
+            if hasattr(tracemalloc, "reset_peak"):  # Python 3.9+
+                tracemalloc.reset_peak()
+            startMem = tracemalloc.get_traced_memory()[0]
+        elif tracing:
+            tracemalloc.start()
+            startMem = 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats[0] += 1
+            stats[1] += time.perf_counter() - start
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                if not nested:
+                    tracemalloc.stop()
+                stats[2] += max(current - startMem, 0)
+                stats[3] = max(stats[3], peak - startMem)
+
+    def countNodes(self, tree: Node):
+        stack = [tree]
+        counts = self.nodeCounts
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            counts[node.kind] = counts.get(node.kind, 0) + 1
+            for _, attr, shape in FIELDS.get(node.kind, ()):
+                if shape == NODE or shape == MAYBE:
+                    stack.append(getattr(node, attr))
+                elif shape == LIST:
+                    stack.extend(getattr(node, attr))
+
+    def timed(self, name: str, method):
+        stats = self.methods.setdefault(name, [0, 0.0])
+        perf_counter = time.perf_counter
+
+        def wrapper(*args):
+            start = perf_counter()
+            try:
+                return method(*args)
+            finally:
+                stats[0] += 1
+                stats[1] += perf_counter() - start
+        return wrapper
+
+    def instrument(self, tc):
+        # wrap every method of a TypeChecker instance; the AST nodes call back into
+        # the typechecker through attribute lookups, so they pick up the wrappers
+        cls = type(tc)
+        for name in dir(cls):
+            if name.startswith("_") or not callable(getattr(cls, name)):
+                continue
+            setattr(tc, name, self.timed(name, getattr(tc, name)))
+        # count cache hits and misses straight into the profile
+        for name in tc.cacheStats:
+            tc.cacheStats[name] = self.caches.setdefault(name, [0, 0])
+
+    def toJSON(self):
+        return {
+            "phases": {name: {"calls": s[0], "seconds": s[1], "allocated": s[2], "peak": s[3]}
+                       for name, s in self.phases.items()},
+            "nodeCounts": dict(self.nodeCounts),
+            "methods": {name: {"calls": s[0], "seconds": s[1]} for name, s in self.methods.items()},
+            "caches": {name: {"hits": s[0], "misses": s[1]} for name, s in self.caches.items()},
+        }
+
+    def merge(self, d: dict):
+        # add the results of another profile (in toJSON form) to this one
+        for name, p in d["phases"].items():
+            stats = self.phases.setdefault(name, [0, 0.0, 0, 0])
+            stats[0] += p["calls"]
+            stats[1] += p["seconds"]
+            stats[2] += p["allocated"]
+            stats[3] = max(stats[3], p["peak"])
+        for kind, n in d["nodeCounts"].items():
+            self.nodeCounts[kind] = self.nodeCounts.get(kind, 0) + n
+        for name, m in d["methods"].items():
+            stats = self.methods.setdefault(name, [0, 0.0])
+            stats[0] += m["calls"]
+            stats[1] += m["seconds"]
+        for name, c in d.get("caches", {}).items():
+            stats = self.caches.setdefault(name, [0, 0])
+            stats[0] += c["hits"]
+            stats[1] += c["misses"]
+
+    def report(self) -> str:
+        lines = ["{:<24} {:>8} {:>12} {:>14} {:>12}".format(
+            "Phase", "calls", "time (ms)", "alloc (KiB)", "peak (KiB)")]
+        for name, s in self.phases.items():
+            lines.append("{:<24} {:>8d} {:>12.3f} {:>14.1f} {:>12.1f}".format(
+                name, s[0], s[1] * 1000, s[2] / 1024, s[3] / 1024))
+        lines.append("")
+        lines.append("{:<24} {:>8}".format("Node kind", "count"))
+        for kind, n in sorted(self.nodeCounts.items(), key=lambda e: -e[1]):
+            lines.append("{:<24} {:>8d}".format(kind, n))
+        lines.append("")
+        lines.append("{:<24} {:>8} {:>12}".format("TypeChecker method", "calls", "cum. (ms)"))
+        for name, s in sorted(self.methods.items(), key=lambda e: -e[1][1]):
+            if s[0] > 0:
+                lines.append("{:<24} {:>8d} {:>12.3f}".format(name, s[0], s[1] * 1000))
+        lines.append("")
+        lines.append("{:<24} {:>8} {:>12} {:>14}".format("TypeChecker cache", "hits", "misses", "hit rate (%)"))
+        for name, s in self.caches.items():
+            lookups = s[0] + s[1]
+            lines.append("{:<24} {:>8d} {:>12d} {:>14.1f}".format(
+                name, s[0], s[1], 100 * s[0] / lookups if lookups > 0 else 0.0))
+        return "\n".join(lines)
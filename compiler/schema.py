@@ -0,0 +1,47 @@
+# layout of each AST node kind's JSON fields, in the order written by toJSON
+# the common fields (kind, location, errorMsg, inferredType) are not listed
+# each entry is (JSON key, attribute name, shape)
+
+NODE = 0      # a child node
+LIST = 1      # a list of child nodes
+VALUE = 2     # a scalar (str, int, bool, or None)
+MAYBE = 3     # a child node, or None (written as null)
+OPTIONAL = 4  # a scalar, omitted when None
+
+FIELDS = {
+    "Program": [("declarations", "declarations", LIST), ("statements", "statements", LIST),
+                ("errors", "errors", NODE)],
+    "Errors": [("errors", "errors", LIST)],
+    "CompilerError": [("message", "message", VALUE)],
+    "ClassDef": [("name", "name", NODE), ("superClass", "superclass", NODE),
+                 ("declarations", "declarations", LIST)],
+    "FuncDef": [("name", "name", NODE), ("params", "params", LIST), ("returnType", "returnType", NODE),
+                ("declarations", "declarations", LIST), ("statements", "statements", LIST)],
+    "VarDef": [("var", "var", NODE), ("value", "value", NODE)],
+    "TypedVar": [("identifier", "identifier", NODE), ("type", "type", NODE)],
+    "GlobalDecl": [("variable", "variable", NODE)],
+    "NonLocalDecl": [("variable", "variable", NODE)],
+    "ClassType": [("className", "className", VALUE)],
+    "ListType": [("elementType", "elementType", NODE)],
+    "AssignStmt": [("targets", "targets", LIST), ("value", "value", NODE)],
+    "ExprStmt": [("expr", "expr", NODE)],
+    "IfStmt": [("condition", "condition", NODE), ("thenBody", "thenBody", LIST),
+               ("elseBody", "elseBody", LIST)],
+    "WhileStmt": [("condition", "condition", NODE), ("body", "body", LIST)],
+    "ForStmt": [("identifier", "identifier", NODE), ("iterable", "iterable", NODE), ("body", "body", LIST)],
+    "ReturnStmt": [("value", "value", MAYBE)],
+    "BinaryExpr": [("left", "left", NODE), ("right", "right", NODE), ("operator", "operator", VALUE)],
+    "UnaryExpr": [("operator", "operator", VALUE), ("operand", "operand", NODE)],
+    "IfExpr": [("condition", "condition", NODE), ("thenExpr", "thenExpr", NODE),
+               ("elseExpr", "elseExpr", NODE)],
+    "CallExpr": [("function", "function", NODE), ("args", "args", LIST)],
+    "MethodCallExpr": [("method", "method", NODE), ("args", "args", LIST)],
+    "MemberExpr": [("object", "object", NODE), ("member", "member", NODE)],
+    "IndexExpr": [("list", "list", NODE), ("index", "index", NODE)],
+    "ListExpr": [("elements", "elements", LIST)],
+    "Identifier": [("name", "name", VALUE)],
+    "BooleanLiteral": [("value", "value", OPTIONAL)],
+    "IntegerLiteral": [("value", "value", OPTIONAL)],
+    "StringLiteral": [("value", "value", OPTIONAL)],
+    "NoneLiteral": [("value", "value", OPTIONAL)],
+}
@@ -0,0 +1,96 @@
+import errno
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+from .compiler import Compiler
+
+# Protocol: newline-delimited JSON over a Unix stream socket.
+# Each request is {"source": str, "typecheck": bool (default true),
+# "fname": str (the file name for error messages, default "<unknown>")} and
+# each response is {"ast": AST JSON or null, "errors": [str]}, or
+# {"error": str} if the request itself was malformed. A connection may
+# carry any number of requests, so editors can keep one open.
+
+
+def defaultSocketPath() -> str:
+    # keep in sync with client.py
+    base = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(base, "chocopy-{:d}.sock".format(os.getuid()))
+
+
+class CompileHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                response = self.server.compileRequest(request)
+            except Exception as e:
+                response = {"error": repr(e)}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class CompileServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    # keeps a warm compiler resident so that requests only pay for compiling
+    daemon_threads = True
+
+    def __init__(self, path: str = None):
+        self.path = path if path is not None else defaultSocketPath()
+        if os.path.exists(self.path):
+            if serverListening(self.path):
+                raise OSError(errno.EADDRINUSE, "A compile server is already listening on " + self.path)
+            os.unlink(self.path)  # stale socket from a previous server
+        super().__init__(self.path, CompileHandler)
+        self.compiler = Compiler()
+
+    def compileRequest(self, request: dict) -> dict:
+        source = request["source"]
+        typecheck = request.get("typecheck", True)
+        fname = request.get("fname", "<unknown>")
+        tree, parseErrors, tcErrors = self.compiler.compile(source, typecheck, fname)
+        errors = [str(e) for e in parseErrors] + tcErrors
+        ast_json = None
+        if tree is not None:
+            ast_json = tree.toJSON()
+        return {"ast": ast_json, "errors": errors}
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def serverListening(path: str) -> bool:
+    # whether a server answers on the socket, as opposed to it being left
+    # behind by one that died
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def serve(path: str = None):
+    try:
+        server = CompileServer(path)
+    except OSError as e:
+        print("Error: " + (e.strerror or str(e)), file=sys.stderr)
+        sys.exit(1)
+    # exit through the finally clause on SIGTERM so the socket gets removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print("Listening on " + server.path, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,45 @@
+from .astnodes import *
+
+# Per-scope declaration summaries.
+#
+# When asked to (Parser.summarize / NativeParser.summarize, which the
+# Compiler turns on), the parsers record a Summary of the declarations of the
+# program, of each function and of each class while they sort its body into
+# declarations and statements. The TypeChecker reads names, kinds and
+# signature annotations from the summary when it adds a scope's declarations
+# before checking their bodies, instead of inspecting every declaration node
+# again; for trees without summaries (built by hand or decoded from the binary
+# format) it builds one with summarize().
+
+VAR, FUNC, CLASS, GLOBAL, NONLOCAL = range(5)
+KINDS = {VarDef: VAR, FuncDef: FUNC, ClassDef: CLASS, GlobalDecl: GLOBAL, NonLocalDecl: NONLOCAL}
+
+
+class Summary:
+    __slots__ = ("entries",)
+
+    def __init__(self):
+        # (kind, name, identifier, annotation, declaration) in source order;
+        # the annotation is the TypedVar of a variable, the
+        # ([TypedVar], TypeAnnotation) signature of a function and the
+        # superclass Identifier of a class
+        self.entries = []
+
+    def add(self, d: Declaration):
+        kind = KINDS[d.__class__]
+        if kind == VAR:
+            annotation = d.var
+        elif kind == FUNC:
+            annotation = (d.params, d.returnType)
+        elif kind == CLASS:
+            annotation = d.superclass
+        else:
+            annotation = None
+        self.entries.append((kind, d.getIdentifier().name, d.getIdentifier(), annotation, d))
+
+
+def summarize(declarations: [Declaration]) -> Summary:
+    summary = Summary()
+    for d in declarations:
+        summary.add(d)
+    return summary
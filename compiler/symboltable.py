@@ -0,0 +1,78 @@
+from .types import SymbolType
+
+# Scoped symbol table for the TypeChecker.
+#
+# Instead of a stack of per-scope tables that lookups scan from the innermost
+# scope out, each name maps to a stack of its (depth, type) bindings, innermost
+# last; depth 0 is the global scope. A name has at most one binding per scope,
+# so the current binding, the global one, and the innermost binding outside
+# the current scope are all at the top (or bottom) of the name's stack. Each
+# scope keeps the names it bound, so exiting it pops just those.
+
+
+class SymbolTable:
+    __slots__ = ("bindings", "scopes")
+
+    def __init__(self):
+        self.bindings = {}  # name -> [(depth, type)], innermost last
+        self.scopes = [[]]  # names bound in each open scope
+
+    def enterScope(self):
+        self.scopes.append([])
+
+    def exitScope(self):
+        bindings = self.bindings
+        for name in self.scopes.pop():
+            stack = bindings[name]
+            stack.pop()
+            if not stack:
+                del bindings[name]
+
+    def add(self, name: str, t: SymbolType):
+        # bind a name in the current scope, replacing its binding there if any
+        depth = len(self.scopes) - 1
+        stack = self.bindings.get(name)
+        if stack is None:
+            self.bindings[name] = [(depth, t)]
+        elif stack[-1][0] == depth:
+            stack[-1] = (depth, t)
+            return
+        else:
+            stack.append((depth, t))
+        self.scopes[-1].append(name)
+
+    def lookup(self, name: str):
+        # type of the innermost binding, or None
+        stack = self.bindings.get(name)
+        return None if stack is None else stack[-1][1]
+
+    def lookupLocal(self, name: str):
+        # type of the innermost binding outside the global scope, or None
+        stack = self.bindings.get(name)
+        if stack is None or stack[-1][0] == 0:
+            return None
+        return stack[-1][1]
+
+    def lookupNonLocal(self, name: str):
+        # type of the innermost binding outside both the current and the
+        # global scope, or None
+        stack = self.bindings.get(name)
+        if stack is None:
+            return None
+        i = len(stack) - 1
+        if stack[i][0] == len(self.scopes) - 1:
+            i -= 1
+        if i < 0 or stack[i][0] == 0:
+            return None
+        return stack[i][1]
+
+    def lookupGlobal(self, name: str):
+        stack = self.bindings.get(name)
+        if stack is None or stack[0][0] != 0:
+            return None
+        return stack[0][1]
+
+    def definedInCurrentScope(self, name: str) -> bool:
+        # whether the name has a binding in the current scope (other than None)
+        stack = self.bindings.get(name)
+        return stack is not None and stack[-1][0] == len(self.scopes) - 1 and stack[-1][1] is not None
@@ -0,0 +1,67 @@
+import ast
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Tracer:
+    # records nested spans as pairs of Chrome trace events ("B" when a span
+    # begins, "E" when it ends), which can be opened in chrome://tracing or
+    # https://ui.perfetto.dev; a span that never ends (a program that hangs
+    # or takes the process down) still shows where it began
+    # pass one to Compiler(tracer=...) to get spans for each compilation phase,
+    # each top-level statement lowered by the Parser, and each function and
+    # class checked by the TypeChecker
+
+    def __init__(self):
+        self.events = []
+        self.pid = os.getpid()
+
+    @contextmanager
+    def span(self, name: str, category: str = "compile", args: dict = None):
+        tid = threading.get_ident()
+        event = {"name": name, "cat": category, "ph": "B", "ts": time.perf_counter() * 1e6,
+                 "pid": self.pid, "tid": tid}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+        try:
+            yield
+        finally:
+            self.events.append({"name": name, "cat": category, "ph": "E",
+                                "ts": time.perf_counter() * 1e6, "pid": self.pid, "tid": tid})
+
+    def phase(self, name: str):
+        return self.span(name, "phase")
+
+    def lowerSpan(self, node):
+        # span for lowering one top-level Python statement
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            name = "{} {}".format(type(node).__name__, node.name)
+        elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+            name = "VarDef {}".format(node.target.id)
+        else:
+            name = type(node).__name__
+        return self.span(name, "lower", {"line": getattr(node, "lineno", 0)})
+
+    def traced(self, method):
+        def wrapper(node):
+            with self.span("{} {}".format(node.kind, node.name.name), "typecheck",
+                           {"line": node.location[0]}):
+                return method(node)
+        return wrapper
+
+    def instrument(self, tc):
+        # the AST nodes call back into the typechecker through attribute lookups,
+        # so wrapping the instance's methods is enough to see every definition
+        tc.FuncDef = self.traced(tc.FuncDef)
+        tc.ClassDef = self.traced(tc.ClassDef)
+
+    def toJSON(self):
+        return {"traceEvents": self.events, "displayTimeUnit": "ms"}
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.toJSON(), f)
@@ -1,9 +1,14 @@
 from .astnodes import *
 from .types import *
+from .summary import VAR, FUNC, CLASS, summarize
+from .symboltable import SymbolTable
 from collections import defaultdict
 
 
 class TypeChecker:
+    # entries kept in each of the canAssign and join caches
+    CACHE_SIZE = 4096
+
     def __init__(self):
         # typechecker attributes and their chocopy typing judgement analogues:
         # O : symbolTable
@@ -11,14 +16,13 @@ class TypeChecker:
         # C : currentClass
         # R : expReturnType
 
-        # stack of hashtables representing scope
-        # each table holds identifier->type mappings defined in that scppe
-        self.symbolTable = [defaultdict(lambda: None)]
+        # identifier->type bindings of every open scope (see symboltable.py)
+        self.symbolTable = SymbolTable()
 
         # standard library functions
-        self.symbolTable[0]["print"] = FuncType([ObjectType()], NoneType())
-        self.symbolTable[0]["input"] = FuncType([], StrType())
-        self.symbolTable[0]["len"] = FuncType([ObjectType()], IntType())
+        self.symbolTable.add("print", FuncType([ObjectType()], NoneType()))
+        self.symbolTable.add("input", FuncType([], StrType()))
+        self.symbolTable.add("len", FuncType([ObjectType()], IntType()))
 
         # type hierachy: dictionary of class->superclass mappings
         self.superclasses = defaultdict(lambda: None)
@@ -39,16 +43,41 @@ class TypeChecker:
         self.classes["bool"] = {"__init__": FuncType([ObjectType()], NoneType())}
         self.classes["str"] = {"__init__": FuncType([ObjectType()], NoneType())}
 
+        # preorder interval of each class in the class tree: its own number and
+        # the last number in its subtree (see numberClasses); None when the
+        # hierarchy has changed since it was numbered
+        self.intervals = None
+        # ancestors 1, 2, 4, 8... levels above each class, for
+        # commonSuperclass; numbered along with the intervals
+        self.jumps = None
+
+        # flattened member tables of each class, inherited members included
+        # (see getMembers); a class's table is built once its own members are in
+        self.members = {}
+
         self.INT_TYPE = IntType()
         self.STR_TYPE = StrType()
         self.BOOL_TYPE = BoolType()
         self.NONE_TYPE = NoneType()
         self.EMPTY_TYPE = EmptyType()
         self.OBJECT_TYPE = ObjectType()
+        # types that None can't be assigned to
+        self.SPECIAL_TYPES = frozenset([self.INT_TYPE, self.STR_TYPE, self.BOOL_TYPE])
+
+        # results of canAssign and join by (a, b); types are interned, so
+        # equal types are the same key. Cleared when the hierarchy changes
+        self.assignCache = {}
+        self.joinCache = {}
+        # [hits, misses] of each cache; a Profiler replaces these lists with
+        # its own to add up the counts of every TypeChecker it instruments
+        self.cacheStats = {"canAssign": [0, 0], "join": [0, 0]}
 
         self.errors = []  # list of errors encountered
         self.currentClass = None  # name of current class
         self.expReturnType = None  # expected return type of current function
+        # signatures of methods and nested functions, computed when adding their
+        # scope's declarations and used again when checking them; by id of FuncDef
+        self.signatures = {}
 
         self.program = None
 
@@ -56,72 +85,72 @@ class TypeChecker:
         return node.visit(self)
 
     def enterScope(self):
-        self.symbolTable.append(defaultdict(lambda: None))
+        self.symbolTable.enterScope()
 
     def exitScope(self):
-        self.symbolTable.pop()
+        self.symbolTable.exitScope()
 
     # SYMBOL TABLE LOOKUPS
 
     def getType(self, var: str):
         # get the type of an identifier in the current scope, or None if not found
-        for table in self.symbolTable[::-1]:
-            if var in table:
-                return table[var]
-        return None
+        return self.symbolTable.lookup(var)
 
     def getLocalType(self, var: str):
         # get the type of an identifier in the current scope, or None if not found
         # ignore global variables
-        for table in self.symbolTable[1:][::-1]:
-            if var in table:
-                return table[var]
-        return None
+        return self.symbolTable.lookupLocal(var)
 
     def getNonLocalType(self, var: str):
         # get the type of an identifier outside the current scope, or None if not found
         # ignore global variables
-        for table in self.symbolTable[1:-1][::-1]:
-            if var in table:
-                return table[var]
-        return None
+        return self.symbolTable.lookupNonLocal(var)
 
     def getGlobal(self, var: str):
-        return self.symbolTable[0][var]
+        return self.symbolTable.lookupGlobal(var)
 
     def addType(self, var: str, t: SymbolType):
-        self.symbolTable[-1][var] = t
+        self.symbolTable.add(var, t)
 
     def defInCurrentScope(self, var: str) -> bool:
         # return if the name was defined in the current scope
-        return self.symbolTable[-1][var] is not None
+        return self.symbolTable.definedInCurrentScope(var)
 
     # CLASSES
 
+    def getMembers(self, className: str) -> dict:
+        # flattened member table of a class: its own attrs and methods and
+        # every inherited one they don't override, built once per class
+        members = self.members.get(className)
+        if members is not None:
+            return members
+        # flatten the classes above it first, from the top down
+        chain = []
+        curr = className
+        while curr is not None and curr not in self.members and curr not in chain:
+            chain.append(curr)
+            curr = self.superclasses.get(curr)
+        members = self.members.get(curr, {})
+        for c in reversed(chain):
+            members = dict(members)
+            members.update(self.classes.get(c, {}))
+            self.members[c] = members
+        return members
+
     def getMethod(self, className: str, methodName: str):
-        if methodName not in self.classes[className]:
-            if self.superclasses[className] is None:
-                return None
-            return self.getMethod(self.superclasses[className], methodName)
-        if not isinstance(self.classes[className][methodName], FuncType):
+        t = self.getMembers(className).get(methodName)
+        if not isinstance(t, FuncType):
             return None
-        return self.classes[className][methodName]
+        return t
 
     def getAttr(self, className: str, attrName: str):
-        if attrName not in self.classes[className]:
-            if self.superclasses[className] is None:
-                return None
-            return self.getAttr(self.superclasses[className], attrName)
-        if not isinstance(self.classes[className][attrName], ValueType):
+        t = self.getMembers(className).get(attrName)
+        if not isinstance(t, ValueType):
             return None
-        return self.classes[className][attrName]
+        return t
 
     def getAttrOrMethod(self, className: str, name: str):
-        if name not in self.classes[className]:
-            if self.superclasses[className] is None:
-                return None
-            return self.getAttrOrMethod(self.superclasses[className], name)
-        return self.classes[className][name]
+        return self.getMembers(className).get(name)
 
     def classExists(self, className: str) -> bool:
         # we cannot check for None because it is a defaultdict
@@ -129,15 +158,72 @@ class TypeChecker:
 
     # TYPE HIERARCHY UTILS
 
+    def numberClasses(self):
+        # number the class tree in preorder, so the subclasses of a class
+        # are exactly the classes numbered from its number to its last, and
+        # record the ancestors 1, 2, 4, 8... levels above each class
+        children = defaultdict(list)
+        roots = []
+        for c, superclass in self.superclasses.items():
+            if superclass is None:
+                roots.append(c)
+            else:
+                children[superclass].append(c)
+        intervals = {}
+        jumps = {}
+        first = {}
+        n = 0
+        stack = roots[::-1]
+        while stack:
+            c = stack.pop()
+            if c in first:  # all of its subclasses are numbered
+                intervals[c] = (first[c], n - 1)
+                continue
+            first[c] = n
+            n += 1
+            # the superclass is numbered first, so its jumps are known
+            up = []
+            a = self.superclasses[c]
+            while a is not None:
+                up.append(a)
+                above = jumps[a]
+                a = above[len(up) - 1] if len(up) <= len(above) else None
+            jumps[c] = up
+            stack.append(c)
+            stack.extend(children[c][::-1])
+        self.intervals = intervals
+        self.jumps = jumps
+
     def isSubClass(self, a: str, b: str) -> bool:
         # return if a is the same class or subclass of b
-        curr = a
-        while curr is not None:
-            if curr == b:
-                return True
-            else:
-                curr = self.superclasses[curr]
-        return False
+        if a == b:
+            return True
+        if self.intervals is None:
+            self.numberClasses()
+        ia = self.intervals.get(a)
+        ib = self.intervals.get(b)
+        if ia is None or ib is None:
+            return False
+        return ib[0] <= ia[0] <= ib[1]
+
+    def commonSuperclass(self, a: str, b: str) -> str:
+        # lowest common ancestor of two classes: climb from a by the largest
+        # jumps that stay below the ancestors of b, then take one more step
+        if self.isSubClass(a, b):
+            return b
+        if self.isSubClass(b, a):
+            return a
+        if a not in self.intervals or b not in self.intervals:
+            return "object"
+        jumps = self.jumps
+        k = len(jumps[a]) - 1
+        while k >= 0:
+            up = jumps[a]
+            if k < len(up) and not self.isSubClass(b, up[k]):
+                a = up[k]
+            k -= 1
+        # a is the highest ancestor of the original a that isn't one of b's
+        return jumps[a][0] if len(jumps[a]) > 0 else "object"
 
     def isSubtype(self, a: ValueType, b: ValueType) -> bool:
         # return if a is a subtype of b
@@ -147,11 +233,36 @@ class TypeChecker:
             return self.isSubClass(a.className, b.className)
         return a == b
 
+    def remember(self, cache: dict, key, result):
+        # add a result to a cache, evicting the oldest entry if it is full
+        if len(cache) >= self.CACHE_SIZE:
+            del cache[next(iter(cache))]
+        cache[key] = result
+
+    def hierarchyChanged(self):
+        # forget everything computed from the class hierarchy
+        self.intervals = None
+        self.jumps = None
+        self.assignCache.clear()
+        self.joinCache.clear()
+
     def canAssign(self, a: ValueType, b: ValueType) -> bool:
         # return if value of type a can be assigned/passed to type b (ex: b = a)
+        key = (a, b)
+        result = self.assignCache.get(key)
+        stats = self.cacheStats["canAssign"]
+        if result is not None:
+            stats[0] += 1
+            return result
+        stats[1] += 1
+        result = self.uncachedCanAssign(a, b)
+        self.remember(self.assignCache, key, result)
+        return result
+
+    def uncachedCanAssign(self, a: ValueType, b: ValueType) -> bool:
         if self.isSubtype(a, b):
             return True
-        if a == self.NONE_TYPE and b not in [self.INT_TYPE, self.STR_TYPE, self.BOOL_TYPE]:
+        if a == self.NONE_TYPE and b not in self.SPECIAL_TYPES:
             return True
         if isinstance(b, ListValueType) and a == self.EMPTY_TYPE:
             return True
@@ -162,33 +273,30 @@ class TypeChecker:
 
     def join(self, a: ValueType, b: ValueType):
         # return closest mutual ancestor on typing tree
+        key = (a, b)
+        result = self.joinCache.get(key)
+        stats = self.cacheStats["join"]
+        if result is not None:
+            stats[0] += 1
+            return result
+        stats[1] += 1
+        result = self.uncachedJoin(a, b)
+        self.remember(self.joinCache, key, result)
+        return result
+
+    def uncachedJoin(self, a: ValueType, b: ValueType):
         if self.canAssign(a, b):
             return b
         if self.canAssign(b, a):
             return a
         if isinstance(b, ListValueType) and isinstance(a, ListValueType):
             return ListValueType(self.join(b.elementType, a.elementType))
-        # if only 1 of the types is a list then the closest ancestor is object
-        if isinstance(b, ListValueType) or isinstance(a, ListValueType):
+        # if only 1 of the types is a list then the closest ancestor is object,
+        # as it is when either has no type (after an error)
+        if not isinstance(a, ClassValueType) or not isinstance(b, ClassValueType):
             return self.OBJECT_TYPE
         # for 2 classes that aren't related by subtyping
-        # find paths from A & B to root of typing tree
-        aAncestors = []
-        bAncestors = []
-        while self.superclasses[a] is not None:
-            aAncestors.append(self.superclasses[a])
-            a = self.superclasses[a]
-        while self.superclasses[b] is not None:
-            aAncestors.append(self.superclasses[b])
-            b = self.superclasses[b]
-        # reverse lists to find lowest common ancestor
-        aAncestors = aAncestors[::-1]
-        bAncestors = bAncestors[::-1]
-        for i in range(min(len(aAncestors), len(bAncestors))):
-            if aAncestors[i] != bAncestors[i]:
-                return aAncestors[i-1]
-        # this really shouldn't be returned
-        return self.OBJECT_TYPE
+        return ClassValueType(self.commonSuperclass(a.className, b.className))
 
     # ERROR HANDLING
 
@@ -209,36 +317,60 @@ class TypeChecker:
 
     def Program(self, node: Program):
         self.program = node
-        for d in node.declarations:
-            identifier = d.getIdentifier()
-            if self.defInCurrentScope(identifier.name) or self.classExists(identifier.name):
-                self.addError(
-                    identifier, F"Duplicate declaration of identifier: {identifier.name}")
-            if isinstance(d, ClassDef):
-                className = d.name.name
-                superclass = d.superclass.name
-                if not self.classExists(superclass):
-                    self.addError(d.superclass,
-                                F"Unknown superclass: {superclass}")
-                    continue
-                if superclass in ["int", "bool", "str", className]:
-                    self.addError(d.superclass,
-                                F"Illegal superclass: {superclass}")
-                    continue
-                self.classes[d.name.name] = {}
-                self.superclasses[className] = superclass
-            if isinstance(d, FuncDef):
-                self.addType(d.getIdentifier().name, self.getSignature(d))
-            if isinstance(d, VarDef):
-                self.addType(identifier.name, self.visit(d.var))
+        self.addDeclarations(node)
+        # declarations and statements that had parse errors (see
+        # Parser.recover) are only declared, not checked
+        damaged = {id(d) for d in node.damaged}
         for d in node.declarations:
             if d.getIdentifier().errorMsg is not None:
                 continue
+            if id(d) in damaged:
+                if isinstance(d, ClassDef):
+                    self.currentClass = d.name.name
+                    self.addMembers(d)
+                    self.currentClass = None
+                continue
             self.visit(d)
         if len(self.errors) > 0:
             return
         for s in node.statements:
-            self.visit(s)
+            if id(s) not in damaged:
+                self.visit(s)
+
+    def getSummary(self, node):
+        # declaration summary of a Program, FuncDef or ClassDef
+        if node.summary is None:
+            return summarize(node.declarations)
+        return node.summary
+
+    def addDeclarations(self, node: Program):
+        # add all global declarations before checking their bodies
+        for kind, name, identifier, annotation, d in self.getSummary(node).entries:
+            if self.defInCurrentScope(name) or self.classExists(name):
+                self.addError(
+                    identifier, F"Duplicate declaration of identifier: {name}")
+            if kind == CLASS:
+                superclass = annotation.name
+                if not self.classExists(superclass):
+                    self.addError(annotation,
+                                F"Unknown superclass: {superclass}")
+                    continue
+                if superclass in ["int", "bool", "str", name]:
+                    self.addError(annotation,
+                                F"Illegal superclass: {superclass}")
+                    continue
+                if self.classExists(name):
+                    # a duplicate class keeps the first declaration's
+                    # superclass, so the hierarchy stays a tree
+                    continue
+                self.classes[name] = {}
+                self.superclasses[name] = superclass
+                self.hierarchyChanged()
+            elif kind == FUNC:
+                self.addType(name, self.getSignature(annotation))
+            elif kind == VAR:
+                self.addType(name, self.visit(annotation))
+        self.numberClasses()
 
     def VarDef(self, node: VarDef):
         varName = node.getIdentifier().name
@@ -249,50 +381,61 @@ class TypeChecker:
         return annotationType
 
     def ClassDef(self, node: ClassDef):
-        className = node.name.name
-        self.currentClass = className
-        # add all attrs and methods before checking method bodies
+        self.currentClass = node.name.name
+        self.addMembers(node)
         for d in node.declarations:
-            if isinstance(d, FuncDef):  # methods
-                funcName = d.getIdentifier().name
-                funcType = self.getSignature(d)
-                if funcName in self.classes[className]:
-                    self.addError(d.getIdentifier(),
-                                  F"Duplicate declaration of identifier: {funcName}")
+            self.visit(d)
+        self.currentClass = None
+        return None
+
+    def addMembers(self, node: ClassDef):
+        # add all attrs and methods before checking method bodies
+        className = node.name.name
+        members = self.classes[className]
+        inherited = self.getMembers(self.superclasses[className])
+        for kind, name, identifier, annotation, d in self.getSummary(node).entries:
+            if kind == FUNC:  # methods
+                funcType = self.getSignature(annotation)
+                self.signatures[id(d)] = funcType
+                if name in members:
+                    self.addError(identifier,
+                                  F"Duplicate declaration of identifier: {name}")
                     continue
-                t = self.getAttrOrMethod(className, funcName)
+                t = inherited.get(name)
                 if t is not None:
                     if not isinstance(t, FuncType):
-                        self.addError(d.getIdentifier(), 
-                        F"Method name shadows attribute: {funcName}")
+                        self.addError(identifier, 
+                        F"Method name shadows attribute: {name}")
                         continue
                     # if funcName != "__init__":  # for all methods besides constructor, check signatures match
                     if not t.methodEquals(funcType):  # excluding self argument
-                        self.addError(d.getIdentifier(), 
-                        F"Redefined method doesn't match superclass signature: {funcName}")
+                        self.addError(identifier, 
+                        F"Redefined method doesn't match superclass signature: {name}")
                         continue
-                self.classes[className][funcName] = funcType
-            if isinstance(d, VarDef):  # attributes
-                attrName = d.getIdentifier().name
-                if self.getAttrOrMethod(className, attrName):
-                    self.addError(d.getIdentifier(),
-                                  F"Cannot redefine attribute: {attrName}")
+                members[name] = funcType
+            elif kind == VAR:  # attributes
+                if name in members or inherited.get(name):
+                    self.addError(identifier,
+                                  F"Cannot redefine attribute: {name}")
                     continue
-                self.classes[className][attrName] = self.visit(d.var)
-        for d in node.declarations:
-            self.visit(d)
-        self.currentClass = None
-        return None
+                members[name] = self.visit(annotation)
+        flattened = dict(inherited)
+        flattened.update(members)
+        self.members[className] = flattened
 
-    def getSignature(self, node:FuncDef):
-        rType = self.visit(node.returnType)
-        return FuncType([self.visit(t) for t in node.params], rType)
+    def getSignature(self, signature):
+        # signature annotations ([param types], return type) from a Summary
+        params, returnType = signature
+        rType = self.visit(returnType)
+        return FuncType([self.visit(t) for t in params], rType)
 
     def FuncDef(self, node: FuncDef):
         self.enterScope()
         funcName = node.getIdentifier().name
-        rType = self.visit(node.returnType)
-        funcType = FuncType([self.visit(t) for t in node.params], rType)
+        funcType = self.signatures.pop(id(node), None)
+        if funcType is None:
+            funcType = self.getSignature((node.params, node.returnType))
+        rType = funcType.returnType
         self.expReturnType = rType
         if not node.isMethod:  # top level function decl OR nested function
             if self.classExists(funcName):
@@ -311,8 +454,7 @@ class TypeChecker:
                 self.addError(
                     node.getIdentifier(), F"Missing self param in method: {funcName}")
                 return
-        for p in node.params:
-            t = self.visit(p)
+        for p, t in zip(node.params, funcType.parameters):
             pName = p.identifier.name
             if self.defInCurrentScope(pName) or self.classExists(pName):
                 self.addError(
@@ -321,19 +463,19 @@ class TypeChecker:
             if t is not None:
                 self.addType(pName, t)
         
-        for d in node.declarations:
-            identifier = d.getIdentifier()
-            name = identifier.name
+        for kind, name, identifier, annotation, d in self.getSummary(node).entries:
             if self.defInCurrentScope(name) or self.classExists(name):
                 self.addError(
                     identifier, F"Duplicate declaration of identifier: {name}")
                 continue
-            if isinstance(d, FuncDef):
-                self.addType(name, self.getSignature(d))
-            if isinstance(d, VarDef):
-                self.addType(name, self.visit(d.var))
-            if isinstance(d, NonLocalDecl) or isinstance(d, GlobalDecl):
-                self.addType(name, self.visit(d))     
+            if kind == FUNC:
+                funcType = self.getSignature(annotation)
+                self.signatures[id(d)] = funcType
+                self.addType(name, funcType)
+            elif kind == VAR:
+                self.addType(name, self.visit(annotation))
+            else:  # global and nonlocal declarations
+                self.addType(name, self.visit(d))
         for d in node.declarations:
             self.visit(d)
             self.expReturnType = rType
@@ -505,8 +647,9 @@ class TypeChecker:
         fname = node.function.name
         t = None
         if self.classExists(fname):
-            # constructor
-            t = self.getMethod(fname, "__init__")
+            # constructor; a class whose superclass was rejected only has
+            # the members it declares, so it may have no __init__ of its own
+            t = self.getMethod(fname, "__init__") or self.getMethod("object", "__init__")
             if len(t.parameters) != len(node.args) + 1:
                 self.addError(node, F"Expected {len(t.parameters) - 1} args, got {len(node.args)}")
             else:
@@ -619,8 +762,8 @@ class TypeChecker:
         return node.inferredType
 
     def MethodCallExpr(self, node: MethodCallExpr):
+        # the receiver is checked along with the arguments (see MethodCallExpr.subexpressions)
         method_member = node.method
-        self.visit(method_member.object)
         t = None # method signature
         static_types = {self.INT_TYPE, self.BOOL_TYPE, self.STR_TYPE}
         if method_member.object.inferredType in static_types or not isinstance(method_member.object.inferredType, ClassValueType): 
@@ -650,19 +793,19 @@ class TypeChecker:
     # LITERALS
 
     def BooleanLiteral(self, node: BooleanLiteral):
-        node.inferredType = BoolType()
+        node.inferredType = self.BOOL_TYPE
         return node.inferredType
 
     def IntegerLiteral(self, node: IntegerLiteral):
-        node.inferredType = IntType()
+        node.inferredType = self.INT_TYPE
         return node.inferredType
 
     def NoneLiteral(self, node: NoneLiteral):
-        node.inferredType = NoneType()
+        node.inferredType = self.NONE_TYPE
         return node.inferredType
 
     def StringLiteral(self, node: StringLiteral):
-        node.inferredType = StrType()
+        node.inferredType = self.STR_TYPE
         return node.inferredType
 
     # TYPES
@@ -1,21 +1,29 @@
 from .classvaluetype import ClassValueType
 
-# factories for types
+# factories for types; they return the interned instances, so calling them
+# allocates nothing
+
+OBJECT_TYPE = ClassValueType("object")
+INT_TYPE = ClassValueType("int")
+STR_TYPE = ClassValueType("str")
+BOOL_TYPE = ClassValueType("bool")
+NONE_TYPE = ClassValueType("<None>")
+EMPTY_TYPE = ClassValueType("<Empty>")
 
 def ObjectType():
-    return ClassValueType("object")
+    return OBJECT_TYPE
 
 def IntType():
-    return ClassValueType("int")
+    return INT_TYPE
 
 def StrType():
-    return ClassValueType("str")
+    return STR_TYPE
 
 def BoolType():
-    return ClassValueType("bool")
+    return BOOL_TYPE
 
 def NoneType():
-    return ClassValueType("<None>")
+    return NONE_TYPE
 
 def EmptyType():
-    return ClassValueType("<Empty>")
+    return EMPTY_TYPE
@@ -1,13 +1,32 @@
+from threading import Lock
+from weakref import WeakValueDictionary
 from .valuetype import ValueType
 
 class ClassValueType(ValueType):
-    def __init__(self, className:str):
-        self.className = className
+    # instances are interned: there is one ClassValueType per class name, so
+    # equal types are the same object and compare by identity
+    # the table holds them weakly, so long-running processes drop the types
+    # no AST or typechecker refers to any more
+    interned = WeakValueDictionary()
+    lock = Lock()
 
-    def __eq__(self, other):
-        if isinstance(other, ClassValueType):
-            return self.className == other.className
-        return False
+    def __new__(cls, className:str):
+        t = cls.interned.get(className)
+        if t is None:
+            # (checked again under the lock, so that threads compiling at the
+            # same time, as in the compile server, never make two instances)
+            with cls.lock:
+                t = cls.interned.get(className)
+                if t is None:
+                    t = super().__new__(cls)
+                    t.className = className
+                    t.hash = hash(className)
+                    cls.interned[className] = t
+        return t
+
+    def __reduce__(self):
+        # unpickling and copying go through the constructor, and get the interned instance
+        return (ClassValueType, (self.className,))
 
     def isSpecialType():
         return className in ["int", "str", "bool"]
@@ -16,10 +35,10 @@ class ClassValueType(ValueType):
         return self.className
 
     def __hash__(self):
-        return str(self).__hash__()
+        return self.hash
 
     def toJSON(self):
         return {
             "kind": "ClassValueType",
             "className": self.className
-        }
\ No newline at end of file
+        }
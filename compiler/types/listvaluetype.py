@@ -1,14 +1,32 @@
+from threading import Lock
+from weakref import WeakValueDictionary
 from .valuetype import ValueType
 
 class ListValueType(ValueType):
-    
-    def __init__(self, elementType:ValueType):
-        self.elementType = elementType
+    # instances are interned by element type (itself interned), so equal
+    # types are the same object and compare by identity
+    # the table holds them weakly, so long-running processes drop the types
+    # no AST or typechecker refers to any more
+    interned = WeakValueDictionary()
+    lock = Lock()
 
-    def __eq__(self, other):
-        if isinstance(other, ListValueType):
-            return self.elementType == other.elementType
-        return False
+    def __new__(cls, elementType:ValueType):
+        t = cls.interned.get(elementType)
+        if t is None:
+            # (checked again under the lock, so that threads compiling at the
+            # same time, as in the compile server, never make two instances)
+            with cls.lock:
+                t = cls.interned.get(elementType)
+                if t is None:
+                    t = super().__new__(cls)
+                    t.elementType = elementType
+                    t.hash = hash(("[]", elementType))
+                    cls.interned[elementType] = t
+        return t
+
+    def __reduce__(self):
+        # unpickling and copying go through the constructor, and get the interned instance
+        return (ListValueType, (self.elementType,))
 
     def isListType():
         return True
@@ -17,10 +35,10 @@ class ListValueType(ValueType):
         return "[{}]".format(str(self.elementType))
 
     def __hash__(self):
-        return str(self).__hash__()
+        return self.hash
 
     def toJSON(self):
         return {
             "kind": "ListValueType",
             "elementType": self.elementType.toJSON()
-        }
\ No newline at end of file
+        }
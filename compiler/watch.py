@@ -0,0 +1,437 @@
+import ast
+import os
+import re
+import time
+from .astnodes import *
+from .compiler import Compiler
+from .jsonwriter import writeJSON
+from .parser import Parser
+from .schema import FIELDS, NODE, LIST, MAYBE
+from .typechecker import TypeChecker
+
+# Incremental compilation for --watch.
+#
+# The unit of reuse is a top-level declaration (plus one unit for all the
+# top-level statements). After each run we keep the typed nodes of every unit,
+# its source text and the errors reported while checking it. On the next run,
+# a unit whose source text is unchanged (wherever it moved in the file) and
+# that doesn't refer to any name whose signature changed is neither lowered
+# nor checked again: its previous nodes are moved to their new lines and
+# dropped into the new tree. The cheap declaration passes
+# (TypeChecker.addDeclarations and addMembers) always run on the whole program,
+# so the symbol tables are rebuilt exactly as in a full check.
+#
+# Reuse only happens between runs where the program parsed and those
+# declaration passes reported no errors; otherwise (and whenever declarations
+# are reordered) the whole program is compiled again.
+
+STATEMENTS = ("<statements>", "")
+DECLARATIONS = (ast.FunctionDef, ast.ClassDef, ast.AnnAssign)
+NEWLINE = re.compile(r"\r\n|\r|\n")
+
+
+def declKey(d: Declaration):
+    return (d.kind, d.getIdentifier().name)
+
+
+def children(node: Node):
+    for _, attr, shape in FIELDS[node.kind]:
+        value = getattr(node, attr)
+        if shape == NODE or (shape == MAYBE and value is not None):
+            yield value
+        elif shape == LIST:
+            yield from value
+
+
+def fingerprint(nodes: [Node]) -> str:
+    # structural summary of untyped subtrees, ignoring locations
+    parts = [str(len(nodes))]
+    stack = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        parts.append(node.kind)
+        for _, attr, shape in FIELDS[node.kind]:
+            value = getattr(node, attr)
+            if shape == LIST:
+                parts.append(str(len(value)))
+                stack.extend(reversed(value))
+            elif shape == NODE or (shape == MAYBE and value is not None):
+                stack.append(value)
+            else:
+                parts.append(repr(value))
+    return "\0".join(parts)
+
+
+def signature(d: Declaration) -> str:
+    # what other declarations can see of a declaration
+    if isinstance(d, FuncDef):
+        return fingerprint(d.params + [d.returnType])
+    if isinstance(d, VarDef):
+        return fingerprint([d.var])
+    if isinstance(d, ClassDef):
+        members = [d.superclass.name]
+        for m in d.declarations:
+            members.append(m.getIdentifier().name)
+            members.append(signature(m))
+        return "\0".join(members)
+    return fingerprint([d])
+
+
+def memberNames(d: Declaration) -> frozenset:
+    if isinstance(d, ClassDef):
+        return frozenset(m.getIdentifier().name for m in d.declarations)
+    return frozenset()
+
+
+def referencedNames(nodes: [Node]) -> set:
+    names = set()
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Identifier):
+            names.add(node.name)
+        elif isinstance(node, ClassType):
+            names.add(node.className)
+        stack.extend(children(node))
+    return names
+
+
+def shiftMessage(message: str, location: (int, int), delta: int) -> str:
+    # error messages end with the location of the node they are attached to
+    suffix = " Line {} Col {}".format(location[0], location[1])
+    if message.endswith(suffix):
+        return message[:-len(suffix)] + " Line {} Col {}".format(location[0] + delta, location[1])
+    return message
+
+
+def shiftLines(node: Node, delta: int):
+    # move a subtree down by delta lines; locations may be shared between
+    # nodes, so they are replaced rather than updated in place
+    if delta == 0:
+        return
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if n.errorMsg is not None:
+            n.errorMsg = shiftMessage(n.errorMsg, n.location, delta)
+        n.location = (n.location[0] + delta, n.location[1])
+        if n.endLocation is not None:
+            n.endLocation = (n.endLocation[0] + delta, n.endLocation[1])
+        stack.extend(children(n))
+
+
+def shiftErrors(errors: [CompilerError], delta: int) -> [CompilerError]:
+    if delta == 0:
+        return errors
+    return [CompilerError((e.location[0] + delta, e.location[1]),
+                          shiftMessage(e.message, e.location, delta)) for e in errors]
+
+
+def statementsText(statements: [ast.stmt], texts: dict) -> str:
+    # source text of the top-level statements, with their relative lines
+    if not statements:
+        return ""
+    base = statements[0].lineno
+    return "\n".join("{:d}\0{}".format(s.lineno - base, texts[id(s)]) for s in statements)
+
+
+class Unit:
+    # a top-level declaration (or all the top-level statements) of one run
+
+    def __init__(self, nodes: [Node], text: str, line: int, signature: str = "",
+            members: frozenset = frozenset()):
+        self.nodes = nodes  # lowered nodes, typed once checked
+        self.text = text  # source text
+        self.line = line  # first line in the source
+        self.signature = signature
+        self.members = members  # names of class members
+        self.names = None  # referenced names, computed when needed
+        self.errors = []  # errors reported while checking the unit
+        self.checked = False
+        self.prev = None  # the same unit in the previous run, if it is reused
+
+    def referencedNames(self) -> set:
+        if self.names is None:
+            self.names = referencedNames(self.nodes)
+        return self.names
+
+
+class _Lowerer(Parser):
+    # a Parser that uses already lowered nodes for some top-level statements
+
+    def __init__(self, lowered: dict):
+        super().__init__()
+        self.lowered = lowered  # id of Python AST node -> lowered node
+
+    def visit(self, node):
+        lowered = self.lowered.get(id(node))
+        if lowered is not None:
+            return lowered
+        return super().visit(node)
+
+
+class _Fallback(Exception):
+    # the declaration passes reported errors during an incremental check
+    pass
+
+
+class IncrementalChecker:
+    # compiles successive versions of a program, lowering and typechecking
+    # only the top-level declarations affected by each change
+
+    def __init__(self, compiler: Compiler):
+        self.compiler = compiler
+        self.units = None  # key -> Unit from the last reusable run, in order
+        self.rechecked = 0  # units checked in the last run
+        self.total = 0  # units in the last run
+        self.source = None  # source text being compiled
+
+    def compile(self, source, typecheck: bool = True, fname="<unknown>"):
+        # same as Compiler.compile, but reusing work from the previous call
+        old = self.units
+        self.units = None
+        if not typecheck or self.compiler.native:
+            # units are matched up through Python's ast module, so the
+            # native parser always recompiles everything
+            return self.compiler.compile(source, typecheck, fname)
+        try:
+            with self.compiler.phase("ast.parse"):
+                module = ast.parse(source)
+        except SyntaxError:
+            # let the Compiler report it
+            return self.compiler.compile(source, True, fname)
+        if isinstance(source, bytes):
+            source = source.decode("utf-8", "replace")
+        lines = NEWLINE.split(source)
+        # a unit runs up to the next top-level statement, since where a
+        # compound statement ends depends on what follows it
+        ends = [b.lineno - 1 for b in module.body[1:]] + [len(lines)]
+        texts = {id(b): "\n".join(lines[b.lineno - 1:end]) for b, end in zip(module.body, ends)}
+        self.source = source
+        if old is not None:
+            try:
+                result = self.incremental(module, texts, old)
+                if result is not None:
+                    return result
+            except _Fallback:
+                pass
+        return self.full(module, texts)
+
+    def lowerer(self) -> _Lowerer:
+        astparser = _Lowerer({})
+        astparser.tracer = self.compiler.tracer
+        astparser.setSource(self.source)
+        astparser.summarize = True
+        return astparser
+
+    def full(self, module: ast.Module, texts: dict):
+        astparser = self.lowerer()
+        with self.compiler.phase("lower"):
+            tree = astparser.visit(module)
+        if len(astparser.errors) > 0:
+            return None, astparser.errors, []  # as Compiler.compile does
+        units = {}
+        for d, b in zip(tree.declarations, module.body):
+            units[declKey(d)] = Unit([d], texts[id(b)], b.lineno, signature(d), memberNames(d))
+        pyStatements = module.body[len(tree.declarations):]
+        units[STATEMENTS] = Unit(tree.statements, statementsText(pyStatements, texts),
+                                 pyStatements[0].lineno if pyStatements else 0)
+        tc, clean = self.check(tree, units, astparser, pyStatements)
+        if clean:
+            self.units = units
+        return tree, astparser.errors, tc.errors
+
+    def incremental(self, module: ast.Module, texts: dict, old: dict):
+        # returns None if the whole program has to be compiled again
+        byText = {u.text: key for key, u in old.items() if key != STATEMENTS}
+        nDecls = 0
+        while nDecls < len(module.body) and isinstance(module.body[nDecls], DECLARATIONS):
+            nDecls += 1
+        pyStatements = module.body[nDecls:]
+        astparser = self.lowerer()
+        units = {}
+        pyNodes = {}  # key -> Python AST node
+        with self.compiler.phase("lower"):
+            for b in module.body[:nDecls]:
+                key = byText.get(texts[id(b)])
+                if key is not None and key not in units:
+                    prev = old[key]
+                    unit = Unit(prev.nodes, prev.text, b.lineno, prev.signature, prev.members)
+                    unit.names = prev.names
+                    unit.prev = prev
+                else:
+                    d = astparser.visit(b)
+                    if not isinstance(d, Declaration):
+                        return None
+                    key = declKey(d)
+                    unit = Unit([d], texts[id(b)], b.lineno, signature(d), memberNames(d))
+                    astparser.lowered[id(b)] = d
+                if key in units:
+                    return None
+                units[key] = unit
+                pyNodes[key] = b
+            if len(astparser.errors) > 0:
+                return None
+            statements = Unit([], statementsText(pyStatements, texts),
+                              pyStatements[0].lineno if pyStatements else 0)
+            units[STATEMENTS] = statements
+            prev = old[STATEMENTS]
+            # (pass statements have no node, so they can't be matched up)
+            if prev.checked and prev.text == statements.text and len(prev.nodes) == len(pyStatements):
+                statements.prev = prev
+
+            changed = self.changedNames(units, old)
+            if changed is None:
+                return None
+            for key, unit in units.items():
+                if unit.prev is None:
+                    continue
+                if changed and unit.prev.referencedNames() & changed:
+                    # same text, but it depends on something that changed
+                    unit.prev = None
+                    if key != STATEMENTS:
+                        d = astparser.visit(pyNodes[key])
+                        unit.nodes = [d]
+                        astparser.lowered[id(pyNodes[key])] = d
+                elif key != STATEMENTS:
+                    shiftLines(unit.nodes[0], unit.line - unit.prev.line)
+                    astparser.lowered[id(pyNodes[key])] = unit.nodes[0]
+            if statements.prev is not None:
+                for node, b in zip(statements.prev.nodes, pyStatements):
+                    shiftLines(node, statements.line - statements.prev.line)
+                    astparser.lowered[id(b)] = node
+            tree = astparser.visit(module)
+            if len(astparser.errors) > 0:
+                return None
+            statements.nodes = tree.statements
+        tc, clean = self.check(tree, units, astparser, pyStatements)
+        if clean:
+            self.units = units
+        return tree, astparser.errors, tc.errors
+
+    def changedNames(self, units: dict, old: dict) -> set:
+        # names whose signatures changed since the previous run, or None if
+        # declarations were reordered
+        common = [k for k in units if k in old]
+        if common != [k for k in old if k in units]:
+            return None
+        changed = set()
+        for key in set(units) | set(old):
+            if key == STATEMENTS:
+                continue
+            if key not in units or key not in old or units[key].signature != old[key].signature:
+                changed.add(key[1])
+                for u in (units.get(key), old.get(key)):
+                    if u is not None:
+                        changed |= u.members
+        # subclasses of a changed class inherit its changes
+        for key, u in units.items():
+            if key[0] == "ClassDef" and u.nodes[0].superclass.name in changed:
+                changed.add(key[1])
+        return changed
+
+    def check(self, tree: Program, units: dict, astparser: _Lowerer, pyStatements: [ast.stmt]):
+        # typecheck the tree like TypeChecker.Program does, except for the
+        # units with a prev, which are already in place; raises _Fallback
+        # if reusing units and the declaration passes report errors
+        reusing = any(u.prev is not None for u in units.values())
+        tc = TypeChecker()
+        if self.compiler.profiler is not None:
+            self.compiler.profiler.instrument(tc)
+        if self.compiler.tracer is not None:
+            self.compiler.tracer.instrument(tc)
+        with self.compiler.phase("typecheck"):
+            tc.program = tree
+            errors = tree.errors.errors
+            tc.addDeclarations(tree)
+            clean = len(tc.errors) == 0
+            if reusing and not clean:
+                raise _Fallback()
+            self.rechecked = 0
+            for d in tree.declarations:
+                unit = units[declKey(d)]
+                prev = unit.prev
+                # reused identifiers may carry errors from checking their bodies
+                if prev is None and d.getIdentifier().errorMsg is not None:
+                    continue
+                start = len(errors)
+                if isinstance(d, ClassDef):
+                    tc.currentClass = d.name.name
+                    before = len(tc.errors)
+                    tc.addMembers(d)
+                    if len(tc.errors) > before:
+                        if reusing:
+                            raise _Fallback()
+                        clean = False
+                    if prev is None:
+                        for m in d.declarations:
+                            tc.visit(m)
+                    tc.currentClass = None
+                elif prev is None:
+                    tc.visit(d)
+                if prev is None:
+                    self.rechecked += 1
+                else:
+                    self.transplantErrors(tc, prev, unit.line - prev.line)
+                unit.errors = errors[start:]
+            statements = units[STATEMENTS]
+            prev = statements.prev
+            if len(tc.errors) == 0:
+                start = len(errors)
+                if prev is None:
+                    for s in tree.statements:
+                        tc.visit(s)
+                    self.rechecked += 1
+                else:
+                    self.transplantErrors(tc, prev, statements.line - prev.line)
+                statements.errors = errors[start:]
+                statements.checked = True
+            elif prev is not None:
+                # unchecked statements have no types, so lower them again
+                for b in pyStatements:
+                    del astparser.lowered[id(b)]
+                tree.statements = statements.nodes = [astparser.visit(b) for b in pyStatements]
+        self.total = len(units)
+        return tc, clean
+
+    def transplantErrors(self, tc: TypeChecker, prev: Unit, delta: int):
+        for e in shiftErrors(prev.errors, delta):
+            tc.program.errors.errors.append(e)
+            tc.errors.append(e.message)
+
+
+def watch(compiler: Compiler, infile: str, outfile: str, typecheck: bool = True,
+        interval: float = 0.2):
+    # recompile infile every time it changes, until interrupted
+    checker = IncrementalChecker(compiler)
+    mtime = None
+    print("Watching " + infile)
+    try:
+        while True:
+            try:
+                current = os.stat(infile).st_mtime_ns
+            except OSError:
+                current = None
+            if current is None or current == mtime:
+                time.sleep(interval)
+                continue
+            mtime = current
+            start = time.perf_counter()
+            with open(infile, "rb") as f:
+                source = f.read()
+            tree, parseErrors, tcErrors = checker.compile(source, typecheck, os.path.basename(infile))
+            for e in parseErrors:
+                print(e)
+            for e in tcErrors:
+                print(e)
+            if tree is not None:
+                with open(outfile, "w") as f:
+                    writeJSON(tree, f)
+            elapsed = (time.perf_counter() - start) * 1000
+            if typecheck and tree is not None and len(parseErrors) == 0:
+                print("Rechecked {:d} of {:d} units in {:.1f} ms".format(
+                    checker.rechecked, checker.total, elapsed))
+            else:
+                print("Compiled in {:.1f} ms".format(elapsed))
+    except KeyboardInterrupt:
+        pass
@@ -1,10 +1,16 @@
 import argparse
-import json
-from test import run_all_tests, run_parse_tests, run_typecheck_tests
+import sys
+from contextlib import nullcontext
+from test import run_all_tests, run_parse_tests, run_typecheck_tests, run_output_tests, run_incremental_tests, run_native_tests
+from bench import BENCHMARKS, run_benchmarks
 from compiler.compiler import Compiler
-from compiler.parser import Parser
-from compiler.typechecker import TypeChecker
-from compiler.astnodes import Node
+from compiler.profiler import Profiler
+from compiler.tracer import Tracer
+from compiler.batch import compileBatch
+from compiler.cache import ASTCache, compileCached, writeAST
+from compiler.server import serve
+from compiler.ndjson import runPipeline
+from compiler.watch import watch
 
 def main():
     parser = argparse.ArgumentParser(description='Chocopy frontend')
@@ -18,11 +24,51 @@ def main():
                     help="run parser test cases")
     parser.add_argument('--test-tc', dest='testtc', action='store_true',
                     help="run typechecker test cases")
+    parser.add_argument('--test-output', dest='testoutput', action='store_true',
+                    help="run JSON output test cases")
+    parser.add_argument('--test-incremental', dest='testincremental', action='store_true',
+                    help="run incremental typechecking test cases")
+    parser.add_argument('--test-native', dest='testnative', action='store_true',
+                    help="run native parser test cases")
+    parser.add_argument('--bench', dest='bench', action='append', choices=list(BENCHMARKS),
+                    help="run a benchmark (may be repeated)")
+    parser.add_argument('--batch', dest='batch', metavar='DIR', default=None,
+                    help="compile every .py file under DIR in parallel")
+    parser.add_argument('-j', '--workers', dest='workers', type=int, default=None,
+                    help="number of worker processes for --batch (default: CPU count)")
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                    help="do not read or write the AST cache")
+    parser.add_argument('--cache-dir', dest='cachedir', metavar='DIR', default=None,
+                    help="directory for the AST cache (default: ~/.cache/chocopy)")
+    parser.add_argument('--serve', dest='serve', action='store_true',
+                    help="run a compile server on a Unix socket (see client.py)")
+    parser.add_argument('--socket', dest='socket', metavar='PATH', default=None,
+                    help="socket path for --serve")
+    parser.add_argument('--ndjson', dest='ndjson', action='store_true',
+                    help="compile newline-delimited JSON requests from stdin to stdout")
+    parser.add_argument('--profile', dest='profile', action='store_true',
+                    help="report time and allocations per phase, node counts and typechecker method stats")
+    parser.add_argument('--trace', dest='trace', metavar='FILE', default=None,
+                    help="write a Chrome trace-event timeline of the compilation to FILE")
+    parser.add_argument('--watch', dest='watch', action='store_true',
+                    help="recompile the input file whenever it changes, rechecking only what changed")
+    parser.add_argument('--native', dest='native', action='store_true',
+                    help="parse with the native ChocoPy parser instead of Python's ast module")
+    parser.add_argument('--low-memory', dest='lowmemory', action='store_true',
+                    help="free Python's AST while lowering it, to lower peak memory on large programs")
+    parser.add_argument('--recover', dest='recover', action='store_true',
+                    help="report every parse error, and typecheck the declarations they don't affect")
     parser.add_argument('infile', nargs='?', type=str, default=None)
     parser.add_argument('outfile', nargs='?', type=str, default=None)
     args = parser.parse_args()
 
-    compiler = Compiler()
+    profiler = None
+    if args.profile:
+        profiler = Profiler()
+    tracer = None
+    if args.trace is not None:
+        tracer = Tracer()
+    compiler = Compiler(profiler, tracer, args.native, args.lowmemory, args.recover)
 
     if args.testall:
         run_all_tests(compiler)
@@ -36,6 +82,66 @@ def main():
         run_typecheck_tests(compiler)
         return
 
+    if args.testoutput:
+        run_output_tests(compiler)
+        return
+
+    if args.testincremental:
+        run_incremental_tests(compiler)
+        return
+
+    if args.testnative:
+        run_native_tests(compiler)
+        return
+
+    if args.bench:
+        run_benchmarks(args.bench)
+        return
+
+    if args.serve:
+        serve(args.socket)
+        return
+
+    if args.ndjson:
+        runPipeline(compiler, sys.stdin, sys.stdout)
+        if profiler is not None:
+            print(profiler.report(), file=sys.stderr)
+        if tracer is not None:
+            tracer.write(args.trace)
+        return
+
+    cache = None
+    # cache hits would skip the phases being profiled or traced
+    if args.cache and not args.profile and args.trace is None:
+        cache = ASTCache(args.cachedir)
+
+    if args.batch is not None:
+        total = 0
+        failed = 0
+        results = compileBatch(args.batch, args.typecheck, args.workers, cache,
+                               args.profile, args.trace is not None, args.native, args.lowmemory,
+                               args.recover)
+        for infile, errors, profile, events in results:
+            total += 1
+            if profile is not None:
+                profiler.merge(profile)
+            if events is not None:
+                tracer.events.extend(events)
+            if errors:
+                failed += 1
+                print(infile)
+                for e in errors:
+                    print("    " + e)
+        print("Compiled {:d} files, {:d} with errors".format(total, failed))
+        if cache is not None:
+            # the workers' entries aren't in this process's ledger count
+            cache.evict(rescan=True)
+        if profiler is not None:
+            print(profiler.report(), file=sys.stderr)
+        if tracer is not None:
+            tracer.write(args.trace)
+        return
+
     infile = args.infile
     outfile = args.outfile
     if args.infile == None:
@@ -49,26 +155,31 @@ def main():
         else:
             outfile = infile + ".ast"
 
-    astparser = Parser()
-    tree = compiler.parse(infile, astparser)
+    if args.watch:
+        watch(compiler, infile, outfile, args.typecheck)
+        return
 
-    if len(astparser.errors) > 0:
-        for e in astparser.errors:
+    with (tracer.span(infile, "file") if tracer is not None else nullcontext()):
+        ast, errors = compileCached(compiler, infile, args.typecheck, cache)
+        for e in errors:
             print(e)
-    elif args.typecheck:
-        tc = TypeChecker()
-        compiler.visit(tree, tc)
-        if len(tc.errors) > 0:
-            for e in astparser.errors:
-                print(e)
-
-    if args.output:
-        ast_json = tree.toJSON()
-        with open(outfile, "w") as f:
-            json.dump(ast_json, f)
-    else:
-        if isinstance(tree, Node):
-            print(json.dumps(tree.toJSON()))
+
+        if ast is not None:
+            with compiler.phase("serialize"):
+                if args.output:
+                    with open(outfile, "w") as f:
+                        writeAST(ast, f)
+                else:
+                    writeAST(ast, sys.stdout)
+                    print()
+
+    if cache is not None:
+        cache.evict()
+
+    if profiler is not None:
+        print(profiler.report(), file=sys.stderr)
+    if tracer is not None:
+        tracer.write(args.trace)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,12 +1,50 @@
 from pathlib import Path
 from compiler.compiler import Compiler
+import io
 import json
+import os
+import random
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import tracemalloc
+from compiler.batch import compileBatch
+from compiler import cache as cachemodule
+from compiler.cache import ASTCache, compileCached, writeAST
+from compiler.server import CompileServer
+from compiler.jsonwriter import writeJSON
+from compiler.ndjson import runPipeline
+from compiler.binary import BinaryFormatError, encode, decode
+from compiler.arena import Arena
 from compiler.parser import Parser
+from compiler.schema import FIELDS, NODE, LIST, MAYBE
+from compiler.profiler import Profiler
+from compiler.tracer import Tracer
 from compiler.typechecker import TypeChecker
+from compiler.types import ClassValueType, ListValueType
+from client import CompileClient
+from compiler.watch import IncrementalChecker
+from bench import generate_program
 
 def run_all_tests(compiler: Compiler):
     run_parse_tests(compiler)
     run_typecheck_tests(compiler)
+    run_output_tests(compiler)
+    run_batch_tests(compiler)
+    run_cache_tests(compiler)
+    run_server_tests(compiler)
+    run_ndjson_tests(compiler)
+    run_profiler_tests()
+    run_trace_tests()
+    run_incremental_tests(compiler)
+    run_native_tests(compiler)
+    run_low_memory_tests(compiler)
+    run_recovery_tests(compiler)
+    run_arena_tests(compiler)
+    run_depth_tests(compiler)
+    run_hierarchy_tests(compiler)
 
 def run_parse_tests(compiler: Compiler):
     print("Running parser tests...\n")
@@ -48,6 +86,698 @@ def run_typecheck_tests(compiler: Compiler):
             n_passed += 1
     print("\nPassed {:d} out of {:d} typechecker test cases\n".format(n_passed, total))
 
+def run_batch_tests(compiler: Compiler):
+    # a batch must write each file's output and report its errors exactly as
+    # compiling the files one at a time does, with one worker or several
+    print("Running batch tests...\n")
+    root = Path(__file__).parent / "tests"
+    tests = sorted((root / "typecheck").glob("*.py"))[:16] + sorted((root / "parse").glob("bad_*.py"))[:4]
+    n_passed = 0
+    total = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for test in tests:
+            # nested directories are searched too
+            dest = tmp / test.parent.name / test.name
+            dest.parent.mkdir(exist_ok=True)
+            shutil.copy(str(test), str(dest))
+        expected = {}
+        for infile in sorted(tmp.rglob("*.py")):
+            ast, errors = compileCached(compiler, str(infile))
+            out = io.StringIO()
+            writeAST(ast, out)
+            expected[str(infile)] = (errors, out.getvalue() if ast is not None else None)
+        for workers in [1, 2]:
+            total += 1
+            results = {infile: errors for infile, errors, *_ in compileBatch(str(tmp), True, workers)}
+            outputs = {}
+            for infile in expected:
+                output = Path(infile + ".ast.typed")
+                outputs[infile] = (results.get(infile), output.read_text() if output.exists() else None)
+                if output.exists():
+                    output.unlink()
+            if outputs != expected:
+                print("Failed: batch with {:d} worker{}".format(workers, "s" if workers > 1 else ""))
+            else:
+                n_passed += 1
+    print("\nPassed {:d} out of {:d} batch test cases\n".format(n_passed, total))
+
+def run_cache_tests(compiler: Compiler):
+    # hits, misses, invalidation by file name and compiler version, and eviction
+    print("Running AST cache tests...\n")
+    n_passed = 0
+    total = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        a = tmp / "a.py"
+        b = tmp / "b.py"
+        c = tmp / "c.py"
+        for f in (a, b):
+            f.write_text("x: int = (1\n")  # the syntax error names the file
+        c.write_text("x: int = 1\nx = True\n")
+        cache = ASTCache(str(tmp / "cache"))
+        results = [
+            ("miss", run_cache_test(compiler, cache, a, False)),
+            ("hit", run_cache_test(compiler, cache, a, True)),
+            ("same source in another file", run_cache_test(compiler, cache, b, False)),
+            ("miss on a typechecked file", run_cache_test(compiler, cache, c, False)),
+            ("hit on a typechecked file", run_cache_test(compiler, cache, c, True)),
+        ]
+        version = cachemodule.__version__
+        cachemodule.__version__ = version + "+test"
+        try:
+            results.append(("new compiler version", run_cache_test(compiler, cache, a, False)))
+        finally:
+            cachemodule.__version__ = version
+        results.append(("hit after a new version", run_cache_test(compiler, cache, a, True)))
+        # the ledger holds every entry written so far; past maxBytes, the
+        # least recently used entries go
+        cache.evict()
+        entries = sorted(cache.cacheDir.glob("*/*"), key=lambda p: p.stat().st_mtime)
+        for i, p in enumerate(entries):
+            os.utime(p, (1000000 + i, 1000000 + i))  # distinct ages
+        size = sum(p.stat().st_size for p in entries)
+        results.append(("size ledger", cache.readSize() == size))
+        cache.maxBytes = size - 1
+        cache.evict(rescan=True)
+        remaining = set(cache.cacheDir.glob("*/*"))
+        results.append(("eviction", entries[0] not in remaining and entries[-1] in remaining
+                        and cache.readSize() == sum(p.stat().st_size for p in remaining)))
+    for name, passed in results:
+        total += 1
+        if passed:
+            n_passed += 1
+        else:
+            print("Failed: " + name)
+    print("\nPassed {:d} out of {:d} AST cache test cases\n".format(n_passed, total))
+
+def run_cache_test(compiler: Compiler, cache: ASTCache, infile: Path, hit: bool)->bool:
+    # the result must come from the cache iff hit, and match an uncached compile
+    written = cache.written
+    ast, errors = compileCached(compiler, str(infile), True, cache)
+    expected, expectedErrors = compileCached(compiler, str(infile), True)
+    if (cache.written == written) != hit or errors != expectedErrors:
+        return False
+    if expected is None:
+        return ast is None and len(errors) == 1 and infile.name in errors[0]
+    out = io.StringIO()
+    ast.writeTo(out)
+    return json.loads(out.getvalue()) == expected.toJSON()
+
+def run_server_tests(compiler: Compiler):
+    # compile requests over a connection to a server must give the results of
+    # compiling directly, and a second server must not take over the socket
+    print("Running compile server tests...\n")
+    sources = [("a.py", "x: int = 1\nx = True\n"), ("b.py", "x: int = (1\n"), ("c.py", "print(1)\n")]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "server.sock")
+        server = CompileServer(path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        results = []
+        try:
+            client = CompileClient(path)
+            try:
+                for fname, source in sources:
+                    response = client.compile(source, True, fname)
+                    ast, parseErrors, tcErrors = compiler.compile(source, True, fname)
+                    results.append((fname, response == {
+                        "ast": None if ast is None else json.loads(json.dumps(ast.toJSON())),
+                        "errors": [str(e) for e in parseErrors] + tcErrors}))
+            finally:
+                client.close()
+            try:
+                CompileServer(path).server_close()
+                results.append(("second server", False))
+            except OSError:
+                results.append(("second server", os.path.exists(path)))
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+        # a socket left behind by a server that died is replaced
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        server = CompileServer(path)
+        server.server_close()
+        results.append(("stale socket", not os.path.exists(path)))
+    n_passed = 0
+    for name, passed in results:
+        if passed:
+            n_passed += 1
+        else:
+            print("Failed: " + name)
+    print("\nPassed {:d} out of {:d} compile server test cases\n".format(n_passed, len(results)))
+
+def run_output_tests(compiler: Compiler):
+    print("Running output tests...\n")
+    total = 0
+    n_passed = 0
+    tc_tests_dir = (Path(__file__).parent / "tests/typecheck/").resolve()
+    for test in tc_tests_dir.glob('*.py'):
+        passed = run_output_test(test, compiler)
+        total += 1
+        if not passed:
+            print("Failed: " + test.name)
+        else:
+            n_passed += 1
+    print("\nPassed {:d} out of {:d} output test cases\n".format(n_passed, total))
+
+def run_ndjson_tests(compiler: Compiler):
+    # each request line must get one response line with the results of
+    # compiling directly, and bad lines an error response, in order
+    print("Running NDJSON pipeline tests...\n")
+    programs = [(1, "x: int = 1\nx = True\n", True), ("b", "x: int = (1\n", True), (None, "print(1)\n", False)]
+    lines = [json.dumps({"id": rid, "source": source, "typecheck": typecheck})
+             for rid, source, typecheck in programs]
+    lines.insert(1, "")
+    lines += ["{not json", json.dumps({"id": 7, "typecheck": True})]
+    out = io.StringIO()
+    runPipeline(compiler, io.StringIO("\n".join(lines) + "\n"), out)
+    responses = [json.loads(line) for line in out.getvalue().splitlines()]
+    results = [("number of responses", len(responses) == len(programs) + 2)]
+    for (rid, source, typecheck), response in zip(programs, responses):
+        ast, parseErrors, tcErrors = compiler.compile(source, typecheck)
+        results.append(("request " + str(rid), response["id"] == rid
+            and response["ast"] == (None if ast is None else json.loads(json.dumps(ast.toJSON())))
+            and response["errors"] == [str(e) for e in parseErrors] + tcErrors
+            and set(response["timings"]) >= {"parse", "serialize"}))
+    errors = responses[len(programs):]
+    results.append(("malformed line", len(errors) > 0 and errors[0]["id"] is None and "error" in errors[0]))
+    results.append(("request without source", len(errors) > 1 and errors[1]["id"] == 7 and "error" in errors[1]
+                    and "ast" not in errors[1]))
+    n_passed = 0
+    for name, passed in results:
+        if passed:
+            n_passed += 1
+        else:
+            print("Failed: " + name)
+    print("\nPassed {:d} out of {:d} NDJSON pipeline test cases\n".format(n_passed, len(results)))
+
+def run_profiler_tests():
+    # profiles must survive a toJSON round trip, add up when merged, and
+    # not leave allocation tracing on after a phase
+    print("Running profiler tests...\n")
+    profiler = Profiler()
+    source = chain_source(20, "x: C0 = None\n", "x = C19()\nprint([x, C3()])\n")
+    Compiler(profiler).compile(source)
+    d = json.loads(json.dumps(profiler.toJSON()))
+    merged = Profiler()
+    merged.merge(d)
+    merged.merge(d)
+    phases = d["phases"]
+    results = [
+        ("phases", set(phases) == {"ast.parse", "lower", "typecheck"}
+            and all(p["calls"] == 1 and p["allocated"] >= 0 for p in phases.values())),
+        ("tracing stopped", not tracemalloc.is_tracing()),
+        ("node counts", d["nodeCounts"]["ClassDef"] == 20),
+        ("cache counts", sum(c["hits"] + c["misses"] for c in d["caches"].values()) > 0),
+        ("merged round trip", merged.toJSON().keys() == d.keys()),
+        ("merged phases", all(merged.phases[name][0] == 2 and merged.phases[name][2] == 2 * p["allocated"]
+            and merged.phases[name][3] == p["peak"] for name, p in phases.items())),
+        ("merged node counts", all(merged.nodeCounts[k] == 2 * n for k, n in d["nodeCounts"].items())),
+        ("merged methods", all(merged.methods[name][0] == 2 * m["calls"] for name, m in d["methods"].items())),
+        ("merged caches", all(merged.caches[name] == [2 * c["hits"], 2 * c["misses"]]
+            for name, c in d["caches"].items())),
+        ("report", "typecheck" in merged.report()),
+    ]
+    n_passed = 0
+    for name, passed in results:
+        if passed:
+            n_passed += 1
+        else:
+            print("Failed: " + name)
+    print("\nPassed {:d} out of {:d} profiler test cases\n".format(n_passed, len(results)))
+
+def run_trace_tests():
+    # every span must begin and end, properly nested, including one left by
+    # an exception, with the definitions inside the phases that handle them
+    print("Running trace tests...\n")
+    tracer = Tracer()
+    compiler = Compiler(tracer=tracer)
+    compiler.compile("def f(x: int) -> int:\n    return x\nclass A(object):\n    pass\nprint(f(1))\n")
+    try:
+        with tracer.span("failing"):
+            compiler.compile(None)
+    except Exception:
+        pass
+    events = json.loads(json.dumps(tracer.toJSON()))["traceEvents"]
+    spans = trace_spans(events)
+    results = [
+        ("well-formed", spans is not None),
+        ("phases", spans is not None and {("ast.parse",), ("lower",), ("typecheck",)} <= spans),
+        ("lowered definitions", spans is not None
+            and {("lower", "FunctionDef f"), ("lower", "ClassDef A"), ("lower", "Expr")} <= spans),
+        ("checked definitions", spans is not None
+            and {("typecheck", "FuncDef f"), ("typecheck", "ClassDef A")} <= spans),
+        ("span left by an exception", spans is not None and ("failing",) in spans),
+    ]
+    n_passed = 0
+    for name, passed in results:
+        if passed:
+            n_passed += 1
+        else:
+            print("Failed: " + name)
+    print("\nPassed {:d} out of {:d} trace test cases\n".format(n_passed, len(results)))
+
+def trace_spans(events: [dict]):
+    # the spans of a trace, as tuples of the names of the spans enclosing them
+    # and their own, or None if its begin and end events don't pair up
+    stacks = {}
+    spans = set()
+    last = None
+    for e in events:
+        if last is not None and e["ts"] < last:
+            return None
+        last = e["ts"]
+        stack = stacks.setdefault((e["pid"], e["tid"]), [])
+        if e["ph"] == "B":
+            stack.append((e["name"], e["cat"]))
+            spans.add(tuple(name for name, _ in stack))
+        elif e["ph"] != "E" or not stack or stack.pop() != (e["name"], e["cat"]):
+            return None
+    if any(stacks.values()):
+        return None
+    return spans
+
+def run_incremental_tests(compiler: Compiler):
+    print("Running incremental typecheck tests...\n")
+    total = 0
+    n_passed = 0
+    tc_tests_dir = (Path(__file__).parent / "tests/typecheck/").resolve()
+    for test in tc_tests_dir.glob('*.py'):
+        passed = run_incremental_test(test, compiler)
+        total += 1
+        if not passed:
+            print("Failed: " + test.name)
+        else:
+            n_passed += 1
+    # changing a function's return type must re-check the functions that
+    # call it, and changing it back must clear their errors again
+    source = ["def f() -> int:", "    return 1", "def g() -> int:", "    return f()", "print(g())"]
+    edited = ["def f() -> str:", "    return \"1\""] + source[2:]
+    checker = IncrementalChecker(compiler)
+    errors = [checker.compile("\n".join(version))[2] for version in [source, edited, source]]
+    total += 1
+    if (errors[0] or errors[2] or errors[1] != ["Expected int, got str. Line 4 Col 5"]
+            or not run_incremental_versions([source, edited, source], compiler)):
+        print("Failed: return type of a called function")
+    else:
+        n_passed += 1
+    print("\nPassed {:d} out of {:d} incremental typecheck test cases\n".format(n_passed, total))
+
+def run_native_tests(compiler: Compiler):
+    # the parser, typechecker and output tests again, parsing with the native parser
+    native = Compiler(compiler.profiler, compiler.tracer, native=True)
+    print("Running native parser tests...\n")
+    run_parse_tests(native)
+    run_typecheck_tests(native)
+    run_output_tests(native)
+    run_location_tests(compiler, native)
+    run_native_error_tests(compiler, native)
+
+def run_native_error_tests(compiler: Compiler, native: Compiler):
+    # both parsers must report the same first parse error (the native parser
+    # stops there) and the same type errors; Python's own syntax errors are
+    # worded differently, so for those only the line must match
+    print("Running native parser error tests...\n")
+    total = 0
+    n_passed = 0
+    for tests_dir in ["tests/parse/", "tests/typecheck/"]:
+        for test in (Path(__file__).parent / tests_dir).resolve().glob('*.py'):
+            source = test.read_bytes()
+            _, parseErrors, tcErrors = compiler.compile(source, True, test.name)
+            _, nativeParseErrors, nativeTcErrors = native.compile(source, True, test.name)
+            expected = [str(e) for e in parseErrors[:1]]
+            errors = [str(e) for e in nativeParseErrors]
+            if expected and expected[0].startswith("Syntax Error:") and len(errors) == 1:
+                expected = re.findall(r"Line \d+ ", expected[0])
+                errors = re.findall(r"Line \d+ ", errors[0])
+            total += 1
+            if errors != expected or nativeTcErrors != tcErrors:
+                print("Failed: " + test.name)
+            else:
+                n_passed += 1
+    print("\nPassed {:d} out of {:d} native parser error test cases\n".format(n_passed, total))
+
+def run_location_tests(compiler: Compiler, native: Compiler):
+    # both parsers must give every node the same start and end location
+    print("Running location tests...\n")
+    total = 0
+    n_passed = 0
+    for tests_dir in ["tests/parse/", "tests/typecheck/"]:
+        for test in (Path(__file__).parent / tests_dir).resolve().glob('*.py'):
+            source = test.read_bytes()
+            ast, parseErrors, _ = compiler.compile(source, False)
+            if len(parseErrors) > 0:
+                continue
+            expected, nativeErrors, _ = native.compile(source, False)
+            total += 1
+            if len(nativeErrors) > 0 or json.dumps(ast.toJSON()) != json.dumps(expected.toJSON()):
+                print("Failed: " + test.name)
+            else:
+                n_passed += 1
+    # a byte order mark, in bytes or text, moves no columns on the first line
+    for source in [b"\xef\xbb\xbfx: int = 1\nprint(x)\n", "\ufeffx: int = 1\nprint(x)\n"]:
+        expected = json.dumps(native.compile(source)[0].toJSON())
+        for c in [compiler, Compiler(compiler.profiler, compiler.tracer, lowMemory=True)]:
+            total += 1
+            ast, parseErrors, _ = c.compile(source)
+            if len(parseErrors) > 0 or json.dumps(ast.toJSON()) != expected:
+                print("Failed: byte order mark" + (" (low memory)" if c.lowMemory else ""))
+            else:
+                n_passed += 1
+    print("\nPassed {:d} out of {:d} location test cases\n".format(n_passed, total))
+
+def run_low_memory_tests(compiler: Compiler):
+    # lowering in chunks must give the same ASTs and errors as lowering the
+    # whole program, including for programs long enough to be split
+    print("Running low-memory lowering tests...\n")
+    low = Compiler(compiler.profiler, compiler.tracer, lowMemory=True)
+    sources = []
+    for tests_dir in ["tests/parse/", "tests/typecheck/"]:
+        for test in (Path(__file__).parent / tests_dir).resolve().glob('*.py'):
+            sources.append((test.name, test.read_text()))
+    padding = "".join("p{:d}: int = {:d}\n".format(i, i) for i in range(1500))
+    sources += [
+        ("generated", generate_program(100)),
+        ("brackets", padding + "x: [int] = None\n" + "x = [1,\n2,\n3]\nif x[0] > 1:\n    pass\nelse:\n    print(\"(\")\n" * 400),
+        ("continuation", padding + "x: int = 1\n" + "x = 1 + \\\n2\n" * 600),
+        ("strings", padding + "s: str = \"[#\"\n" + "s = \"]\" + s # (\n" * 700),
+        ("late syntax error", padding + "x: int = 1\n" + "x = 1\n" * 1000 + "x = (1\n"),
+        ("late parse error", padding + "print(1)\nx: int = 1\n"),
+    ]
+    total = 0
+    n_passed = 0
+    for name, source in sources:
+        total += 1
+        ast, parseErrors, tcErrors = low.compile(source)
+        expected, expectedParseErrors, expectedTcErrors = compiler.compile(source)
+        passed = ([str(e) for e in parseErrors] == [str(e) for e in expectedParseErrors]
+                  and tcErrors == expectedTcErrors
+                  and (ast is None) == (expected is None)
+                  and (len(parseErrors) > 0 or json.dumps(ast.toJSON()) == json.dumps(expected.toJSON())))
+        if not passed:
+            print("Failed: " + name)
+        else:
+            n_passed += 1
+    print("\nPassed {:d} out of {:d} low-memory lowering test cases\n".format(n_passed, total))
+
+def run_recovery_tests(compiler: Compiler):
+    # recovering must not change the result for programs that parse, must
+    # report the first parse error the same way, and for the cases below
+    # must report exactly these parse and typecheck errors
+    print("Running error recovery tests...\n")
+    recover = Compiler(compiler.profiler, compiler.tracer, recover=True)
+    lowRecover = Compiler(compiler.profiler, compiler.tracer, lowMemory=True, recover=True)
+    total = 0
+    n_passed = 0
+    for tests_dir in ["tests/parse/", "tests/typecheck/"]:
+        for test in (Path(__file__).parent / tests_dir).resolve().glob('*.py'):
+            total += 1
+            source = test.read_text()
+            ast, parseErrors, tcErrors = recover.compile(source)
+            expected, expectedParseErrors, expectedTcErrors = compiler.compile(source)
+            if len(expectedParseErrors) == 0:
+                passed = (len(parseErrors) == 0 and tcErrors == expectedTcErrors
+                          and json.dumps(ast.toJSON()) == json.dumps(expected.toJSON()))
+            else:
+                passed = len(parseErrors) > 0 and str(parseErrors[0]) == str(expectedParseErrors[0])
+            if not passed:
+                print("Failed: " + test.name)
+            else:
+                n_passed += 1
+    cases = [
+        ("independent declarations",
+         "def f(x: int, *y: int) -> int:\n    return x\n"
+         "def g() -> bool:\n    return 1\n"
+         "x: int = f(1)\n",
+         ["Unsupported vararg. Line 1 Col 16", "Expected literal value. Line 5 Col 10"],
+         ["Expected bool, got int. Line 4 Col 5"]),
+        ("class members",
+         "class A(object):\n    x: int = 1\n    print(x)\n    def m(self: \"A\") -> int:\n        return self.x\n"
+         "class B(A):\n    def n(self: \"B\") -> str:\n        return self.m()\n",
+         ["Expected declaration. Line 3 Col 5"],
+         ["Expected str, got int. Line 8 Col 9"]),
+        ("functions",
+         "def f(a: int) -> int:\n    class C(object):\n        pass\n    return a\n"
+         "def g(b) -> int:\n    return b\n"
+         "def h() -> int:\n    while True:\n        pass\n    else:\n        pass\n    return \"h\"\n"
+         "def k() -> int:\n    return True\n",
+         ["Inner classes are unsupported. Line 2 Col 5", "Missing type annotation. Line 5 Col 7",
+          "Cannot have else in while. Line 8 Col 5"],
+         ["Expected int, got bool. Line 14 Col 5"]),
+        ("expressions",
+         "def f() -> int:\n    return 1 ** 2\n"
+         "def g() -> int:\n    return h(x=1)\n"
+         "def h(x: int) -> int:\n    return \"x\"\n"
+         "print(f())\n",
+         ["Unsupported operator: **.", "Keyword args are not supported. Line 4 Col 12"],
+         ["Expected int, got str. Line 6 Col 5"]),
+        ("declaration of a member",
+         "x: int = 1\n"
+         "x.y: int = 1\n"
+         "x = \"x\"\n",
+         ["Expected variable. Line 2 Col 1"],
+         ["Expected int, got str. Line 3 Col 1"]),
+        ("statements",
+         "x: int = 1\n"
+         "x = 2\nprint(x @ 1)\nx = \"x\"\n",
+         ["Unsupported operator: @."],
+         ["Expected int, got str. Line 4 Col 1"]),
+    ]
+    for name, source, expectedParseErrors, expectedTcErrors in cases:
+        for c in [recover, lowRecover]:
+            total += 1
+            ast, parseErrors, tcErrors = c.compile(source)
+            passed = ast is not None and [str(e) for e in parseErrors] == expectedParseErrors
+            passed = passed and tcErrors == expectedTcErrors
+            if not passed:
+                print("Failed: " + name + (" (low memory)" if c.lowMemory else ""))
+            else:
+                n_passed += 1
+    print("\nPassed {:d} out of {:d} error recovery test cases\n".format(n_passed, total))
+
+def run_arena_tests(compiler: Compiler):
+    # every typed test AST, stored in one arena, must write the same JSON
+    # through NodeRef views and rebuild to the same nodes, subtrees included
+    print("Running arena tests...\n")
+    arena = Arena()
+    trees = []
+    for test in sorted((Path(__file__).parent / "tests/typecheck/").resolve().glob('*.py')):
+        ast, parseErrors, tcErrors = compiler.compile(test.read_text())
+        if ast is not None:
+            trees.append((test.name, ast, arena.add(ast)))
+    n_passed = 0
+    for name, ast, handle in trees:
+        expected = io.StringIO()
+        writeJSON(ast, expected)
+        actual = io.StringIO()
+        writeJSON(arena.ref(handle), actual)
+        passed = actual.getvalue() == expected.getvalue() and encode(arena.node(handle)) == encode(ast)
+        # the subtrees of the statements are contiguous runs of handles too
+        for s, ref in zip(ast.statements, arena.ref(handle).statements):
+            passed = passed and encode(arena.node(ref.handle)) == encode(s)
+        if not passed:
+            print("Failed: " + name)
+        else:
+            n_passed += 1
+    # locations and type IDs too large for the 2-byte columns widen them
+    for i in range(0x8000):
+        arena.typeId(ClassValueType("T{:d}".format(i)))
+    source = "x: [int] = None\nx = [" + "1, " * 22000 + "1]\n"
+    ast = compiler.compile(source)[0]
+    handle = arena.add(ast)
+    expected = io.StringIO()
+    writeJSON(ast, expected)
+    actual = io.StringIO()
+    writeJSON(arena.ref(handle), actual)
+    if (arena.narrow or arena.typeIds.typecode != "i" or actual.getvalue() != expected.getvalue()
+            or any(encode(arena.node(h)) != encode(tree) for _, tree, h in trees[:3])):
+        print("Failed: widened columns")
+    else:
+        n_passed += 1
+    print("\nPassed {:d} out of {:d} arena test cases\n".format(n_passed, len(trees) + 1))
+
+def run_depth_tests(compiler: Compiler):
+    # deeply nested expressions, as deep as ast.parse allows, and much deeper
+    # with the native parser
+    print("Running expression depth tests...\n")
+    native = Compiler(compiler.profiler, compiler.tracer, native=True)
+    cases = [(compiler, 1000), (native, 10000)]
+    total = 0
+    n_passed = 0
+    for c, depth in cases:
+        for kind in ["add", "paren", "negate", "ifexpr", "method"]:
+            passed = run_depth_test(kind, depth, c)
+            total += 1
+            if not passed:
+                print("Failed: {} at depth {:d}{}".format(kind, depth, " (native)" if c.native else ""))
+            else:
+                n_passed += 1
+    total += 1
+    if run_depth_test("add", 100000, native):
+        n_passed += 1
+    else:
+        print("Failed: add at depth 100000 (native)")
+    print("\nPassed {:d} out of {:d} expression depth test cases\n".format(n_passed, total))
+
+def run_depth_test(kind: str, depth: int, compiler: Compiler)->bool:
+    # the program must typecheck cleanly and serialize
+    if kind == "paren" and not compiler.native:
+        depth = 150  # ast.parse allows at most 200 nested parentheses
+    expr = {
+        "add": " + ".join(["1"] * depth),
+        "paren": "(" * depth + "1" + ")" * depth,
+        "negate": "-" * depth + "1",
+        "ifexpr": "1 if True else " * depth + "1",
+        "method": "C()" + ".f()" * depth + ".x",
+    }[kind]
+    source = "class C(object):\n    x: int = 0\n    def f(self: \"C\") -> \"C\":\n        return self\nprint(" + expr + ")\n"
+    ast, parseErrors, tcErrors = compiler.compile(source)
+    if len(parseErrors) > 0 or len(tcErrors) > 0:
+        return False
+    out = io.StringIO()
+    writeJSON(ast, out)
+    # too deep for json.loads, so check the nodes' kinds and that the
+    # brackets balance and nest at least once per level (parentheses add none)
+    kinds, nesting = json_kinds(out.getvalue())
+    if kinds != preorder_kinds(ast) or nesting < (1 if kind == "paren" else depth):
+        return False
+    return len(decode(encode(ast)).statements) == 1
+
+JSON_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[\[\]{}]')
+TYPE_KINDS = {"ClassValueType", "ListValueType", "FuncType"}
+
+def json_kinds(text: str):
+    # the kinds of the AST nodes in JSON text, in order, and how deeply its
+    # brackets nest (-1 if they don't balance)
+    kinds = []
+    depth = 0
+    nesting = 0
+    tokens = JSON_TOKEN.finditer(text)
+    for m in tokens:
+        token = m.group()
+        if token == '"kind"':
+            kind = json.loads(next(tokens).group())
+            if kind not in TYPE_KINDS:
+                kinds.append(kind)
+        elif token in "[{":
+            depth += 1
+            nesting = max(nesting, depth)
+        elif token in "]}":
+            depth -= 1
+            if depth < 0:
+                return kinds, -1
+    return kinds, nesting if depth == 0 else -1
+
+def preorder_kinds(tree) -> [str]:
+    kinds = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        kinds.append(node.kind)
+        children = []
+        for _, attr, shape in FIELDS.get(node.kind, ()):
+            value = getattr(node, attr)
+            if shape == NODE or (shape == MAYBE and value is not None):
+                children.append(value)
+            elif shape == LIST:
+                children.extend(value)
+        stack.extend(reversed(children))
+    return kinds
+
+def run_hierarchy_tests(compiler: Compiler):
+    # member lookups and subtyping on long inheritance chains and branching
+    # hierarchies, and redeclared classes
+    print("Running class hierarchy tests...\n")
+    cases = [
+        ("chain of 1500 classes", chain_source(1500), 0),
+        ("redefined attribute at depth 1500", chain_source(1500, "class D(C1499):\n    a0: int = 1\n"), 1),
+        ("overridden method at depth 1500", chain_source(1500,
+            "class D(C1499):\n    def m0(self: \"D\") -> str:\n        return \"\"\n"), 1),
+        ("assignment to superclass at depth 1500", chain_source(1500, "d: C0 = None\n", "d = c\n"), 0),
+        ("assignment to subclass at depth 1500", chain_source(1500, "d: C0 = None\n", "c = d\n"), 1),
+        ("assignment between sibling classes", chain_source(1500,
+            "class X(C700):\n    pass\nclass Y(C700):\n    pass\nx: X = None\ny: C700 = None\n",
+            "y = x\nx = Y()\n"), 1),
+        ("list of an untyped and a typed element",
+            "z: [bool] = None\nz = [Fal<se, True]\n", 4, "Expected [bool], got [object]. Line 2 Col 1"),
+        ("class redeclared below its subclass",
+            "class A(object):\n    x: int = 1\nclass B(A):\n    y: int = 2\nclass A(B):\n    z: int = 3\nprint(B().x)\n", 1),
+    ]
+    n_passed = 0
+    for name, source, nErrors, *message in cases:
+        ast, parseErrors, tcErrors = compiler.compile(source)
+        if len(parseErrors) > 0 or len(tcErrors) != nErrors or message and message[0] not in tcErrors:
+            print("Failed: " + name)
+        else:
+            n_passed += 1
+    joins = [
+        ("join of siblings in a list", "[X(), Y()]", "C700"),
+        ("join of classes 800 levels apart", "[c, Y(), None]", "C701"),
+        ("join of a class and a subclass", "C3() if True else C1400()", "C3"),
+        ("join of a class and int", "[c, 1]", "object"),
+    ]
+    for name, expr, expected in joins:
+        ast, parseErrors, tcErrors = compiler.compile(chain_source(1500,
+            "class X(C700):\n    pass\nclass Y(C701):\n    pass\n", "print(" + expr + ")\n"))
+        t = ast.statements[-1].expr.args[0].inferredType if len(tcErrors) == 0 else None
+        if isinstance(t, ListValueType):
+            t = t.elementType
+        if t != ClassValueType(expected):
+            print("Failed: " + name)
+        else:
+            n_passed += 1
+    total = len(cases) + len(joins) + 1
+    if run_join_test(compiler):
+        n_passed += 1
+    else:
+        print("Failed: joins in a random class tree")
+    print("\nPassed {:d} out of {:d} class hierarchy test cases\n".format(n_passed, total))
+
+def run_join_test(compiler: Compiler) -> bool:
+    # every pair of classes in a random tree must join to the closest common
+    # superclass found by comparing their lists of superclasses
+    rng = random.Random(164)
+    n = 300
+    parents = ["object"] + ["K{:d}".format(rng.randrange(i)) for i in range(1, n)]
+    source = "".join("class K{:d}({}):\n    pass\n".format(i, p) for i, p in enumerate(parents)) + "print(1)\n"
+    ast = compiler.compile(source, False)[0]
+    tc = TypeChecker()
+    compiler.visit(ast, tc)
+    def superclasses(c):
+        result = []
+        while c is not None:
+            result.append(c)
+            c = tc.superclasses[c]
+        return result[::-1]
+    classes = ["K{:d}".format(i) for i in range(n)] + ["int", "str"]
+    for a in classes:
+        for b in classes:
+            common = [x for x, y in zip(superclasses(a), superclasses(b)) if x == y]
+            if tc.join(ClassValueType(a), ClassValueType(b)) != ClassValueType(common[-1]):
+                return False
+    # joining fewer pairs than the join cache holds a second time only hits
+    # the cache, and gives the same results
+    few = [ClassValueType(c) for c in classes[:40]]
+    first = [tc.join(a, b) for a in few for b in few]
+    hits = tc.cacheStats["join"][0]
+    return [tc.join(a, b) for a in few for b in few] == first and tc.cacheStats["join"][0] - hits == len(first)
+
+def chain_source(n: int, declarations: str = "", statements: str = "") -> str:
+    # classes C0 <- C1 <- ... each adding an attribute and a method, and the
+    # extra declarations, with members of C0 used through the last class
+    # before the extra statements
+    decls = []
+    for i in range(n):
+        decls.append("class C{:d}({}):\n    a{:d}: int = {:d}\n    def m{:d}(self: \"C{:d}\") -> int:\n        return self.a{:d}\n".format(
+            i, "object" if i == 0 else "C{:d}".format(i - 1), i, i, i, i, i))
+    last = "C{:d}".format(n - 1)
+    return "".join(decls) + declarations + "c: {} = None\nc = {}()\nprint(c.a0 + c.m0() + c.m{:d}())\n".format(
+        last, last, n - 1) + statements
+
 def run_parse_test(test, compiler: Compiler, bad=True)->bool:
     # if bad=True, then test cases prefixed with bad are expected to fail
     astparser = Parser()
@@ -72,13 +802,110 @@ def run_typecheck_test(test, compiler: Compiler)->bool:
     ast = compiler.parse(test, astparser)
     if len(astparser.errors) > 0:
         return False
+    # decoded trees have no declaration summaries, and must check the same
+    bare = decode(encode(ast))
     tc = TypeChecker()
     compiler.visit(ast, tc)
+    bareTc = TypeChecker()
+    compiler.visit(bare, bareTc)
+    if bareTc.errors != tc.errors:
+        return False
     ast_json = ast.toJSON()
     with test.with_suffix(".py.ast.typed").open("r") as f:
         correct_json = json.load(f)
         return ast_equals(ast_json, correct_json)
 
+def run_output_test(test, compiler: Compiler)->bool:
+    # the streaming writer must produce exactly the output of json.dumps(toJSON()),
+    # and the binary format must round trip to the same JSON
+    astparser = Parser()
+    ast = compiler.parse(test, astparser)
+    if len(astparser.errors) > 0:
+        return False
+    for typecheck in [False, True]:
+        if typecheck:
+            compiler.visit(ast, TypeChecker())
+        # use a tiny chunk size to exercise chunked writes
+        out = io.StringIO()
+        writeJSON(ast, out, chunkSize=16)
+        expected = json.dumps(ast.toJSON())
+        if out.getvalue() != expected:
+            return False
+        data = encode(ast)
+        if json.dumps(decode(data).toJSON()) != expected or not run_corrupt_binary_test(data):
+            return False
+    return True
+
+def run_corrupt_binary_test(data: bytes)->bool:
+    # truncated or corrupt data must either decode (a truncated post-order
+    # record list can still hold a whole subtree) or be rejected with a
+    # BinaryFormatError, rather than whatever the decoder ran into
+    step = max(len(data) // 8, 1)
+    for i in range(1, len(data), step):
+        for corrupt in (data[:i], data[:i] + b"\x00" + data[i + 1:],
+                        data[:i] + b"\x7f" + data[i + 1:], data[:i] + b"\xff" + data[i + 1:]):
+            try:
+                decode(corrupt)
+            except BinaryFormatError:
+                pass
+    return True
+
+def run_incremental_test(test, compiler: Compiler)->bool:
+    # recompiling edited versions of a program incrementally must give the
+    # same AST and errors as compiling each version from scratch; each edit
+    # is undone again by the version after it
+    lines = test.read_text().split("\n")
+    middle = len(lines) // 2
+    versions = [
+        lines,
+        [""] + lines,
+        [""] + lines[:middle] + ["", ""] + lines[middle:],
+        lines,
+        edit_declaration(lines, "type"),
+        lines,
+        edit_declaration(lines, "def"),
+        lines,
+        edit_declaration(lines, "class"),
+        lines,
+        edit_declaration(lines, "delete"),
+        lines,
+    ]
+    return run_incremental_versions(versions, compiler)
+
+def run_incremental_versions(versions: [[str]], compiler: Compiler)->bool:
+    checker = IncrementalChecker(compiler)
+    for version in versions:
+        source = "\n".join(version)
+        ast, parseErrors, tcErrors = checker.compile(source)
+        expected, expectedParseErrors, expectedTcErrors = compiler.compile(source)
+        if len(parseErrors) > 0 or tcErrors != expectedTcErrors:
+            return False
+        if json.dumps(ast.toJSON()) != json.dumps(expected.toJSON()):
+            return False
+    return True
+
+def edit_declaration(lines: [str], edit: str) -> [str]:
+    # change the type of the first global variable ("type"), rename the first
+    # top-level function or class ("def", "class"), or delete the first
+    # top-level function or class ("delete"); no change if there is none
+    lines = list(lines)
+    for i, line in enumerate(lines):
+        if edit == "type":
+            m = re.match(r"(\w+) *: *(\w+) *= *(.*)", line)
+            if m is not None:
+                lines[i] = "{}: {} = {}".format(m.group(1), "int" if m.group(2) == "str" else "str", m.group(3))
+                break
+        elif edit in ("def", "class"):
+            if line.startswith(edit + " "):
+                lines[i] = re.sub(r"^(\w+) (\w+)", r"\1 \2_renamed", line)
+                break
+        elif line.startswith("def ") or line.startswith("class "):
+            end = i + 1
+            while end < len(lines) and (lines[end][:1] in ("", " ", "\t")):
+                end += 1
+            return lines[:i] + lines[end:]
+    return lines
+
 def ast_equals(d1, d2)->bool:
     # precondition: the input dict must represent a well-formed AST
     if isinstance(d1, dict) and isinstance(d2, dict):